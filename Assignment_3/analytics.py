@@ -0,0 +1,257 @@
+"""
+Analytics module - sales reporting over a columnar ledger of order lines
+Each order line is one row across NumPy arrays (order, product, quantity, unit price
+in cents, time, status), so revenue, units, top sellers and time-bucketed sales are
+answered with vectorized masks and bincounts instead of walking every order object
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from order import ORDER_STATUSES
+
+EPOCH = datetime(1970, 1, 1)  # Order dates are naive local times, so buckets stay in local time
+INTERVALS = ("hour", "day", "week", "month")
+COUNTED_STATUSES = tuple(status for status in ORDER_STATUSES if status != "Cancelled")
+SYNC_BATCH = 1000
+LATE_ORDER_SECONDS = 300  # How long an order ID skipped by sync is rechecked before it is taken as never saved
+
+# Column name -> dtype; every column has one entry per order line
+COLUMNS = {
+    "order_id": np.int64,
+    "product_id": np.int64,
+    "quantity": np.int64,
+    "unit_cents": np.int64,
+    "line_cents": np.int64,
+    "timestamp": np.int64,  # Seconds since EPOCH
+    "status": np.int8,  # Index into ORDER_STATUSES
+    "first_line": np.bool_,  # True on the first line of each order, for counting orders
+}
+
+
+def timestamp_of(moment: datetime) -> int:
+    return int((moment - EPOCH).total_seconds())
+
+
+def cents_to_amount(cents) -> float:
+    return int(round(cents)) / 100
+
+
+class SalesLedger:
+    """Append-only columns of order lines; an order's status is updated in place"""
+    
+    def __init__(self, refresh_seconds: Optional[float] = None, capacity: int = 1024):
+        self.refresh_seconds = refresh_seconds  # Rebuild from storage this often (None: never)
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(capacity, dtype)
+                                               for name, dtype in COLUMNS.items()}
+        self.size = 0
+        self.order_rows: Dict[int, Tuple[int, int]] = {}  # order_id -> (first row, end row)
+        self.last_order_id = 0
+        # Order IDs are taken before payment, so one can be saved after a higher one was synced;
+        # IDs skipped by sync -> when they were first missed
+        self.missing_order_ids: Dict[int, float] = {}
+        self.last_rebuild = time.monotonic()
+    
+    def _grow(self, needed: int):
+        capacity = len(self.columns["order_id"])
+        if self.size + needed <= capacity:
+            return
+        while capacity < self.size + needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+    
+    def record_order(self, order):
+        """Add a new order's lines, or update the status of one already recorded"""
+        self.record_orders((order,))
+    
+    def record_orders(self, orders):
+        """Record a batch of orders, writing the new ones' lines with one assignment per column"""
+        new_orders = []
+        for order in orders:
+            rows = self.order_rows.get(order.order_id)
+            if rows is None:
+                new_orders.append(order)
+            else:
+                self.columns["status"][rows[0]:rows[1]] = ORDER_STATUSES.index(order.status)
+        if not new_orders:
+            return
+        
+        lines = {name: [] for name in COLUMNS}
+        row = self.size
+        now = time.monotonic()
+        for order in new_orders:
+            count = len(order.items)
+            self.order_rows[order.order_id] = (row, row + count)
+            row += count
+            lines["order_id"] += [order.order_id] * count
+            lines["timestamp"] += [timestamp_of(order.order_date)] * count
+            lines["status"] += [ORDER_STATUSES.index(order.status)] * count
+            lines["first_line"] += [True] + [False] * (count - 1) if count else []
+            for item in order.items:
+                lines["product_id"].append(item.product_id)
+                lines["quantity"].append(item.quantity)
+                lines["unit_cents"].append(item.unit_price.cents)
+            if order.order_id > self.last_order_id:
+                self.missing_order_ids.update(dict.fromkeys(range(self.last_order_id + 1, order.order_id), now))
+                self.last_order_id = order.order_id
+            else:
+                self.missing_order_ids.pop(order.order_id, None)
+        
+        start = self.size
+        self._grow(row - start)
+        columns = self.columns
+        for name in COLUMNS:
+            if name != "line_cents":
+                columns[name][start:row] = lines[name]
+        columns["line_cents"][start:row] = columns["unit_cents"][start:row] * columns["quantity"][start:row]
+        self.size = row
+    
+    def sync(self, storage):
+        """Catch up on orders written by other workers; rebuild now and then to pick up their status changes"""
+        if self.refresh_seconds is not None and time.monotonic() - self.last_rebuild > self.refresh_seconds:
+            self.size = 0
+            self.order_rows = {}
+            self.last_order_id = 0
+            self.missing_order_ids = {}
+            self.last_rebuild = time.monotonic()
+        self._sync_late_orders(storage)
+        while True:
+            orders = storage.get_orders_after(self.last_order_id, SYNC_BATCH)
+            self.record_orders(orders)
+            if len(orders) < SYNC_BATCH:
+                return
+    
+    def _sync_late_orders(self, storage):
+        """Record skipped orders that have been saved since, and stop looking for ones missing too long"""
+        now = time.monotonic()
+        for order_id, missed in list(self.missing_order_ids.items()):
+            if now - missed > LATE_ORDER_SECONDS:
+                del self.missing_order_ids[order_id]
+        late = [storage.get_order(order_id) for order_id in self.missing_order_ids]
+        self.record_orders([order for order in late if order is not None])
+    
+    def _view(self, name: str) -> np.ndarray:
+        return self.columns[name][:self.size]
+    
+    def _select(self, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                product_id: Optional[int] = None, statuses=COUNTED_STATUSES) -> np.ndarray:
+        """Boolean mask of the lines matching the filters"""
+        status_codes = [ORDER_STATUSES.index(status) for status in statuses]
+        mask = np.isin(self._view("status"), status_codes)
+        timestamps = self._view("timestamp")
+        if date_from is not None:
+            mask &= timestamps >= timestamp_of(date_from)
+        if date_to is not None:
+            mask &= timestamps <= timestamp_of(date_to)
+        if product_id is not None:
+            mask &= self._view("product_id") == product_id
+        return mask
+    
+    def summary(self, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> dict:
+        """Revenue, units and order count for the period"""
+        mask = self._select(date_from, date_to)
+        orders = int(np.count_nonzero(self._view("first_line")[mask]))
+        revenue = int(self._view("line_cents")[mask].sum())
+        return {
+            "revenue": cents_to_amount(revenue),
+            "units": int(self._view("quantity")[mask].sum()),
+            "orders": orders,
+            "average_order_value": cents_to_amount(revenue / orders) if orders else 0.0,
+        }
+    
+    def product_totals(self, date_from: Optional[datetime] = None,
+                       date_to: Optional[datetime] = None) -> List[dict]:
+        """Revenue and units per product, highest revenue first"""
+        mask = self._select(date_from, date_to)
+        product_ids = self._view("product_id")[mask]
+        if not len(product_ids):
+            return []
+        revenue = np.bincount(product_ids, weights=self._view("line_cents")[mask])
+        units = np.bincount(product_ids, weights=self._view("quantity")[mask])
+        sold = np.flatnonzero(units)
+        ranked = sold[np.lexsort((sold, -revenue[sold]))]
+        return [{"product_id": int(product_id), "revenue": cents_to_amount(revenue[product_id]),
+                 "units": int(units[product_id])} for product_id in ranked]
+    
+    def top_sellers(self, limit: int = 10, by: str = "revenue", date_from: Optional[datetime] = None,
+                    date_to: Optional[datetime] = None) -> List[dict]:
+        """The products with the most revenue or units sold"""
+        totals = self.product_totals(date_from, date_to)
+        if by == "units":
+            totals.sort(key=lambda row: row["units"], reverse=True)
+        return totals[:limit]
+    
+    def _periods(self, timestamps: np.ndarray, interval: str) -> np.ndarray:
+        """Number each line's hour, day, week (from Monday) or month since EPOCH"""
+        if interval == "hour":
+            return timestamps // 3600
+        days = timestamps // 86400
+        if interval == "day":
+            return days
+        if interval == "week":
+            return (days + 3) // 7  # EPOCH was a Thursday
+        return timestamps.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    
+    def _period_label(self, period: int, interval: str) -> str:
+        if interval == "hour":
+            return (EPOCH + timedelta(hours=period)).strftime("%Y-%m-%d %H:00")
+        if interval == "day":
+            return (EPOCH + timedelta(days=period)).strftime("%Y-%m-%d")
+        if interval == "week":
+            return (EPOCH + timedelta(days=period * 7 - 3)).strftime("%Y-%m-%d")
+        return str(np.datetime64(period, "M"))
+    
+    def sales_over_time(self, interval: str = "day", date_from: Optional[datetime] = None,
+                        date_to: Optional[datetime] = None, product_id: Optional[int] = None,
+                        by_product: bool = False) -> List[dict]:
+        """Revenue, units and orders per period, optionally broken down by product"""
+        mask = self._select(date_from, date_to, product_id)
+        periods = self._periods(self._view("timestamp")[mask], interval)
+        if not len(periods):
+            return []
+        # Periods are consecutive integers, so they index the bincounts directly
+        first = int(periods.min())
+        index = periods - first
+        line_cents = self._view("line_cents")[mask]
+        quantities = self._view("quantity")[mask]
+        revenue = np.bincount(index, weights=line_cents)
+        units = np.bincount(index, weights=quantities)
+        # A product appears once per order, so with a product filter every line is an order
+        counted = self._view("first_line")[mask] if product_id is None else None
+        orders = np.bincount(index, weights=counted)
+        
+        rows = {}
+        for position in np.flatnonzero(units).tolist():
+            rows[position] = {"period": self._period_label(first + int(position), interval),
+                              "revenue": cents_to_amount(revenue[position]),
+                              "units": int(units[position]),
+                              "orders": int(orders[position])}
+        
+        if by_product:
+            product_ids = self._view("product_id")[mask]
+            width = int(product_ids.max()) + 1
+            cells, cell_index = np.unique(index * width + product_ids, return_inverse=True)
+            cell_revenue = np.bincount(cell_index, weights=line_cents)
+            cell_units = np.bincount(cell_index, weights=quantities)
+            for row in rows.values():
+                row["products"] = []
+            for cell, cell_cents, cell_quantity in zip(cells.tolist(), cell_revenue, cell_units):
+                position, cell_product = divmod(cell, width)
+                rows[position]["products"].append({"product_id": cell_product,
+                                                   "revenue": cents_to_amount(cell_cents),
+                                                   "units": int(cell_quantity)})
+        return list(rows.values())
+
+
+def create_sales_ledger() -> SalesLedger:
+    """Shared SQLite workers rebuild their ledger every ANALYTICS_REFRESH_SECONDS"""
+    if os.environ.get("STORE_BACKEND", "memory") == "sqlite":
+        return SalesLedger(refresh_seconds=float(os.environ.get("ANALYTICS_REFRESH_SECONDS", "60")))
+    return SalesLedger()
@@ -0,0 +1,159 @@
+"""
+Assets module - fingerprinted, precompressed static files
+At startup every file under static/ is hashed into a fingerprinted URL such as
+/static/app.1a2b3c4d5e.js, which browsers may cache for good; text files are gzip
+(and, if the brotli package is installed, brotli) compressed once and kept in memory,
+and index.html is rewritten to the fingerprinted URLs and served from memory
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+
+from fastapi.responses import FileResponse, Response
+
+from catalog import etag_matches
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are built
+    brotli = None
+
+COMPRESSIBLE = {".js", ".css", ".html", ".svg", ".json", ".txt"}
+IMMUTABLE = "public, max-age=31536000, immutable"  # A fingerprinted URL never changes content
+REVALIDATE = "no-cache"  # Plain URLs can, so browsers check the ETag each time
+HASH_LENGTH = 10
+STATIC_URL = re.compile(r"(?<=[\"'(])/static/[^\"'()?#\s]+")  # Quoted or url(...) references in text files
+
+
+def compressed_variants(body: bytes) -> Dict[str, bytes]:
+    """Encoding -> compressed body, keeping only the encodings that make it smaller"""
+    variants = {"gzip": gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+
+def preferred_encoding(accept_encoding: Optional[str], variants: Dict[str, bytes]) -> Optional[str]:
+    """The best variant an Accept-Encoding header allows: brotli, then gzip, else None for the plain body"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, parameters = part.partition(";")
+        parameters = parameters.strip().replace(" ", "")
+        try:
+            if parameters.startswith("q=") and float(parameters[2:]) == 0:
+                continue  # q=0 means "not this one"
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+class Asset:
+    """One static file with its fingerprinted URL and, for text, its body and compressed variants"""
+    
+    __slots__ = ("path", "url", "media_type", "etag", "body", "variants")
+    
+    def __init__(self, path: str, url: str, digest: str, body: Optional[bytes]):
+        self.path = path  # On disk
+        self.url = url
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.etag = f'W/"{digest}"'  # Weak, since the same tag covers every encoding
+        self.body = body  # None for binary files, which are streamed from disk
+        self.variants = compressed_variants(body) if body is not None else {}
+
+
+class AssetStore:
+    """Static files by plain and fingerprinted path, built once at startup"""
+    
+    def __init__(self, directory: str = "static", prefix: str = "/static"):
+        self.directory = os.path.abspath(directory)
+        self.prefix = prefix
+        self.assets: Dict[str, Asset] = {}  # Path relative to the directory -> asset
+        self.fingerprinted: Dict[str, Asset] = {}  # Fingerprinted relative path -> asset
+        self.index: Optional[Asset] = None  # index.html with fingerprinted references, served at /
+        self.build()
+    
+    def build(self):
+        """Hash, rewrite and compress every file under the directory"""
+        paths = []
+        for root, directories, files in os.walk(self.directory):
+            paths += [os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/")
+                      for name in files]
+        # Binary files first, then text that may refer to them, then pages that may refer to both
+        paths.sort(key=lambda path: (os.path.splitext(path)[1] in COMPRESSIBLE, path.endswith(".html")))
+        for path in paths:
+            self._add(path)
+        index_path = os.path.join(self.directory, "index.html")
+        if os.path.isfile(index_path):
+            with open(index_path, encoding="utf-8") as file:
+                body = self.rewrite(file.read()).encode("utf-8")
+            self.index = Asset(index_path, "/", hashlib.sha256(body).hexdigest()[:HASH_LENGTH], body)
+    
+    def _add(self, path: str):
+        full_path = os.path.join(self.directory, path)
+        with open(full_path, "rb") as file:
+            body = file.read()
+        stem, extension = os.path.splitext(path)
+        if extension in COMPRESSIBLE:
+            # Fingerprints of the files it refers to change its own fingerprint too
+            body = self.rewrite(body.decode("utf-8")).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+        fingerprinted = f"{stem}.{digest}{extension}"
+        asset = Asset(full_path, f"{self.prefix}/{fingerprinted}", digest,
+                      body if extension in COMPRESSIBLE else None)
+        self.assets[path] = asset
+        self.fingerprinted[fingerprinted] = asset
+    
+    def url(self, url: str) -> str:
+        """Fingerprinted URL for a plain /static/... URL, or the URL unchanged if it is not a known file"""
+        asset = self.assets.get(url[len(self.prefix) + 1:]) if url.startswith(self.prefix + "/") else None
+        return asset.url if asset is not None else url
+    
+    def rewrite(self, text: str) -> str:
+        """Point every quoted /static/... reference in text at its fingerprinted URL"""
+        return STATIC_URL.sub(lambda match: self.url(match.group(0)), text)
+    
+    def _respond(self, asset: Asset, cache_control: str, accept_encoding: Optional[str],
+                 if_none_match: Optional[str]) -> Response:
+        headers = {"ETag": asset.etag, "Cache-Control": cache_control}
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(asset.etag, if_none_match):
+            return Response(status_code=304, headers=headers)
+        if asset.body is None:
+            return FileResponse(asset.path, media_type=asset.media_type, headers=headers)
+        body = asset.body
+        encoding = preferred_encoding(accept_encoding, asset.variants)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            body = asset.variants[encoding]
+        return Response(body, media_type=asset.media_type, headers=headers)
+    
+    def response(self, path: str, accept_encoding: Optional[str] = None,
+                 if_none_match: Optional[str] = None) -> Optional[Response]:
+        """Serve a path under the prefix, fingerprinted or plain; None if there is no such file"""
+        asset = self.fingerprinted.get(path)
+        if asset is not None:
+            return self._respond(asset, IMMUTABLE, accept_encoding, if_none_match)
+        asset = self.assets.get(path)
+        if asset is not None:
+            return self._respond(asset, REVALIDATE, accept_encoding, if_none_match)
+        # Files added since startup are served from disk as they are
+        full_path = os.path.abspath(os.path.join(self.directory, path))
+        if os.path.commonpath([full_path, self.directory]) == self.directory and os.path.isfile(full_path):
+            return FileResponse(full_path, headers={"Cache-Control": REVALIDATE})
+        return None
+    
+    def index_response(self, accept_encoding: Optional[str] = None,
+                       if_none_match: Optional[str] = None) -> Optional[Response]:
+        """Serve index.html from memory (revalidated, so a restart with new assets is picked up)"""
+        if self.index is None:
+            return None
+        return self._respond(self.index, REVALIDATE, accept_encoding, if_none_match)
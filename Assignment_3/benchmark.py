@@ -0,0 +1,1049 @@
+"""
+Benchmark module - command line benchmarks for the store backend
+Usage: python benchmark.py storage [--checkouts N] [--items N]
+       python benchmark.py stress [--checkouts N] [--threads N] [--stock N] [--backend memory|sqlite|journal]
+       python benchmark.py gateway [--charges N] [--clients N] [--latency-ms N] [--failure-rate F]
+       python benchmark.py cart [--lines N]
+       python benchmark.py memory [--orders N] [--items N]
+       python benchmark.py reports [--orders N] [--items N]
+       python benchmark.py low-stock [--products N] [--updates N]
+       python benchmark.py search [--products N] [--queries N] [--words N]
+       python benchmark.py recovery [--orders N] [--items N] [--tail N]
+       python benchmark.py commit [--checkouts N] [--threads N]
+       python benchmark.py api [--target inprocess|uvicorn] [--users N] [--duration S]
+                               [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from money import Money
+from product import Product
+from user import Customer
+from order import Order
+from order_item import LineItem, OrderItem
+from payment import Payment, DigitalWallet
+from shopping_cart import ShoppingCart
+from invoice import Invoice
+from receipt import Receipt
+from storage import Storage, InMemoryStorage, SQLiteStorage, InsufficientStockError
+from payment_gateway import PaymentGateway, SimulatedGateway, GatewayUnavailable
+from analytics import SalesLedger
+from inventory import InMemoryStockIndex, SQLiteStockIndex
+from search import SearchIndex, tokenize
+from journal import JournaledStorage
+from group_commit import GroupCommitter
+
+
+def seed_storage(storage: Storage, product_count: int = 50, customer_count: int = 20):
+    """Fill an empty backend with products and customers to check out against"""
+    for product_id in range(1, product_count + 1):
+        storage.add_product(Product(product_id, f"BENCH{product_id:03d}", f"Product {product_id}",
+                                    1.99, "Benchmark product", 10 ** 9))
+    for user_id in range(1, customer_count + 1):
+        storage.add_user(Customer(user_id, f"bench{user_id}@example.com", "password"))
+
+
+def run_checkout(storage: Storage, customer_id: int, product_ids: list):
+    """Perform the reads and writes of a single /api/checkout call"""
+    storage.reserve_stock({product_id: 1 for product_id in product_ids})
+    items = [LineItem.of(storage.get_product(product_id), 1) for product_id in product_ids]
+    
+    order = Order(customer_id, items, order_id=storage.next_id("order"))
+    storage.add_order(order)
+    
+    invoice = Invoice(order.order_id, "Benchmark", order.items,
+                      order.total, invoice_number=storage.next_id("invoice"))
+    storage.add_invoice(invoice)
+    
+    payment = Payment(order.order_id, order.total, DigitalWallet("Bench"),
+                      payment_id=storage.next_id("payment"))
+    payment.process()
+    invoice.status = "Paid"
+    storage.update_invoice(invoice)
+    payment.generate_receipt("Benchmark", items=order.items, receipt_number=storage.next_id("receipt"))
+    storage.add_payment(payment)
+
+
+def benchmark_storage(storage: Storage, checkouts: int, items_per_order: int) -> dict:
+    """Time a checkout-heavy mix against one backend"""
+    seed_storage(storage)
+    rng = random.Random(42)
+    product_ids = [product.product_id for product in storage.get_all_products()]
+    
+    start = time.perf_counter()
+    for i in range(checkouts):
+        customer_id = rng.randint(1, 20)
+        run_checkout(storage, customer_id, rng.sample(product_ids, items_per_order))
+        # Every few checkouts a customer looks at their order history and a receipt
+        if i % 5 == 0:
+            orders = storage.get_orders_by_customer(customer_id)
+            storage.get_payment_by_order(orders[-1].order_id)
+    checkout_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for customer_id in range(1, 21):
+        storage.get_orders_by_customer(customer_id)
+    history_seconds = time.perf_counter() - start
+    
+    return {
+        "checkouts": checkouts,
+        "checkout_seconds": round(checkout_seconds, 4),
+        "checkouts_per_second": round(checkouts / checkout_seconds, 1),
+        "order_history_ms": round(history_seconds * 1000 / 20, 3),
+    }
+
+
+def storage_command(args):
+    """Compare the in-memory and SQLite backends"""
+    results = {"memory": benchmark_storage(InMemoryStorage(), args.checkouts, args.items)}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, "bench.db"))
+        try:
+            results["sqlite"] = benchmark_storage(storage, args.checkouts, args.items)
+        finally:
+            storage.close()
+    
+    print(f"{'backend':<10}{'checkouts/s':>14}{'history ms':>14}")
+    for backend, result in results.items():
+        print(f"{backend:<10}{result['checkouts_per_second']:>14}{result['order_history_ms']:>14}")
+    return results
+
+
+def stress_storage(get_storage, checkouts: int, threads: int, stock: int) -> dict:
+    """Fire concurrent all-or-nothing reservations at one low-stock product"""
+    seed = get_storage()
+    seed.add_product(Product(1, "LOW001", "Low stock item", 1.00, "", stock))
+    seed.add_product(Product(2, "HIGH001", "Plenty in stock", 1.00, "", 10 ** 9))
+    
+    sold = [0]
+    rejected = [0]
+    restocked = [0]  # Reservations of a zero or negative quantity that were let through
+    counter_lock = threading.Lock()
+    
+    def checkout(i):
+        storage = get_storage()
+        rng = random.Random(i)
+        # One reservation in ten asks for a quantity that would give stock back instead of taking it
+        quantities = {1: rng.randint(1, 3) if i % 10 else -rng.randint(0, 5), 2: 1}
+        try:
+            storage.reserve_stock(quantities)
+        except ValueError:
+            return
+        except InsufficientStockError:
+            with counter_lock:
+                rejected[0] += 1
+            return
+        # One checkout in ten has its payment declined and hands the stock back
+        if rng.random() < 0.1:
+            storage.release_stock(quantities)
+            return
+        with counter_lock:
+            sold[0] += quantities[1]
+            restocked[0] += quantities[1] <= 0
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(checkout, range(checkouts)))
+    seconds = time.perf_counter() - start
+    
+    remaining = seed.get_product(1).stock
+    return {
+        "checkouts": checkouts,
+        "sold": sold[0],
+        "rejected": rejected[0],
+        "remaining": remaining,
+        "oversold": sold[0] > stock or remaining < 0 or remaining != stock - sold[0] or restocked[0] > 0,
+        "checkouts_per_second": round(checkouts / seconds, 1),
+    }
+
+
+def stress_command(args):
+    """Prove concurrent checkouts never oversell on either backend"""
+    memory = InMemoryStorage()
+    results = {"memory": stress_storage(lambda: memory, args.checkouts, args.threads, args.stock)}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stress.db")
+        # One connection per thread, like separate uvicorn workers sharing the file
+        local = threading.local()
+        connections = []
+        
+        def get_storage():
+            if not hasattr(local, "storage"):
+                local.storage = SQLiteStorage(path)
+                connections.append(local.storage)
+            return local.storage
+        
+        try:
+            results["sqlite"] = stress_storage(get_storage, args.checkouts, args.threads, args.stock)
+        finally:
+            for storage in connections:
+                storage.close()
+    
+    # The same check through /api/checkout, so cart, payment, release and saving are all exercised
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        print("Skipping the checkout stress, which needs httpx: pip install httpx")
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ["STORE_BACKEND"] = args.backend
+            os.environ["STORE_DB_PATH"] = os.path.join(directory, "stress-api.db")
+            os.environ["STORE_JOURNAL_DIR"] = os.path.join(directory, "journal")
+            os.environ["PAYMENT_GATEWAY_DECLINE_RATE"] = "0.1"
+            results[f"{args.backend} api"] = asyncio.run(stress_checkouts(args.checkouts, args.threads, args.stock))
+    
+    print(f"{'backend':<12}{'sold':>8}{'rejected':>10}{'remaining':>11}{'oversold':>10}")
+    for backend, result in results.items():
+        print(f"{backend:<12}{result['sold']:>8}{result['rejected']:>10}"
+              f"{result['remaining']:>11}{str(result['oversold']):>10}")
+    if any(result["oversold"] for result in results.values()):
+        sys.exit(1)
+    return results
+
+
+async def stress_checkouts(checkouts: int, customers: int, stock: int) -> dict:
+    """Concurrent customers check out a low-stock product through the API; one payment in ten is declined"""
+    import httpx
+    import main as store
+    
+    prepare_store(store.db, customers)
+    product_id = max(product.product_id for product in store.db.get_all_products()) + 1
+    store.db.add_product(Product(product_id, "LOW001", "Low stock item", 1.00, "", stock))
+    # Every second commit sync fails after its writes were saved, as a failing disk would
+    syncs = [0]
+    sync = store.db.sync
+    
+    def failing_sync():
+        sync()
+        syncs[0] += 1
+        if syncs[0] % 2 == 0:
+            raise OSError("Simulated fsync failure")
+    
+    store.db.sync = failing_sync
+    sold = [0]
+    rejected = [0]
+    restocked = [0]  # Checkouts of a zero or negative quantity that were let through
+    
+    async def customer(client, user: int):
+        rng = random.Random(user)
+        response = await client.post("/api/login", data={"email": f"bench{user}@example.com",
+                                                         "password": BENCH_PASSWORD})
+        session = {"session_id": response.json()["session_id"]}
+        for attempt in range(user, checkouts, customers):
+            # One attempt in ten asks for a quantity that would give stock back instead of taking it
+            quantity = rng.randint(1, 3) if attempt % 10 else -rng.randint(0, 5)
+            response = await client.post("/api/cart/add", params=session,
+                                         data={"product_id": product_id, "quantity": quantity})
+            if response.status_code == 200:
+                response = await client.post("/api/checkout", params=session,
+                                             data={"payment_method": "wallet", "payment_details": "Stress"})
+                if response.status_code == 200:
+                    if quantity <= 0:
+                        restocked[0] += 1
+                    sold[0] += quantity
+                    continue
+                await client.delete(f"/api/cart/remove/{product_id}", params=session)
+            rejected[0] += 1
+    
+    start = time.perf_counter()
+    transport = httpx.ASGITransport(app=store.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://store", timeout=60) as client:
+        await asyncio.gather(*[customer(client, user) for user in range(customers)])
+    seconds = time.perf_counter() - start
+    
+    remaining = store.db.get_product(product_id).stock
+    # What the stored orders say was sold must agree with the stock and with what customers were told
+    ordered = sum(item.quantity for order in store.db.get_all_orders() if order.status != "Cancelled"
+                  for item in order.items if item.product_id == product_id)
+    store.commits.close()
+    store.db.close()
+    return {
+        "checkouts": checkouts,
+        "sold": sold[0],
+        "rejected": rejected[0],
+        "remaining": remaining,
+        "oversold": (sold[0] > stock or remaining < 0 or remaining != stock - sold[0] or ordered != sold[0]
+                     or restocked[0] > 0),
+        "checkouts_per_second": round(checkouts / seconds, 1),
+    }
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def benchmark_gateway(gateway: PaymentGateway, charges: int, clients: int) -> dict:
+    """Send charges from a number of concurrent clients through one gateway client"""
+    latencies = []
+    outcomes = {"approved": 0, "declined": 0, "unavailable": 0}
+    pending = iter(range(charges))
+    
+    async def client():
+        for i in pending:
+            start = time.perf_counter()
+            try:
+                approved = await gateway.charge("bench", Money(999), f"bench-{i}")
+                outcomes["approved" if approved else "declined"] += 1
+            except GatewayUnavailable:
+                outcomes["unavailable"] += 1
+            latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    seconds = time.perf_counter() - start
+    
+    return {
+        "charges": charges,
+        "charges_per_second": round(charges / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        **outcomes,
+        "retries": gateway.stats["retries"],
+        "connections_opened": gateway.gateway.connections_opened,
+    }
+
+
+def gateway_command(args):
+    """Measure checkout payment throughput against a slow, flaky provider"""
+    latency = args.latency_ms / 1000
+    
+    def make_gateway(concurrency):
+        provider = SimulatedGateway(latency=latency, jitter=latency / 4,
+                                    failure_rate=args.failure_rate, seed=42)
+        return PaymentGateway("bench", provider, max_concurrency=concurrency,
+                              timeout=max(1.0, latency * 5), retries=2, queue_timeout=60)
+    
+    results = {
+        "one at a time": asyncio.run(benchmark_gateway(make_gateway(1), args.charges, args.clients)),
+        f"pool of {args.concurrency}": asyncio.run(
+            benchmark_gateway(make_gateway(args.concurrency), args.charges, args.clients)),
+    }
+    
+    print(f"{'gateway':<16}{'charges/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'retries':>9}{'unavail':>9}{'conns':>7}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['charges_per_second']:>11}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+              f"{result['p99_ms']:>9}{result['retries']:>9}{result['unavailable']:>9}"
+              f"{result['connections_opened']:>7}")
+    return results
+
+
+def cart_command(args):
+    """Time the cart operations behind /api/cart for a bulk cart with many lines"""
+    products = {product_id: Product(product_id, f"BULK{product_id:04d}", f"Bulk item {product_id}",
+                                    1.25 + product_id % 7, "", 10 ** 9)
+                for product_id in range(1, args.lines + 1)}
+    cart = ShoppingCart(1)
+    timings = {}
+    
+    start = time.perf_counter()
+    for product in products.values():
+        cart.add_item(product, 2)
+    timings["add each line"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for product_id in products:
+        cart.update_item_quantity(product_id, 3)
+    timings["update each line"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for _ in range(1000):
+        cart.get_total()
+        cart.get_item_count()
+    timings["1000 total/count reads"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    cart.set_quantities({product_id: 5 for product_id in products}, {})
+    timings["set_quantities (all lines)"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    cart.get_items()
+    timings["get_items"] = time.perf_counter() - start
+    
+    print(f"{args.lines} lines, total ${cart.get_total():.2f}, {cart.get_item_count()} units")
+    for name, seconds in timings.items():
+        print(f"{name:<30}{seconds * 1000:>10.3f} ms")
+    return timings
+
+
+def without_slots(cls):
+    """A dict-backed twin of a slotted model, laid out as the models were before they had __slots__"""
+    namespace = {name: value for name, value in vars(cls).items()
+                 if name not in cls.__slots__ and name not in ("__slots__", "__dict__", "__weakref__")}
+    return type(f"Dict{cls.__name__}", cls.__bases__, namespace)
+
+
+DictOrder, DictOrderItem, DictInvoice, DictPayment, DictReceipt, DictWallet = map(
+    without_slots, (Order, OrderItem, Invoice, Payment, Receipt, DigitalWallet))
+
+
+def run_dict_checkout(storage: Storage, customer_id: int, product_ids: list):
+    """run_checkout with the earlier models: dict-backed objects, and item dicts copied into invoice and receipt"""
+    storage.reserve_stock({product_id: 1 for product_id in product_ids})
+    items = [DictOrderItem(storage.get_product(product_id), 1) for product_id in product_ids]
+    order = DictOrder(customer_id, items, order_id=storage.next_id("order"))
+    storage.add_order(order)
+    
+    invoice = DictInvoice(order.order_id, "Benchmark", [item.get_details() for item in items],
+                          order.total, invoice_number=storage.next_id("invoice"))
+    storage.add_invoice(invoice)
+    
+    payment = DictPayment(order.order_id, order.total, DictWallet("Bench"), payment_id=storage.next_id("payment"))
+    payment.process()
+    invoice.status = "Paid"
+    storage.update_invoice(invoice)
+    payment.receipt = DictReceipt(payment.payment_id, order.order_id, "Benchmark", payment.amount,
+                                  payment.payment_method.get_method_name(),
+                                  items=[item.get_details() for item in items],
+                                  receipt_number=storage.next_id("receipt"))
+    storage.add_payment(payment)
+
+
+def measure_history(checkout, orders: int, items: int):
+    """Bytes per order an in-memory history grows by, with the five files that allocated most"""
+    storage = InMemoryStorage()
+    seed_storage(storage)
+    rng = random.Random(42)
+    product_ids = [product.product_id for product in storage.get_all_products()]
+    
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(orders):
+        checkout(storage, rng.randint(1, 20), rng.sample(product_ids, items))
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    
+    # Order, invoice, payment and receipt plus the storage indexes that hold them
+    stats = after.compare_to(before, "filename")
+    top = [(os.path.basename(stat.traceback[0].filename), stat.size_diff / orders)
+           for stat in stats[:5] if stat.size_diff > 0]
+    return sum(stat.size_diff for stat in stats) / orders, top
+
+
+def memory_command(args):
+    """Measure the memory an in-memory order history takes per order, with dict-backed models and slotted ones"""
+    results = {}
+    for name, checkout in (("dict models", run_dict_checkout), ("slotted models", run_checkout)):
+        per_order, top = measure_history(checkout, args.orders, args.items)
+        results[name] = round(per_order)
+        print(f"{name}: {per_order:.0f} bytes per order")
+        for filename, size in top:
+            print(f"  {filename:<24}{size:>10.0f} bytes per order")
+    
+    before, after = results["dict models"], results["slotted models"]
+    print(f"{args.orders} orders of {args.items} lines: {before} bytes per order before, {after} after, "
+          f"{before - after} ({(before - after) / before:.0%}) saved")
+    return {"orders": args.orders, "bytes_per_order_before": before, "bytes_per_order_after": after,
+            "bytes_saved_per_order": before - after}
+
+
+def reports_command(args):
+    """Compare revenue by product per day from a loop over orders with the columnar ledger"""
+    storage = InMemoryStorage()
+    seed_storage(storage)
+    rng = random.Random(42)
+    products = storage.get_all_products()
+    start_date = datetime.now() - timedelta(days=90)
+    for order_id in range(1, args.orders + 1):
+        items = [LineItem.of(product, rng.randint(1, 3)) for product in rng.sample(products, args.items)]
+        order = Order(rng.randint(1, 20), items, order_id=order_id)
+        order.order_date = start_date + timedelta(seconds=rng.randrange(90 * 86400))
+        if rng.random() < 0.05:
+            order.status = "Cancelled"
+        storage.add_order(order)
+    
+    start = time.perf_counter()
+    totals = {}
+    for order in storage.get_all_orders():
+        if order.status == "Cancelled":
+            continue
+        day = order.order_date.date()
+        for item in order.items:
+            key = (item.product_id, day)
+            totals[key] = totals.get(key, 0) + item.get_line_total().cents
+    loop_seconds = time.perf_counter() - start
+    
+    ledger = SalesLedger()
+    start = time.perf_counter()
+    ledger.sync(storage)
+    load_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    periods = ledger.sales_over_time("day", by_product=True)
+    ledger_seconds = time.perf_counter() - start
+    cells = sum(len(period["products"]) for period in periods)
+    
+    start = time.perf_counter()
+    ledger.summary()
+    ledger.top_sellers(10)
+    ledger.sales_over_time("day")
+    others_seconds = time.perf_counter() - start
+    
+    print(f"{args.orders} orders, {len(totals)} product-days ({cells} from the ledger)")
+    print(f"{'python loop over orders':<36}{loop_seconds * 1000:>10.1f} ms")
+    print(f"{'ledger load from storage':<36}{load_seconds * 1000:>10.1f} ms")
+    print(f"{'ledger, per product per day':<36}{ledger_seconds * 1000:>10.1f} ms")
+    print(f"{'ledger, summary+top+daily':<36}{others_seconds * 1000:>10.1f} ms")
+    return {"loop_ms": loop_seconds * 1000, "ledger_ms": ledger_seconds * 1000}
+
+
+def low_stock_command(args):
+    """Time stock updates and low-stock listings on a large catalog, against scanning every product"""
+    rng = random.Random(42)
+    products = [Product(product_id, f"SKU{product_id:06d}", f"Item {product_id}", 1.5, "", rng.randint(0, 500))
+                for product_id in range(1, args.products + 1)]
+    updates = [(rng.randint(1, args.products), rng.randint(0, 60)) for _ in range(args.updates)]
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_storage = SQLiteStorage(os.path.join(directory, "store.db"))
+        for product in products:
+            sqlite_storage.add_product(product)
+        indexes = {"memory": InMemoryStockIndex(), "sqlite": SQLiteStockIndex(os.path.join(directory, "store.db"))}
+        indexes["memory"].build(products)
+        
+        stock = {product.product_id: product.stock for product in products}
+        for name, index in indexes.items():
+            start = time.perf_counter()
+            for product_id, level in updates:
+                if name == "sqlite":
+                    product = sqlite_storage.get_product(product_id)
+                    sqlite_storage.adjust_stock(product, level - product.stock)
+                index.stock_changed({product_id: (stock[product_id], level)})
+                if name == "memory":
+                    stock[product_id] = level
+            update_seconds = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            for _ in range(100):
+                index.low_stock(50)
+                index.count()
+            list_seconds = (time.perf_counter() - start) / 100
+            results[name] = {"update_us": update_seconds / args.updates * 10 ** 6, "list_ms": list_seconds * 1000}
+            print(f"{name + ' index':<22}{results[name]['update_us']:>10.1f} us/update"
+                  f"{results[name]['list_ms']:>10.3f} ms/listing ({index.count()} low)")
+        indexes["sqlite"].close()
+        sqlite_storage.close()
+    
+    start = time.perf_counter()
+    low = sorted((level, product_id) for product_id, level in stock.items() if level <= 10)[:50]
+    scan_seconds = time.perf_counter() - start
+    assert [(product_id, level) for level, product_id in low] == indexes["memory"].low_stock(50)
+    print(f"{'scan all products':<22}{'':>20}{scan_seconds * 1000:>10.3f} ms/listing")
+    results["scan_ms"] = scan_seconds * 1000
+    return results
+
+
+SEARCH_WORDS = ["crispy", "salted", "spicy", "chocolate", "vanilla", "lemon", "iced", "energy", "cola",
+                "instant", "noodles", "chicken", "strawberry", "yogurt", "mango", "green", "tea", "coffee",
+                "sandwich", "cheese", "potato", "chips", "cookie", "almond", "honey", "sparkling", "water",
+                "classic", "mini", "family", "pack", "original", "roasted", "peanut", "caramel", "mint"]
+SEARCH_CATEGORIES = ["SNACK", "DRINK", "CANDY", "FOOD", "DAIRY", "ICE"]
+
+
+def search_command(args):
+    """Time catalog searches on a large generated catalog, against scanning every product"""
+    rng = random.Random(42)
+    
+    def made_up_word(syllables: int) -> str:
+        return "".join(rng.choice("bcdfghklmnprstvz") + rng.choice("aeiou") for _ in range(syllables))
+    
+    # Descriptive words shared across the catalog, plus a unique brand word per product
+    words = SEARCH_WORDS + [made_up_word(4) for _ in range(max(0, args.words - len(SEARCH_WORDS)))]
+    products = []
+    for product_id in range(1, args.products + 1):
+        name = " ".join([made_up_word(3).capitalize()] + rng.sample(words, 3))
+        product = Product(product_id, f"{rng.choice(SEARCH_CATEGORIES)}{product_id:06d}", name,
+                          rng.randint(50, 1500) / 100, " ".join(rng.sample(words, 6)), rng.randint(0, 40))
+        products.append(product)
+    
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.build(products)
+    build_seconds = time.perf_counter() - start
+    
+    queries = {"whole words": [], "typed so far": [], "one typo": []}
+    for _ in range(args.queries):
+        words = rng.sample(SEARCH_WORDS, 2)
+        kind = rng.choice(list(queries))
+        if kind == "typed so far":
+            words[1] = words[1][:3]
+        elif kind == "one typo":
+            position = rng.randrange(len(words[1]))
+            words[1] = words[1][:position] + words[1][position + 1:]
+        queries[kind].append((" ".join(words), rng.choice([None, True]), rng.choice([None] + SEARCH_CATEGORIES)))
+    
+    # A running server has the arrays of the common terms made already; warm them the same way
+    for kind_queries in queries.values():
+        for query, available, category in kind_queries:
+            index.search(query, available=available, category=category)
+    
+    print(f"{args.products} products, {len(index.postings)} terms, index built in {build_seconds:.2f} s")
+    print(f"{'':<24}{'median':>10}{'p95':>10}")
+    results = {}
+    for kind, kind_queries in queries.items():
+        latencies = []
+        for query, available, category in kind_queries:
+            start = time.perf_counter()
+            index.search(query, available=available, category=category)
+            latencies.append(time.perf_counter() - start)
+        results[kind] = percentile(latencies, 0.5) * 1000
+        print(f"{kind:<24}{results[kind]:>8.3f}ms{percentile(latencies, 0.95) * 1000:>8.3f}ms")
+    
+    start = time.perf_counter()
+    for query, available, category in queries["whole words"][:5]:
+        words = tokenize(query)
+        [product for product in products
+         if all(any(term.startswith(word) for term in tokenize(f"{product.name} {product.description} {product.sku}"))
+                for word in words)
+         and (available is None or product.is_available() == available)
+         and (category is None or product.sku.startswith(category))]
+    results["scan"] = (time.perf_counter() - start) / 5 * 1000
+    print(f"{'scan every product':<24}{results['scan']:>8.3f}ms")
+    
+    start = time.perf_counter()
+    for product in products[:1000]:
+        product.name = product.name + " limited"
+        index.update(product)
+    results["update"] = (time.perf_counter() - start) / 1000 * 1000
+    print(f"{'update one product':<24}{results['update']:>8.3f}ms")
+    return results
+
+
+
+def recovery_command(args):
+    """Time a journaled store's startup against history size, replaying everything vs from a snapshot"""
+    rng = random.Random(42)
+    sizes = sorted({max(1, args.orders * step // 4) for step in range(1, 5)})
+    results = []
+    print(f"{'orders':>8}{'records':>10}{'journal MB':>12}{'replay s':>10}{'snapshot MB':>13}"
+          f"{'snapshot s':>12}{'tail recs':>11}")
+    for orders in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            storage = JournaledStorage(directory, snapshot_every=10 ** 12)
+            seed_storage(storage)
+            product_ids = [product.product_id for product in storage.get_all_products()]
+            for _ in range(orders):
+                run_checkout(storage, rng.randint(1, 20), rng.sample(product_ids, args.items))
+            records = storage.sequence
+            storage.close()
+            journal_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            
+            # A store that never took a snapshot replays its whole history
+            start = time.perf_counter()
+            storage = JournaledStorage(directory, snapshot_every=10 ** 12)
+            replay_seconds = time.perf_counter() - start
+            assert storage.sequence == records
+            
+            storage.snapshot()
+            for _ in range(args.tail):
+                run_checkout(storage, rng.randint(1, 20), rng.sample(product_ids, args.items))
+            storage.close()
+            snapshot_bytes = sum(os.path.getsize(os.path.join(directory, name))
+                                 for name in os.listdir(directory) if name.startswith("snapshot"))
+            
+            # After a snapshot only the checkouts journaled since are replayed
+            start = time.perf_counter()
+            storage = JournaledStorage(directory, snapshot_every=10 ** 12)
+            snapshot_seconds = time.perf_counter() - start
+            tail_records = storage.sequence - storage.snapshot_sequence
+            storage.close()
+        
+        result = {"orders": orders, "records": records, "journal_mb": journal_bytes / 2 ** 20,
+                  "replay_seconds": replay_seconds, "snapshot_mb": snapshot_bytes / 2 ** 20,
+                  "snapshot_seconds": snapshot_seconds, "tail_records": tail_records}
+        results.append(result)
+        print(f"{orders:>8}{records:>10}{result['journal_mb']:>12.1f}{replay_seconds:>10.3f}"
+              f"{result['snapshot_mb']:>13.1f}{snapshot_seconds:>12.3f}{tail_records:>11}")
+    print(f"(tail recs: records of the {args.tail} checkouts journaled after the snapshot)")
+    return results
+
+
+def commit_checkouts(storage: Storage, checkouts: int, threads: int, mode: str) -> dict:
+    """Durable checkouts per second from concurrent threads, saving each checkout's writes as mode says"""
+    apply_inline = isinstance(storage, JournaledStorage)  # As the server does, so only the fsync is shared
+    if mode == "grouped":
+        committer = GroupCommitter(storage, apply_inline=apply_inline)
+    else:
+        committer = GroupCommitter(storage, max_batch=1, max_wait=0, apply_inline=apply_inline)
+    product = storage.get_product(1)
+    
+    def checkout(i):
+        order = Order(1 + i % 20, [LineItem.of(product, 1)], order_id=storage.next_id("order"))
+        invoice = Invoice(order.order_id, "Benchmark", order.items, order.total,
+                          invoice_number=storage.next_id("invoice"))
+        payment = Payment(order.order_id, order.total, DigitalWallet("Bench"), payment_id=storage.next_id("payment"))
+        payment.process()
+        invoice.status = "Paid"
+        payment.generate_receipt("Benchmark", items=order.items, receipt_number=storage.next_id("receipt"))
+        changes = [("add_order", order), ("add_invoice", invoice), ("add_payment", payment)]
+        if mode == "separate":
+            for change in changes:
+                committer.submit([change]).result()
+        else:
+            committer.submit(changes).result()
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(checkout, range(checkouts)))
+    seconds = time.perf_counter() - start
+    committer.close()
+    return {"checkouts_per_second": checkouts / seconds, "batch": committer.committed / committer.batches}
+
+
+def commit_command(args):
+    """Compare durable checkout throughput with writes saved one by one, per checkout and in shared batches"""
+    results = {}
+    print(f"{'backend':<10}{'writes saved':<16}{'checkouts/s':>13}{'checkouts per commit':>22}")
+    for backend in ("sqlite", "journal"):
+        for mode in ("separate", "checkout", "grouped"):
+            with tempfile.TemporaryDirectory() as directory:
+                if backend == "sqlite":
+                    storage = SQLiteStorage(os.path.join(directory, "store.db"))
+                else:
+                    storage = JournaledStorage(directory)
+                try:
+                    seed_storage(storage)
+                    result = commit_checkouts(storage, args.checkouts, args.threads, mode)
+                finally:
+                    storage.close()
+            results[f"{backend} {mode}"] = result
+            label = {"separate": "each write", "checkout": "per checkout", "grouped": "grouped"}[mode]
+            print(f"{backend:<10}{label:<16}{result['checkouts_per_second']:>13.0f}"
+                  f"{result['batch'] / (3 if mode == 'separate' else 1):>22.2f}")
+    return results
+
+BENCH_PASSWORD = "bench-password"
+BENCH_USER_OFFSET = 1000  # Benchmark customers get IDs above the sample users
+
+
+def prepare_store(db, users: int):
+    """Add benchmark customers and give every product enough stock for a long run"""
+    for i in range(users):
+        email = f"bench{i}@example.com"
+        if db.get_user_by_email(email) is None:
+            db.add_user(Customer(BENCH_USER_OFFSET + i, email, BENCH_PASSWORD, f"Bench User {i}"))
+    for product in db.get_all_products():
+        db.adjust_stock(product, 10 ** 9 - product.stock)
+
+
+def configure_app_environment(args, directory: str):
+    """Point the app at the backend under test; must run before main is imported"""
+    os.environ["STORE_BACKEND"] = args.backend
+    os.environ["STORE_DB_PATH"] = os.path.join(directory, "api-bench.db")
+    os.environ["PAYMENT_GATEWAY_LATENCY_MS"] = str(args.gateway_latency_ms)
+
+
+class LoadRecorder:
+    """Collects per-endpoint latencies and failures during a run"""
+    
+    def __init__(self):
+        self.latencies = {}  # endpoint label -> [seconds]
+        self.errors = {}  # endpoint label -> count
+    
+    async def request(self, client, method: str, label: str, url: str, **kwargs):
+        """Send one request and record it under a route label such as GET /api/orders/{order_id}"""
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+        except Exception:
+            response, failed = None, True
+        self.latencies.setdefault(label, []).append(time.perf_counter() - start)
+        if failed:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        return response if not failed else None
+    
+    def summary(self, seconds: float) -> dict:
+        endpoints = {}
+        for label, samples in sorted(self.latencies.items()):
+            endpoints[label] = {
+                "requests": len(samples),
+                "errors": self.errors.get(label, 0),
+                "requests_per_second": round(len(samples) / seconds, 1),
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+                "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            }
+        samples = [latency for latencies in self.latencies.values() for latency in latencies]
+        overall = {
+            "requests": len(samples),
+            "errors": sum(self.errors.values()),
+            "requests_per_second": round(len(samples) / seconds, 1),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2) if samples else 0,
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2) if samples else 0,
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2) if samples else 0,
+        }
+        return {"seconds": round(seconds, 2), "overall": overall, "endpoints": endpoints}
+
+
+async def shopper(client, recorder: LoadRecorder, user: int, deadline: float, checkout_rate: float):
+    """One customer browsing, filling a cart, checking out and reading their orders until the deadline"""
+    rng = random.Random(user)
+    response = await recorder.request(client, "POST", "POST /api/login", "/api/login",
+                                      data={"email": f"bench{user}@example.com", "password": BENCH_PASSWORD})
+    if response is None:
+        return
+    session = {"session_id": response.json()["session_id"]}
+    
+    while time.perf_counter() < deadline:
+        response = await recorder.request(client, "GET", "GET /api/products", "/api/products")
+        product_ids = [product["product_id"] for product in response.json()] if response else [1]
+        for product_id in rng.sample(product_ids, min(2, len(product_ids))):
+            await recorder.request(client, "GET", "GET /api/products/{product_id}",
+                                   f"/api/products/{product_id}")
+        
+        for product_id in rng.sample(product_ids, rng.randint(1, min(3, len(product_ids)))):
+            await recorder.request(client, "POST", "POST /api/cart/add", "/api/cart/add", params=session,
+                                   data={"product_id": product_id, "quantity": rng.randint(1, 3)})
+        await recorder.request(client, "GET", "GET /api/cart", "/api/cart", params=session)
+        
+        # Most visits end without buying; the cart carries over to the next one
+        if rng.random() >= checkout_rate:
+            continue
+        response = await recorder.request(
+            client, "POST", "POST /api/checkout", "/api/checkout", params=session,
+            headers={"Idempotency-Key": f"bench-{user}-{rng.getrandbits(64)}"},
+            data={"payment_method": "wallet", "payment_details": f"Bench wallet {user}"})
+        await recorder.request(client, "GET", "GET /api/orders", "/api/orders", params=session)
+        if response is not None:
+            order_id = response.json()["order"]["order_id"]
+            await recorder.request(client, "GET", "GET /api/orders/{order_id}/receipt",
+                                   f"/api/orders/{order_id}/receipt", params=session)
+
+
+async def run_load(client, users: int, duration: float, checkout_rate: float) -> dict:
+    """Run concurrent shoppers against a client and summarize what they saw"""
+    recorder = LoadRecorder()
+    start = time.perf_counter()
+    await asyncio.gather(*[shopper(client, recorder, user, start + duration, checkout_rate)
+                           for user in range(users)])
+    return recorder.summary(time.perf_counter() - start)
+
+
+async def load_in_process(args) -> dict:
+    """Drive the FastAPI app through ASGI without a network hop"""
+    import httpx
+    import main as store
+    
+    prepare_store(store.db, args.users)
+    transport = httpx.ASGITransport(app=store.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://store") as client:
+        return await run_load(client, args.users, args.duration, args.checkout_rate)
+
+
+async def load_uvicorn(args, base_url: str) -> dict:
+    """Drive a running uvicorn server over HTTP"""
+    import httpx
+    
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        return await run_load(client, args.users, args.duration, args.checkout_rate)
+
+
+def wait_for_server(base_url: str, process, timeout: float = 30):
+    """Poll the product listing until the server answers"""
+    import httpx
+    
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("uvicorn exited before it started serving")
+        try:
+            if httpx.get(base_url + "/api/products", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("uvicorn did not start in time")
+
+
+def serve_command(args):
+    """Seed benchmark customers and serve the app with uvicorn"""
+    import uvicorn
+    import main as store
+    
+    prepare_store(store.db, args.users)
+    if args.workers > 1:
+        # Workers import the app themselves and share the seeded SQLite file
+        uvicorn.run("main:app", host="127.0.0.1", port=args.port, workers=args.workers, log_level="warning")
+    else:
+        uvicorn.run(store.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def print_load_results(results: dict, baseline: dict = None):
+    """Print per-endpoint results, with p95 and throughput changes against a baseline run"""
+    header = f"{'endpoint':<38}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+    print(header + (f"{'p95 vs base':>13}{'req/s vs base':>15}" if baseline else ""))
+    rows = list(results["endpoints"].items()) + [("overall", results["overall"])]
+    for label, result in rows:
+        line = (f"{label:<38}{result['requests_per_second']:>9}{result['p50_ms']:>9}"
+                f"{result['p95_ms']:>9}{result['p99_ms']:>9}{result['errors']:>8}")
+        if baseline:
+            base = baseline["overall"] if label == "overall" else baseline["endpoints"].get(label)
+            if base and base["p95_ms"] and base["requests_per_second"]:
+                p95_change = (result["p95_ms"] / base["p95_ms"] - 1) * 100
+                rate_change = (result["requests_per_second"] / base["requests_per_second"] - 1) * 100
+                line += f"{p95_change:>+12.1f}%{rate_change:>+14.1f}%"
+        print(line)
+
+
+def api_command(args):
+    """Replay a shopping mix against the API and report latency percentiles per endpoint"""
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        raise SystemExit("The API benchmark needs httpx: pip install httpx")
+    if args.target == "uvicorn" and args.workers > 1 and args.backend != "sqlite":
+        raise SystemExit("--workers > 1 needs --backend sqlite")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        configure_app_environment(args, directory)
+        if args.target == "inprocess":
+            results = asyncio.run(load_in_process(args))
+        else:
+            import subprocess
+            base_url = f"http://127.0.0.1:{args.port}"
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "serve", "--port", str(args.port),
+                 "--users", str(args.users), "--workers", str(args.workers)],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.DEVNULL)
+            try:
+                wait_for_server(base_url, process)
+                results = asyncio.run(load_uvicorn(args, base_url))
+            finally:
+                process.terminate()
+                process.wait()
+    
+    results["settings"] = {
+        "target": args.target,
+        "backend": args.backend,
+        "workers": args.workers if args.target == "uvicorn" else 1,
+        "users": args.users,
+        "duration": args.duration,
+        "checkout_rate": args.checkout_rate,
+        "gateway_latency_ms": args.gateway_latency_ms,
+        "python": sys.version.split()[0],
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_load_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convenience store benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    storage_parser = commands.add_parser("storage", help="compare storage backends under checkout load")
+    storage_parser.add_argument("--checkouts", type=int, default=2000)
+    storage_parser.add_argument("--items", type=int, default=3)
+    storage_parser.set_defaults(func=storage_command)
+    
+    stress_parser = commands.add_parser("stress", help="check concurrent checkouts never oversell")
+    stress_parser.add_argument("--checkouts", type=int, default=5000)
+    stress_parser.add_argument("--threads", type=int, default=32)
+    stress_parser.add_argument("--stock", type=int, default=100)
+    stress_parser.add_argument("--backend", choices=["memory", "sqlite", "journal"], default="memory",
+                               help="backend for the checkout stress through the API")
+    stress_parser.set_defaults(func=stress_command)
+    
+    gateway_parser = commands.add_parser("gateway", help="payment throughput with a slow provider")
+    gateway_parser.add_argument("--charges", type=int, default=500)
+    gateway_parser.add_argument("--clients", type=int, default=50)
+    gateway_parser.add_argument("--concurrency", type=int, default=10)
+    gateway_parser.add_argument("--latency-ms", type=float, default=100)
+    gateway_parser.add_argument("--failure-rate", type=float, default=0.05)
+    gateway_parser.set_defaults(func=gateway_command)
+    
+    cart_parser = commands.add_parser("cart", help="time cart operations on a bulk cart")
+    cart_parser.add_argument("--lines", type=int, default=500)
+    cart_parser.set_defaults(func=cart_command)
+    
+    memory_parser = commands.add_parser("memory", help="memory taken per order in the in-memory history")
+    memory_parser.add_argument("--orders", type=int, default=20000)
+    memory_parser.add_argument("--items", type=int, default=3)
+    memory_parser.set_defaults(func=memory_command)
+    
+    reports_parser = commands.add_parser("reports", help="sales reports from the ledger vs looping over orders")
+    reports_parser.add_argument("--orders", type=int, default=100000)
+    reports_parser.add_argument("--items", type=int, default=3)
+    reports_parser.set_defaults(func=reports_command)
+    
+    low_stock_parser = commands.add_parser("low-stock", help="low-stock index updates and listings on a large catalog")
+    low_stock_parser.add_argument("--products", type=int, default=100000)
+    low_stock_parser.add_argument("--updates", type=int, default=5000)
+    low_stock_parser.set_defaults(func=low_stock_command)
+    
+    search_parser = commands.add_parser("search", help="product search from the index vs scanning the catalog")
+    search_parser.add_argument("--products", type=int, default=100000)
+    search_parser.add_argument("--queries", type=int, default=1000)
+    search_parser.add_argument("--words", type=int, default=400, help="descriptive words shared by the products")
+    search_parser.set_defaults(func=search_command)
+    
+    recovery_parser = commands.add_parser("recovery", help="journaled store startup time against history size")
+    recovery_parser.add_argument("--orders", type=int, default=100000, help="largest history; 1/4, 1/2 and 3/4 also run")
+    recovery_parser.add_argument("--items", type=int, default=3)
+    recovery_parser.add_argument("--tail", type=int, default=1000, help="checkouts journaled after the snapshot")
+    recovery_parser.set_defaults(func=recovery_command)
+    
+    commit_parser = commands.add_parser("commit", help="durable checkouts per second with and without group commit")
+    commit_parser.add_argument("--checkouts", type=int, default=2000)
+    commit_parser.add_argument("--threads", type=int, default=32)
+    commit_parser.set_defaults(func=commit_command)
+    
+    api_parser = commands.add_parser("api", help="load-test the HTTP API with a shopping mix")
+    api_parser.add_argument("--target", choices=["inprocess", "uvicorn"], default="inprocess")
+    api_parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    api_parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    api_parser.add_argument("--port", type=int, default=8765)
+    api_parser.add_argument("--users", type=int, default=20, help="concurrent shoppers")
+    api_parser.add_argument("--duration", type=float, default=10, help="seconds to run")
+    api_parser.add_argument("--checkout-rate", type=float, default=0.3,
+                            help="share of visits that end in a checkout")
+    api_parser.add_argument("--gateway-latency-ms", type=float, default=0)
+    api_parser.add_argument("--output", help="write results to this JSON file")
+    api_parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    api_parser.set_defaults(func=api_command)
+    
+    serve_parser = commands.add_parser("serve", help="serve the app with benchmark customers seeded")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--users", type=int, default=20)
+    serve_parser.add_argument("--workers", type=int, default=1)
+    serve_parser.set_defaults(func=serve_command)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
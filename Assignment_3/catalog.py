@@ -0,0 +1,45 @@
+"""
+Catalog module - pre-serialized product listing served by GET /api/products
+The JSON body is rebuilt only when the storage reports a new catalog version
+"""
+
+import hashlib
+import json
+import threading
+from typing import Callable
+
+
+class CatalogCache:
+    """Keeps the active product list serialized once per catalog version"""
+    
+    def __init__(self, db, details: Callable[[object], dict]):
+        self.db = db
+        self.details = details  # Product -> the dict listed for it
+        self.version = None
+        self.snapshot = ("", b"[]")  # (etag, body), swapped in one assignment
+        self._lock = threading.Lock()
+    
+    def _rebuild(self, version: int):
+        """Serialize the active products and compute their ETag"""
+        products = [self.details(p) for p in self.db.get_all_products() if p.active]
+        body = json.dumps(products, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.snapshot = (etag, body)
+        self.version = version
+    
+    def get_snapshot(self):
+        """Return (etag, body) for the current catalog, rebuilding only if it changed"""
+        version = self.db.catalog_version()
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self._rebuild(version)
+        return self.snapshot
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Check an If-None-Match request header against an ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
@@ -0,0 +1,227 @@
+"""
+Dashboard module - headline numbers for the admin view, maintained as counters
+Checkouts, status changes, paid invoices and stock changes each adjust a few named
+counters, so /api/admin/dashboard reads a handful of values instead of scanning
+orders and invoices; the SQLite store keeps the counters shared between workers
+"""
+
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+from order import ORDER_STATUSES
+
+LOW_STOCK_THRESHOLD = 10  # Products at or below this stock count as low
+
+UNPAID_INVOICES = "invoices:unpaid"
+LOW_STOCK = "products:low_stock"
+
+
+def status_counter(status: str) -> str:
+    return f"orders:{status}"
+
+
+def revenue_counter(day: date) -> str:
+    return f"revenue:{day.isoformat()}"  # Cents taken on that day, cancelled orders excluded
+
+
+def orders_counter(day: date) -> str:
+    return f"orders_on:{day.isoformat()}"
+
+
+class Dashboard(ABC):
+    """Abstract base class for the dashboard counter store (Strategy Pattern)"""
+    
+    def __init__(self, low_stock_threshold: int = LOW_STOCK_THRESHOLD):
+        self.low_stock_threshold = low_stock_threshold
+    
+    @abstractmethod
+    def adjust(self, deltas: Dict[str, int]):
+        """Add each delta to its counter in one step"""
+        pass
+    
+    @abstractmethod
+    def read(self, names: List[str]) -> Dict[str, int]:
+        """Return the current value of each named counter (0 if never set)"""
+        pass
+    
+    @abstractmethod
+    def initialize(self, storage):
+        """Count existing orders, invoices and stock once, if that has not been done yet"""
+        pass
+    
+    def close(self):
+        """Release any resources held by the store"""
+        pass
+    
+    def count_existing(self, storage) -> Dict[str, int]:
+        """Build every counter by scanning the store (only needed the first time)"""
+        counters: Dict[str, int] = defaultdict(int)
+        for order in storage.get_all_orders():
+            self._count_order(counters, order, order.status, 1)
+        for invoice in storage.get_all_invoices():
+            if invoice.status == "Unpaid":
+                counters[UNPAID_INVOICES] += 1
+        counters[LOW_STOCK] = sum(1 for product in storage.get_all_products()
+                                  if product.stock <= self.low_stock_threshold)
+        return counters
+    
+    def _count_order(self, deltas: Dict[str, int], order, status: str, sign: int):
+        """Add (sign 1) or take away (sign -1) an order's counts as if it had the given status"""
+        deltas[status_counter(status)] += sign
+        if status != "Cancelled":
+            day = order.order_date.date()
+            deltas[revenue_counter(day)] += sign * order.total.cents
+            deltas[orders_counter(day)] += sign
+    
+    def order_added(self, order):
+        deltas: Dict[str, int] = defaultdict(int)
+        self._count_order(deltas, order, order.status, 1)
+        self.adjust(deltas)
+    
+    def order_removed(self, order):
+        """Take away the counts of an order that was never saved"""
+        deltas: Dict[str, int] = defaultdict(int)
+        self._count_order(deltas, order, order.status, -1)
+        self.adjust(deltas)
+    
+    def order_status_changed(self, order, previous: str):
+        """Move an order's counts from its previous status to its current one"""
+        if previous == order.status:
+            return
+        deltas: Dict[str, int] = defaultdict(int)
+        self._count_order(deltas, order, previous, -1)
+        self._count_order(deltas, order, order.status, 1)
+        self.adjust({name: value for name, value in deltas.items() if value})
+    
+    def invoice_added(self, invoice):
+        if invoice.status == "Unpaid":
+            self.adjust({UNPAID_INVOICES: 1})
+    
+    def invoice_paid(self, invoice):
+        self.adjust({UNPAID_INVOICES: -1})
+    
+    def invoice_removed(self, invoice):
+        if invoice.status == "Unpaid":
+            self.adjust({UNPAID_INVOICES: -1})
+    
+    def stock_changed(self, levels: Iterable[Tuple[int, int]]):
+        """Count products crossing the low-stock threshold; levels are (previous, current) pairs"""
+        threshold = self.low_stock_threshold
+        delta = sum((current <= threshold) - (previous <= threshold) for previous, current in levels)
+        if delta:
+            self.adjust({LOW_STOCK: delta})
+    
+    def snapshot(self, today: date = None) -> dict:
+        """Today's takings, orders by status, low-stock products and unpaid invoices"""
+        today = today or date.today()
+        names = [revenue_counter(today), orders_counter(today), LOW_STOCK, UNPAID_INVOICES]
+        names += [status_counter(status) for status in ORDER_STATUSES]
+        values = self.read(names)
+        return {
+            "date": today.isoformat(),
+            "revenue_today": values[revenue_counter(today)] / 100,
+            "orders_today": values[orders_counter(today)],
+            "orders_by_status": {status: values[status_counter(status)] for status in ORDER_STATUSES},
+            "low_stock_products": values[LOW_STOCK],
+            "low_stock_threshold": self.low_stock_threshold,
+            "unpaid_invoices": values[UNPAID_INVOICES],
+        }
+
+
+class InMemoryDashboard(Dashboard):
+    """Counters in a process dict"""
+    
+    def __init__(self, low_stock_threshold: int = LOW_STOCK_THRESHOLD):
+        super().__init__(low_stock_threshold)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.initialized = False
+    
+    def adjust(self, deltas: Dict[str, int]):
+        for name, delta in deltas.items():
+            self.counters[name] += delta
+    
+    def read(self, names: List[str]) -> Dict[str, int]:
+        return {name: self.counters.get(name, 0) for name in names}
+    
+    def initialize(self, storage):
+        if not self.initialized:
+            self.counters = defaultdict(int, self.count_existing(storage))
+            self.initialized = True
+
+
+DASHBOARD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+INITIALIZED = "meta:initialized"
+ADJUST_COUNTER = """INSERT INTO dashboard_counters (name, value) VALUES (?, ?)
+    ON CONFLICT (name) DO UPDATE SET value = value + excluded.value"""
+SELECT_COUNTER = "SELECT value FROM dashboard_counters WHERE name = ?"
+
+
+class SQLiteDashboard(Dashboard):
+    """Counters in a table of the shared database, adjusted atomically by every worker"""
+    
+    def __init__(self, path: str, low_stock_threshold: int = LOW_STOCK_THRESHOLD):
+        super().__init__(low_stock_threshold)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(DASHBOARD_SCHEMA)
+    
+    def adjust(self, deltas: Dict[str, int]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(ADJUST_COUNTER, list(deltas.items()))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+    
+    def read(self, names: List[str]) -> Dict[str, int]:
+        placeholders = ", ".join("?" * len(names))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT name, value FROM dashboard_counters WHERE name IN ({placeholders})", names).fetchall()
+        values = dict.fromkeys(names, 0)
+        values.update(rows)
+        return values
+    
+    def initialize(self, storage):
+        with self._lock:
+            # The write lock keeps a second worker from counting the same history again
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute(SELECT_COUNTER, (INITIALIZED,)).fetchone() is None:
+                    counters = self.count_existing(storage)
+                    counters[INITIALIZED] = 1
+                    self._conn.executemany(ADJUST_COUNTER, list(counters.items()))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_dashboard(storage) -> Dashboard:
+    """Pick the dashboard store matching STORE_BACKEND and count what is already stored"""
+    threshold = int(os.environ.get("LOW_STOCK_THRESHOLD", LOW_STOCK_THRESHOLD))
+    if os.environ.get("STORE_BACKEND", "memory") == "sqlite":
+        dashboard = SQLiteDashboard(os.environ.get("STORE_DB_PATH", "store.db"), threshold)
+    else:
+        dashboard = InMemoryDashboard(threshold)
+    dashboard.initialize(storage)
+    return dashboard
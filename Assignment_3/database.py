@@ -1,13 +1,29 @@
 """
-Database module - simple in-memory data storage (Singleton pattern)
+Database module - data storage facade over a pluggable backend (Singleton pattern)
 """
 
-from typing import Dict, List, Optional
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from product import Product
 from user import User, Customer, Admin
+from storage import Storage, InMemoryStorage, SQLiteStorage
+from journal import JournaledStorage, SNAPSHOT_EVERY
+
+
+def create_storage() -> Storage:
+    """Pick the storage backend from the STORE_BACKEND environment variable"""
+    backend = os.environ.get("STORE_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteStorage(os.environ.get("STORE_DB_PATH", "store.db"))
+    if backend == "journal":
+        return JournaledStorage(os.environ.get("STORE_JOURNAL_DIR", "journal"),
+                                int(os.environ.get("JOURNAL_SNAPSHOT_EVERY", SNAPSHOT_EVERY)))
+    return InMemoryStorage()
+
 
 class Database:
-    """Singleton class for data storage (in-memory for simplicity)"""
+    """Singleton class for data storage (backend chosen at startup)"""
     
     _instance = None
     
@@ -22,14 +38,11 @@ class Database:
             return
         
         self._initialized = True
-        self.products: Dict[int, Product] = {}
-        self.users: Dict[int, User] = {}
-        self.orders: Dict = {}
-        self.payments: Dict = {}
-        self.invoices: Dict = {} 
+        self.storage: Storage = create_storage()
         
-        # Initialize with sample data
-        self._init_sample_data()
+        # Initialize with sample data (persistent backends keep theirs)
+        if self.storage.is_empty():
+            self._init_sample_data()
     
     def _init_sample_data(self):
         """Add sample data for testing"""
@@ -52,90 +65,144 @@ class Database:
             Product(15, "DAIRY001", "Strawberry Yogurt Cup", 1.70, "Creamy yogurt with real strawberry bits.", 19, "/static/images/berrygurt.jpg"),
         ]
         for product in products:
-            self.products[product.product_id] = product
+            self.add_product(product)
         
         # Add sample users
-        self.users[1] = Customer(1, "customer@example.com", "password123", 
-                                "John Doe", "123 Main St")
-        self.users[2] = Admin(2, "admin@example.com", "admin123")
+        self.add_user(Customer(1, "customer@example.com", "password123", 
+                                "John Doe", "123 Main St"))
+        self.add_user(Admin(2, "admin@example.com", "admin123"))
+    
+    def next_id(self, kind: str) -> int:
+        """Allocate the next order, payment, invoice or receipt ID"""
+        return self.storage.next_id(kind)
+    
+    def catalog_version(self) -> int:
+        """Return a number that changes whenever the product catalog changes"""
+        return self.storage.catalog_version()
     
     # Product operations
     def get_product(self, product_id: int) -> Optional[Product]:
         """Get product by ID"""
-        return self.products.get(product_id)
+        return self.storage.get_product(product_id)
     
     def get_all_products(self) -> List[Product]:
         """Get all products"""
-        return list(self.products.values())
+        return self.storage.get_all_products()
     
     def add_product(self, product: Product):
         """Add new product"""
-        self.products[product.product_id] = product
+        self.storage.add_product(product)
     
     def update_product(self, product: Product):
-        """Update existing product"""
-        if product.product_id in self.products:
-            self.products[product.product_id] = product
+        """Update existing product details (use adjust_stock for stock)"""
+        self.storage.update_product(product)
+    
+    def adjust_stock(self, product: Product, quantity: int):
+        """Change stock by quantity, safe against concurrent workers"""
+        self.storage.adjust_stock(product, quantity)
+    
+    def reserve_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        """Take stock for a whole cart at once, raising InsufficientStockError if any item is short"""
+        return self.storage.reserve_stock(quantities)
+    
+    def release_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        """Return stock taken by reserve_stock (e.g. when payment fails)"""
+        return self.storage.release_stock(quantities)
     
     # User operations
     def get_user(self, user_id: int) -> Optional[User]:
         """Get user by ID"""
-        return self.users.get(user_id)
+        return self.storage.get_user(user_id)
     
     def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
-        for user in self.users.values():
-            if user.email == email:
-                return user
-        return None
+        return self.storage.get_user_by_email(email)
     
     def add_user(self, user: User):
         """Add new user"""
-        self.users[user.user_id] = user
+        self.storage.add_user(user)
     
     # Order operations
     def get_order(self, order_id: int):
         """Get order by ID"""
-        return self.orders.get(order_id)
+        return self.storage.get_order(order_id)
     
     def get_orders_by_customer(self, customer_id: int) -> List:
         """Get all orders for a customer"""
-        return [order for order in self.orders.values() 
-                if order.customer_id == customer_id]
+        return self.storage.get_orders_by_customer(customer_id)
     
     def get_all_orders(self) -> List:
         """Get all orders"""
-        return list(self.orders.values())
+        return self.storage.get_all_orders()
+    
+    def query_orders(self, customer_id: int = None, status: str = None,
+                     date_from: datetime = None, date_to: datetime = None,
+                     before_id: int = None, limit: int = 50) -> List:
+        """Get one page of orders, newest first, matching the given filters"""
+        return self.storage.query_orders(customer_id, status, date_from, date_to, before_id, limit)
+    
+    def get_orders_after(self, after_id: int, limit: int) -> List:
+        """Get the next batch of orders by ascending ID (for exports)"""
+        return self.storage.get_orders_after(after_id, limit)
     
     def add_order(self, order):
         """Add new order"""
-        self.orders[order.order_id] = order
+        self.storage.add_order(order)
+    
+    def update_order(self, order):
+        """Save changes to an existing order"""
+        self.storage.update_order(order)
     
     # Payment operations
     def add_payment(self, payment):
         """Add new payment"""
-        self.payments[payment.payment_id] = payment
+        self.storage.add_payment(payment)
     
     def get_payment(self, payment_id: int):
         """Get payment by ID"""
-        return self.payments.get(payment_id)
+        return self.storage.get_payment(payment_id)
     
     def get_payment_by_order(self, order_id: int):
         """Get payment for a specific order"""
-        for payment in self.payments.values():
-            if payment.order_id == order_id:
-                return payment
-        return None
+        return self.storage.get_payment_by_order(order_id)
+    
+    def update_payment(self, payment):
+        """Save changes to an existing payment"""
+        self.storage.update_payment(payment)
+    
+    def get_payments_after(self, after_id: int, limit: int) -> List:
+        """Get the next batch of payments by ascending ID (for exports)"""
+        return self.storage.get_payments_after(after_id, limit)
     
     # Invoice operations
     def add_invoice(self, invoice):
         """Add new invoice"""
-        self.invoices[invoice.order_id] = invoice
+        self.storage.add_invoice(invoice)
     
     def get_invoice_by_order(self, order_id: int):
         """Get invoice for a specific order"""
-        return self.invoices.get(order_id)
+        return self.storage.get_invoice_by_order(order_id)
     
     def get_all_invoices(self) -> List:
         """Get all invoices"""
-        return list(self.invoices.values())
+        return self.storage.get_all_invoices()
+    
+    def update_invoice(self, invoice):
+        """Save changes to an existing invoice"""
+        self.storage.update_invoice(invoice)
+    
+    def get_invoices_after(self, after_order_id: int, limit: int) -> List:
+        """Get the next batch of invoices by ascending order ID (for exports)"""
+        return self.storage.get_invoices_after(after_order_id, limit)
+    
+    def save_batch(self, changes: List[Tuple[str, object]]):
+        """Save several add_*/update_* writes at once (one transaction for SQLite)"""
+        self.storage.save_batch(changes)
+    
+    def sync(self):
+        """Wait until every saved change is on disk"""
+        self.storage.sync()
+    
+    def close(self):
+        """Write out anything the backend still buffers and release it"""
+        self.storage.close()
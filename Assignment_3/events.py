@@ -0,0 +1,159 @@
+"""
+Events module - publish/subscribe channel for live product and order updates
+Subscribers receive deltas over Server-Sent Events (GET /api/events)
+EventBroker delivers within one process; SQLiteEventBroker relays events through
+the shared database file so clients of every worker see every change
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional, Set
+
+QUEUE_SIZE = 100  # Events buffered per client before it is told to resync
+KEEPALIVE_SECONDS = 15
+
+
+class Subscription:
+    """One connected client and the events queued for it"""
+    
+    def __init__(self, user_id: int, is_admin: bool):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    
+    def wants(self, message: dict) -> bool:
+        """Products are public; order events go to their customer and to admins, stock alerts to admins"""
+        if message["type"] == "order":
+            return self.is_admin or message["data"]["customer_id"] == self.user_id
+        if message["type"] == "stock_alert":
+            return self.is_admin
+        return True
+    
+    def push(self, message: dict):
+        """Queue a message, replacing the backlog with a resync if the client fell behind"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "data": {}})
+
+
+class EventBroker:
+    """Fans published events out to subscribers in this process"""
+    
+    def __init__(self):
+        self.subscriptions: Set[Subscription] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def subscribe(self, user_id: int, is_admin: bool) -> Subscription:
+        """Register a client; must be called from the event loop"""
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription(user_id, is_admin)
+        self.subscriptions.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+    
+    def publish(self, event_type: str, data: dict):
+        """Send an event to every interested subscriber"""
+        self._deliver({"type": event_type, "data": data})
+    
+    def _deliver(self, message: dict):
+        if not self.subscriptions or self.loop is None:
+            return
+        # Publishers may run in worker threads; queues belong to the event loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._fan_out(message)
+        else:
+            self.loop.call_soon_threadsafe(self._fan_out, message)
+    
+    def _fan_out(self, message: dict):
+        for subscription in list(self.subscriptions):
+            if subscription.wants(message):
+                subscription.push(message)
+    
+    async def stream(self, subscription: Subscription, request):
+        """Yield Server-Sent Events for a subscription until the client disconnects"""
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message['data'])}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+INSERT_EVENT = "INSERT INTO events (type, data) VALUES (?, ?)"
+SELECT_EVENTS_AFTER = "SELECT event_id, type, data FROM events WHERE event_id > ? ORDER BY event_id"
+SELECT_LAST_EVENT = "SELECT COALESCE(MAX(event_id), 0) FROM events"
+PRUNE_EVENTS = "DELETE FROM events WHERE event_id <= ?"
+
+
+class SQLiteEventBroker(EventBroker):
+    """Relays events through a table in the shared database so every worker sees them"""
+    
+    POLL_SECONDS = 0.25
+    KEEP_EVENTS = 1000
+    
+    def __init__(self, path: str):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(EVENTS_SCHEMA)
+        self.last_event_id = self._conn.execute(SELECT_LAST_EVENT).fetchone()[0]
+        self._poller: Optional[asyncio.Task] = None
+    
+    def subscribe(self, user_id: int, is_admin: bool) -> Subscription:
+        subscription = super().subscribe(user_id, is_admin)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        return subscription
+    
+    def publish(self, event_type: str, data: dict):
+        with self._lock:
+            event_id = self._conn.execute(INSERT_EVENT, (event_type, json.dumps(data))).lastrowid
+            # Old events are only needed by workers that are still catching up
+            if event_id % self.KEEP_EVENTS == 0:
+                self._conn.execute(PRUNE_EVENTS, (event_id - self.KEEP_EVENTS,))
+    
+    async def _poll(self):
+        """Deliver events written by any worker while this worker has subscribers"""
+        while self.subscriptions:
+            with self._lock:
+                rows = self._conn.execute(SELECT_EVENTS_AFTER, (self.last_event_id,)).fetchall()
+            for event_id, event_type, data in rows:
+                self.last_event_id = event_id
+                self._fan_out({"type": event_type, "data": json.loads(data)})
+            await asyncio.sleep(self.POLL_SECONDS)
+        # Skip anything published while nobody was listening
+        with self._lock:
+            self.last_event_id = self._conn.execute(SELECT_LAST_EVENT).fetchone()[0]
+
+
+def create_event_broker() -> EventBroker:
+    """Pick the broker matching the STORE_BACKEND environment variable"""
+    if os.environ.get("STORE_BACKEND", "memory") == "sqlite":
+        return SQLiteEventBroker(os.environ.get("STORE_DB_PATH", "store.db"))
+    return EventBroker()
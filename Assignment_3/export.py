@@ -0,0 +1,135 @@
+"""
+Export module - streams orders, invoices and receipts as CSV or NDJSON
+Records are read from the database in small batches and written row by row,
+so memory use does not grow with the size of the order history
+Usage: python export.py orders|invoices|receipts [--format csv|ndjson] [--output FILE]
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from typing import Callable, Iterator
+
+BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024  # Bytes buffered before a chunk is handed to the writer
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def iter_batched(fetch_after: Callable, key: Callable, batch_size: int = BATCH_SIZE) -> Iterator:
+    """Yield every record from a fetch_after(after_key, limit) function, one batch at a time"""
+    after = 0
+    while True:
+        batch = fetch_after(after, batch_size)
+        if not batch:
+            return
+        yield from batch
+        after = key(batch[-1])
+
+
+# Orders: one CSV row per order line, one NDJSON line per order
+ORDER_COLUMNS = ["order_id", "customer_id", "order_date", "status", "order_total",
+                 "product_id", "sku", "product_name", "quantity", "unit_price", "line_total"]
+
+
+def order_records(db) -> Iterator[dict]:
+    for order in iter_batched(db.get_orders_after, lambda order: order.order_id):
+        yield order.get_details()
+
+
+def order_rows(record: dict) -> Iterator[list]:
+    for item in record["items"]:
+        yield [record["order_id"], record["customer_id"], record["order_date"], record["status"],
+               record["total"], item["product_id"], item["sku"], item["product_name"],
+               item["quantity"], item["unit_price"], item["line_total"]]
+
+
+# Invoices: one row per invoice
+INVOICE_COLUMNS = ["invoice_number", "order_id", "customer_name", "issue_date", "due_date",
+                   "total_amount", "status"]
+
+
+def invoice_records(db) -> Iterator[dict]:
+    for invoice in iter_batched(db.get_invoices_after, lambda invoice: invoice.order_id):
+        yield invoice.generate_invoice()
+
+
+def invoice_rows(record: dict) -> Iterator[list]:
+    yield [record[column] for column in INVOICE_COLUMNS]
+
+
+# Receipts: one row per receipt, read through the payments that own them
+RECEIPT_COLUMNS = ["receipt_number", "payment_id", "order_id", "customer_name", "amount_paid",
+                   "payment_method", "payment_date", "status"]
+
+
+def receipt_records(db) -> Iterator[dict]:
+    for payment in iter_batched(db.get_payments_after, lambda payment: payment.payment_id):
+        if payment.receipt:
+            yield payment.receipt.generate_receipt()
+
+
+def receipt_rows(record: dict) -> Iterator[list]:
+    yield [record[column] for column in RECEIPT_COLUMNS]
+
+
+EXPORTS = {
+    "orders": (ORDER_COLUMNS, order_records, order_rows),
+    "invoices": (INVOICE_COLUMNS, invoice_records, invoice_rows),
+    "receipts": (RECEIPT_COLUMNS, receipt_records, receipt_rows),
+}
+
+
+def stream_export(db, kind: str, export_format: str = "csv") -> Iterator[bytes]:
+    """Yield an export as encoded chunks of roughly CHUNK_SIZE bytes"""
+    columns, records, rows = EXPORTS[kind]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if export_format == "csv":
+        writer.writerow(columns)
+    for record in records(db):
+        if export_format == "csv":
+            writer.writerows(rows(record))
+        else:
+            buffer.write(json.dumps(record, separators=(",", ":")))
+            buffer.write("\n")
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def main():
+    from database import Database
+    from journal import JournalLocked
+
+    parser = argparse.ArgumentParser(description="Export store records for accounting")
+    parser.add_argument("kind", choices=sorted(EXPORTS))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--output", help="file to write (defaults to stdout)")
+    args = parser.parse_args()
+
+    try:
+        db = Database()
+    except JournalLocked as error:
+        parser.exit(1, f"{error}; export from a SQLite store, or stop the server first\n")
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream_export(db, args.kind, args.format):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Group commit module - saves the checkout writes of concurrent requests together
+Each checkout hands its order, invoice and payment to the committer and waits; a
+writer thread saves everything queued in one transaction or journal fsync, so many
+checkouts share one durable write instead of each paying for several. Backends with
+in-process indexes (memory, journal) apply the writes on the caller's thread and only
+share the fsync
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Sequence, Tuple
+
+MAX_BATCH = 256  # Checkouts saved in one batch at most
+MAX_WAIT_SECONDS = 0.002  # How long a batch stays open for more checkouts after the first
+
+
+class NotDurable(Exception):
+    """Raised when a batch was saved but the backend could not confirm it reached the disk"""
+
+
+class GroupCommitter:
+    """Writer thread saving queued checkouts in batches; each caller is answered once its batch is durable"""
+    
+    def __init__(self, storage, max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT_SECONDS,
+                 apply_inline: bool = False):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.apply_inline = apply_inline  # Apply writes on the caller's thread; the writer thread only syncs
+        self.batches = 0
+        self.committed = 0  # Checkouts saved, over all batches
+        self._queue: "queue.Queue[Optional[Tuple[Sequence, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+    
+    def submit(self, changes: Sequence[Tuple[str, object]]) -> Future:
+        """Queue one checkout's (method name, object) writes; the future completes when they are durable"""
+        if self.apply_inline:
+            # In-process indexes are read on the caller's thread, so they are changed there too
+            self.storage.save_batch(changes)
+            changes = ()
+        future = Future()
+        future.set_running_or_notify_cancel()  # Once queued the writes happen, so the wait cannot be cancelled
+        self._queue.put((changes, future))
+        return future
+    
+    async def save(self, changes: Sequence[Tuple[str, object]]):
+        """Queue the writes and wait, without blocking the event loop, until they are durable"""
+        await asyncio.wrap_future(self.submit(changes))
+    
+    def _collect(self) -> List:
+        """Wait for a checkout, then take whatever else arrives within max_wait, up to max_batch"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _commit(self, batch: List[Tuple[Sequence, Future]]):
+        changes = [change for changes, future in batch for change in changes]
+        if changes:
+            self.storage.save_batch(changes)
+        try:
+            self.storage.sync()
+        except Exception as error:
+            # The writes are in the store already, so retrying or undoing them would be wrong
+            raise NotDurable(f"Saved but not synced to disk: {error}") from error
+        self.batches += 1
+        self.committed += len(batch)
+        for changes, future in batch:
+            future.set_result(None)
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            closing = batch[-1] is None
+            if closing:
+                batch.pop()
+            if batch:
+                try:
+                    self._commit(batch)
+                except NotDurable as error:
+                    for changes, future in batch:
+                        future.set_exception(error)
+                except Exception:
+                    # Save them one by one, so a bad write only fails its own checkout
+                    for entry in batch:
+                        try:
+                            self._commit([entry])
+                        except Exception as error:
+                            entry[1].set_exception(error)
+            if closing:
+                return
+    
+    def close(self):
+        """Save everything already queued, then stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def create_group_committer(storage) -> GroupCommitter:
+    """Batches stay open GROUP_COMMIT_WAIT_MS for durable backends; in-memory saves go straight through"""
+    backend = os.environ.get("STORE_BACKEND", "memory")
+    wait_ms = float(os.environ.get("GROUP_COMMIT_WAIT_MS", MAX_WAIT_SECONDS * 1000)) if backend != "memory" else 0
+    # The memory and journal backends keep their indexes in process, so only the journal's fsync is batched
+    return GroupCommitter(storage, int(os.environ.get("GROUP_COMMIT_MAX_BATCH", MAX_BATCH)), wait_ms / 1000,
+                          apply_inline=backend != "sqlite")
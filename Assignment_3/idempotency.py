@@ -0,0 +1,192 @@
+"""
+Idempotency module - replays the first result of a request retried with the same Idempotency-Key
+A checkout that is retried after a timeout returns the original order instead of
+placing and charging a second one; concurrent duplicates wait for the first attempt
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+KEY_TTL = 24 * 60 * 60  # Seconds a result is replayed for
+MAX_KEYS = 10000  # Completed results kept in memory
+IN_FLIGHT_TIMEOUT = 60  # Seconds before an unfinished attempt is presumed dead
+POLL_SECONDS = 0.05
+
+Result = Tuple[int, dict]  # (status_code, response body)
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a key is reused for a request with different parameters"""
+    
+    def __init__(self, key: str):
+        self.key = key
+        super().__init__("Idempotency-Key was already used with different request parameters")
+
+
+def fingerprint(*values) -> str:
+    """Hash the request parameters a key is bound to"""
+    return hashlib.sha1("\0".join(str(value) for value in values).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """Abstract base class for idempotency key storage (Strategy Pattern)"""
+    
+    def __init__(self, ttl: float = KEY_TTL):
+        self.ttl = ttl
+    
+    @abstractmethod
+    async def run(self, key: str, request_hash: str,
+                  operation: Callable[[], Awaitable[Result]]) -> Tuple[Result, bool]:
+        """Run operation once per key and return (result, replayed)"""
+        pass
+    
+    def close(self):
+        """Release any resources held by the store"""
+        pass
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Keeps results in a process dict; duplicates in flight wait on the first attempt"""
+    
+    def __init__(self, ttl: float = KEY_TTL, max_keys: int = MAX_KEYS):
+        super().__init__(ttl)
+        self.max_keys = max_keys
+        self.results: Dict[str, Tuple[str, Result, float]] = OrderedDict()  # key -> (hash, result, stored_at)
+        self.in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}  # key -> (hash, future result)
+    
+    def _prune(self):
+        """Drop expired results (oldest first) and trim to max_keys"""
+        cutoff = time.monotonic() - self.ttl
+        while self.results and (len(self.results) > self.max_keys
+                                or next(iter(self.results.values()))[2] < cutoff):
+            self.results.popitem(last=False)
+    
+    async def run(self, key: str, request_hash: str,
+                  operation: Callable[[], Awaitable[Result]]) -> Tuple[Result, bool]:
+        self._prune()
+        if key in self.results:
+            stored_hash, result, _ = self.results[key]
+            if stored_hash != request_hash:
+                raise IdempotencyConflict(key)
+            return result, True
+        
+        if key in self.in_flight:
+            stored_hash, future = self.in_flight[key]
+            if stored_hash != request_hash:
+                raise IdempotencyConflict(key)
+            # shield() keeps a cancelled duplicate from cancelling the shared result
+            return await asyncio.shield(future), True
+        
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = (request_hash, future)
+        try:
+            result = await operation()
+        except BaseException as error:
+            # Nothing is cached, so a retry runs the operation again
+            future.set_exception(error)
+            future.exception()  # Mark retrieved when no duplicate was waiting
+            raise
+        finally:
+            del self.in_flight[key]
+        self.results[key] = (request_hash, result, time.monotonic())
+        future.set_result(result)
+        return result, False
+
+
+IDEMPOTENCY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    request_hash TEXT NOT NULL,
+    status_code INTEGER,
+    body TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created);
+"""
+
+CLAIM_KEY = "INSERT OR IGNORE INTO idempotency_keys (key, request_hash, created) VALUES (?, ?, ?)"
+SELECT_KEY = "SELECT request_hash, status_code, body, created FROM idempotency_keys WHERE key = ?"
+COMPLETE_KEY = "UPDATE idempotency_keys SET status_code = ?, body = ? WHERE key = ?"
+RELEASE_KEY = "DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL"
+RELEASE_STALE_KEY = "DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL AND created = ?"
+EXPIRE_KEYS = "DELETE FROM idempotency_keys WHERE created < ?"
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Claims keys with a row in the shared database so duplicates on any worker are caught"""
+    
+    EXPIRE_EVERY = 60  # Seconds between deletes of expired keys
+    
+    def __init__(self, path: str, ttl: float = KEY_TTL):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(IDEMPOTENCY_SCHEMA)
+        self._last_expire = 0.0
+    
+    def _claim(self, key: str, request_hash: str) -> Optional[Tuple[Optional[Result], float]]:
+        """Insert a pending row; return None if we own the key, else (stored result, created)"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_expire > self.EXPIRE_EVERY:
+                self._conn.execute(EXPIRE_KEYS, (now - self.ttl,))
+                self._last_expire = now
+            if self._conn.execute(CLAIM_KEY, (key, request_hash, now)).rowcount:
+                return None
+            row = self._conn.execute(SELECT_KEY, (key,)).fetchone()
+        if row is None:
+            return self._claim(key, request_hash)  # Released between the insert and the select
+        stored_hash, status_code, body, created = row
+        if stored_hash != request_hash:
+            raise IdempotencyConflict(key)
+        if status_code is None:
+            return None, created
+        return (status_code, json.loads(body)), created
+    
+    async def run(self, key: str, request_hash: str,
+                  operation: Callable[[], Awaitable[Result]]) -> Tuple[Result, bool]:
+        while True:
+            claimed = self._claim(key, request_hash)
+            if claimed is None:
+                break
+            result, created = claimed
+            if result is not None:
+                return result, True
+            if time.time() - created > IN_FLIGHT_TIMEOUT:
+                # The worker handling the first attempt died; let this request take over
+                with self._lock:
+                    self._conn.execute(RELEASE_STALE_KEY, (key, created))
+                continue
+            await asyncio.sleep(POLL_SECONDS)
+        
+        try:
+            result = await operation()
+        except BaseException:
+            with self._lock:
+                self._conn.execute(RELEASE_KEY, (key,))
+            raise
+        with self._lock:
+            self._conn.execute(COMPLETE_KEY, (result[0], json.dumps(result[1]), key))
+        return result, False
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_idempotency_store() -> IdempotencyStore:
+    """Pick the idempotency store matching the STORE_BACKEND environment variable"""
+    ttl = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", KEY_TTL))
+    if os.environ.get("STORE_BACKEND", "memory") == "sqlite":
+        return SQLiteIdempotencyStore(os.environ.get("STORE_DB_PATH", "store.db"), ttl)
+    return InMemoryIdempotencyStore(ttl)
@@ -0,0 +1,173 @@
+"""
+Images module - resized WebP and JPEG variants of the product images
+Product cards ask for a variant a few hundred pixels wide instead of the full-size
+photo; each variant is made on first request (or ahead of time with
+python images.py) and kept in an on-disk cache keyed by the source file's content
+Usage: python images.py [--static DIR] [--cache DIR]
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional: without Pillow products only list their full-size image
+    Image = ImageOps = None
+
+WIDTHS = (160, 320, 640)  # Pixel widths built for each image; 640 covers a card on a 2x screen
+PREFIX = "/thumbnails"
+SOURCE_PREFIX = "/static/"
+CACHE_CONTROL = "public, max-age=86400"  # The URL stays the same if the source image is replaced
+
+# URL extension -> (Pillow format, media type, save options)
+FORMATS = {
+    ".webp": ("WEBP", "image/webp", {"quality": 80, "method": 6}),
+    ".jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class ImageVariants:
+    """Makes and caches the variants of the images under a static directory"""
+    
+    def __init__(self, directory: str = "static", cache_directory: str = "image_cache"):
+        self.directory = os.path.abspath(directory)
+        self.cache_directory = cache_directory
+        self.made = 0  # Variants made since startup; the rest came from the cache
+        self._digests: Dict[str, Tuple[int, int, str]] = {}  # Source -> (mtime, size, content digest)
+        self._decodable: Dict[str, Tuple[int, int, bool]] = {}  # Source -> (mtime, size, whether Pillow reads it)
+        self._locks: Dict[str, threading.Lock] = {}  # Cache file -> lock held while it is made
+        self._lock = threading.Lock()
+        os.makedirs(cache_directory, exist_ok=True)
+    
+    def _source(self, path: str) -> Optional[str]:
+        """Full path of a file under the directory, or None for anything outside it or missing"""
+        full_path = os.path.abspath(os.path.join(self.directory, path))
+        if os.path.commonpath([full_path, self.directory]) != self.directory or not os.path.isfile(full_path):
+            return None
+        return full_path
+    
+    def _digest(self, source: str) -> str:
+        """Content hash of a source image, recomputed only when the file changes"""
+        status = os.stat(source)
+        cached = self._digests.get(source)
+        if cached is not None and cached[:2] == (status.st_mtime_ns, status.st_size):
+            return cached[2]
+        with open(source, "rb") as file:
+            digest = hashlib.sha256(file.read()).hexdigest()[:16]
+        self._digests[source] = (status.st_mtime_ns, status.st_size, digest)
+        return digest
+    
+    def _can_decode(self, source: str) -> bool:
+        """Whether Pillow recognises a source image, rechecked only when the file changes"""
+        status = os.stat(source)
+        cached = self._decodable.get(source)
+        if cached is not None and cached[:2] == (status.st_mtime_ns, status.st_size):
+            return cached[2]
+        try:
+            with Image.open(source):  # Reads the header only
+                decodable = True
+        except (OSError, ValueError):
+            decodable = False
+        self._decodable[source] = (status.st_mtime_ns, status.st_size, decodable)
+        return decodable
+    
+    def urls(self, image_url: str) -> Dict[str, Dict[int, str]]:
+        """Format -> width -> URL of the variants of a /static/ image; empty if none can be made"""
+        if Image is None or not image_url.startswith(SOURCE_PREFIX):
+            return {}
+        path = image_url[len(SOURCE_PREFIX):]
+        source = self._source(path)
+        if source is None or not self._can_decode(source):
+            return {}
+        return {extension[1:]: {width: f"{PREFIX}/{width}/{path}{extension}" for width in WIDTHS}
+                for extension in FORMATS}
+    
+    def variant(self, path: str, width: int) -> Optional[Tuple[str, str, str]]:
+        """(cache file, media type, ETag) of a variant such as images/chips.jpg.webp; None if it cannot be made"""
+        source_path, extension = os.path.splitext(path)
+        if Image is None or width not in WIDTHS or extension not in FORMATS:
+            return None
+        source = self._source(source_path)
+        if source is None:
+            return None
+        digest = self._digest(source)
+        name = f"{digest}-{width}{extension}"
+        cached = os.path.join(self.cache_directory, name)
+        if not os.path.exists(cached):
+            with self._lock:
+                lock = self._locks.setdefault(name, threading.Lock())
+            with lock:  # Concurrent requests for a new variant wait for one resize instead of each doing it
+                if not os.path.exists(cached) and not self._make(source, cached, width, extension):
+                    return None
+            with self._lock:
+                self._locks.pop(name, None)
+        return cached, FORMATS[extension][1], f'"{digest}-{width}{extension[1:]}"'
+    
+    def _make(self, source: str, cached: str, width: int, extension: str) -> bool:
+        image_format, media_type, options = FORMATS[extension]
+        temporary = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with Image.open(source) as image:
+                # Turned upright first, so width means the width the photo is shown at
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((width, image.height), Image.LANCZOS)  # Never enlarges
+                if image_format == "JPEG" and image.mode != "RGB":
+                    image = image.convert("RGB")
+                elif image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if image.mode in ("LA", "PA", "P") else "RGB")
+                image.save(temporary, image_format, **options)
+        except (OSError, ValueError) as error:
+            logger.warning("Cannot make %dpx %s variant of %s: %s", width, image_format, source, error)
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return False
+        os.replace(temporary, cached)
+        self.made += 1
+        return True
+    
+    def build(self, subdirectory: str = "images") -> Dict[str, int]:
+        """Make every variant of every image under a subdirectory; returns bytes of the sources and of each format"""
+        totals = {"source": 0, **{extension[1:]: 0 for extension in FORMATS}}
+        root = os.path.join(self.directory, subdirectory)
+        for name in sorted(os.listdir(root)):
+            path = f"{subdirectory}/{name}"
+            if not os.path.isfile(os.path.join(root, name)):
+                continue
+            made = [(extension, self.variant(path + extension, width))
+                    for extension in FORMATS for width in WIDTHS]
+            if any(variant is None for extension, variant in made):
+                continue
+            totals["source"] += os.path.getsize(os.path.join(root, name))
+            for extension, (cached, media_type, etag) in made:
+                totals[extension[1:]] += os.path.getsize(cached)
+        return totals
+
+
+def create_image_variants(directory: str = "static") -> ImageVariants:
+    """Variants are cached in IMAGE_CACHE_DIR (default image_cache/)"""
+    return ImageVariants(directory, os.environ.get("IMAGE_CACHE_DIR", "image_cache"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make the image variants ahead of time")
+    parser.add_argument("--static", default="static", help="Static directory holding images/")
+    parser.add_argument("--cache", default=os.environ.get("IMAGE_CACHE_DIR", "image_cache"))
+    args = parser.parse_args()
+    if Image is None:
+        parser.exit(1, "Pillow is not installed, so no variants can be made\n")
+    variants = ImageVariants(args.static, args.cache)
+    totals = variants.build()
+    print(f"Made {variants.made} variants in {args.cache}/")
+    print(f"Source images: {totals.pop('source'):,} bytes")
+    for name, size in totals.items():
+        print(f"{name} variants at {', '.join(map(str, WIDTHS))}px: {size:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
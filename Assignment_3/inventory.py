@@ -0,0 +1,148 @@
+"""
+Inventory module - index of products at or below the reorder threshold
+Products are kept sorted by (stock, product_id), lowest stock first, so the most
+urgent reorders are listed without scanning the catalog; threshold crossings are
+queued and published to admins by a background notifier
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Tuple
+
+from dashboard import LOW_STOCK_THRESHOLD
+
+NOTIFY_SECONDS = 5
+
+
+class StockIndex(ABC):
+    """Abstract base class for the low-stock index (Strategy Pattern)"""
+    
+    def __init__(self, threshold: int = LOW_STOCK_THRESHOLD):
+        self.threshold = threshold
+        self.alerts: Dict[int, int] = {}  # product_id -> stock, crossed below since the last notification
+        self._alerts_lock = threading.Lock()
+    
+    @abstractmethod
+    def update(self, levels: Dict[int, int]):
+        """Move products to their new stock levels in the index"""
+        pass
+    
+    @abstractmethod
+    def low_stock(self, limit: int = 50, offset: int = 0) -> List[Tuple[int, int]]:
+        """(product_id, stock) of products at or below the threshold, lowest stock first"""
+        pass
+    
+    @abstractmethod
+    def count(self) -> int:
+        """Number of products at or below the threshold"""
+        pass
+    
+    def close(self):
+        """Release any resources held by the index"""
+        pass
+    
+    def stock_changed(self, changes: Dict[int, Tuple[int, int]]):
+        """Apply (previous, current) stock levels and queue an alert for each product that fell to the threshold"""
+        self.update({product_id: current for product_id, (previous, current) in changes.items()})
+        threshold = self.threshold
+        with self._alerts_lock:
+            for product_id, (previous, current) in changes.items():
+                if current <= threshold and (previous > threshold or product_id in self.alerts):
+                    self.alerts[product_id] = current
+                elif current > threshold:
+                    self.alerts.pop(product_id, None)  # Restocked before anyone was told
+    
+    def take_alerts(self) -> Dict[int, int]:
+        with self._alerts_lock:
+            alerts, self.alerts = self.alerts, {}
+        return alerts
+    
+    async def run_notifier(self, notify: Callable[[Dict[int, int]], None], interval: float = NOTIFY_SECONDS):
+        """Hand the products that fell to the threshold to notify, in one batch per interval"""
+        while True:
+            await asyncio.sleep(interval)
+            alerts = self.take_alerts()
+            if not alerts:
+                continue
+            try:
+                notify(alerts)
+            except Exception as error:
+                print(f"Low-stock notification failed: {error}")
+
+
+class InMemoryStockIndex(StockIndex):
+    """Sorted list of the low-stock products only, so updates and listing cost O(log n) plus the low-stock count"""
+    
+    def __init__(self, threshold: int = LOW_STOCK_THRESHOLD):
+        super().__init__(threshold)
+        self.entries: List[Tuple[int, int]] = []  # (stock, product_id), ascending
+        self.levels: Dict[int, int] = {}  # product_id -> stock for every entry
+        self._lock = threading.Lock()
+    
+    def build(self, products):
+        """Index the current stock of every product"""
+        with self._lock:
+            self.levels = {product.product_id: product.stock for product in products
+                           if product.stock <= self.threshold}
+            self.entries = sorted((stock, product_id) for product_id, stock in self.levels.items())
+    
+    def update(self, levels: Dict[int, int]):
+        with self._lock:
+            for product_id, stock in levels.items():
+                previous = self.levels.pop(product_id, None)
+                if previous is not None:
+                    del self.entries[bisect_left(self.entries, (previous, product_id))]
+                if stock <= self.threshold:
+                    self.levels[product_id] = stock
+                    insort(self.entries, (stock, product_id))
+    
+    def low_stock(self, limit: int = 50, offset: int = 0) -> List[Tuple[int, int]]:
+        with self._lock:
+            return [(product_id, stock) for stock, product_id in self.entries[offset:offset + limit]]
+    
+    def count(self) -> int:
+        return len(self.entries)
+
+
+SELECT_LOW_STOCK = """SELECT product_id, stock FROM products WHERE stock <= ?
+    ORDER BY stock, product_id LIMIT ? OFFSET ?"""
+COUNT_LOW_STOCK = "SELECT COUNT(*) FROM products WHERE stock <= ?"
+
+
+class SQLiteStockIndex(StockIndex):
+    """Reads the shared products table through its (stock, product_id) index, which SQLite keeps up to date"""
+    
+    def __init__(self, path: str, threshold: int = LOW_STOCK_THRESHOLD):
+        super().__init__(threshold)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+    
+    def update(self, levels: Dict[int, int]):
+        pass  # Every stock write already updates the table index, whichever worker made it
+    
+    def low_stock(self, limit: int = 50, offset: int = 0) -> List[Tuple[int, int]]:
+        with self._lock:
+            return self._conn.execute(SELECT_LOW_STOCK, (self.threshold, limit, offset)).fetchall()
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(COUNT_LOW_STOCK, (self.threshold,)).fetchone()[0]
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_stock_index(storage) -> StockIndex:
+    """Pick the index matching STORE_BACKEND, using the same LOW_STOCK_THRESHOLD as the dashboard"""
+    threshold = int(os.environ.get("LOW_STOCK_THRESHOLD", LOW_STOCK_THRESHOLD))
+    if os.environ.get("STORE_BACKEND", "memory") == "sqlite":
+        return SQLiteStockIndex(os.environ.get("STORE_DB_PATH", "store.db"), threshold)
+    index = InMemoryStockIndex(threshold)
+    index.build(storage.get_all_products())
+    return index
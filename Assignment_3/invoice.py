@@ -3,22 +3,30 @@ Invoice module - handles invoice generation and tracking
 """
 
 from datetime import datetime
+from typing import Sequence
+from money import Money
 
 class Invoice:
     """Represents an invoice for an order"""
     
+    __slots__ = ("invoice_number", "order_id", "customer_name", "items", "total_amount",
+                 "issue_date", "due_date", "status")
+    
     _invoice_counter = 1000  # Start from 1000 for invoice numbers
     
-    def __init__(self, order_id: int, customer_name: str, items: list, total_amount: float):
-        self.invoice_number = Invoice._invoice_counter
-        Invoice._invoice_counter += 1
+    def __init__(self, order_id: int, customer_name: str, items: Sequence, total_amount: float,
+                invoice_number: int = None):
+        if invoice_number is None:
+            invoice_number = Invoice._invoice_counter
+            Invoice._invoice_counter += 1
+        self.invoice_number = invoice_number
         
         self.order_id = order_id
         self.customer_name = customer_name
-        self.items = items  # List of order items
-        self.total_amount = total_amount
+        self.items = items  # The order's LineItems, shared rather than copied
+        self.total_amount = Money.of(total_amount)
         self.issue_date = datetime.now()
-        self.due_date = datetime.now()  # In real system, this would be calculated
+        self.due_date = self.issue_date  # In real system, this would be calculated
         self.status = "Unpaid"
     
     def mark_as_paid(self):
@@ -34,8 +42,8 @@ class Invoice:
             "customer_name": self.customer_name,
             "issue_date": self.issue_date.strftime("%Y-%m-%d"),
             "due_date": self.due_date.strftime("%Y-%m-%d"),
-            "items": self.items,
-            "total_amount": self.total_amount,
+            "items": [item.get_details() for item in self.items],
+            "total_amount": float(self.total_amount),
             "status": self.status
         }
     
@@ -45,7 +53,7 @@ class Invoice:
         
         items_text = ""
         for item in self.items:
-            items_text += f"        {item['product_name']} x{item['quantity']} @ ${item['unit_price']:.2f} = ${item['line_total']:.2f}\n"
+            items_text += f"        {item.product_name} x{item.quantity} @ ${item.unit_price:.2f} = ${item.get_line_total():.2f}\n"
         
         return f"""
         =====================================
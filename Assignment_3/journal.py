@@ -0,0 +1,456 @@
+"""
+Journal module - in-memory storage made durable by an append-only journal
+Every change is appended to the journal as one JSON line and fsynced in batches by
+a background flusher; every snapshot_every records the whole store is written to a
+compact snapshot, so a restart loads the latest snapshot and replays only the
+records journaled after it
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where the journal directory is not locked
+    fcntl = None
+
+from product import Product
+from user import User, Customer, Admin
+from order import Order
+from order_item import LineItem
+from payment import Payment, create_payment_method
+from invoice import Invoice
+from receipt import Receipt
+from storage import InMemoryStorage
+
+FSYNC_SECONDS = 0.05  # Longest a record waits in the buffer before it is fsynced
+SNAPSHOT_EVERY = 10000  # Records journaled between snapshots
+SEGMENT = "journal-{:012d}.log"  # Numbered by the first record it holds
+SNAPSHOT = "snapshot-{:012d}.json"  # Numbered by the last record it includes
+LOCK = "journal.lock"  # Held by the one process using the directory
+QUARANTINED = ".quarantined"  # Added to segments left unreplayed after a torn record
+
+
+class JournalLocked(Exception):
+    """Raised when another process already has the journal directory open"""
+    pass
+
+
+# Records are plain dicts in the same shapes SQLiteStorage writes to its columns
+def product_record(product: Product) -> dict:
+    return {"product_id": product.product_id, "sku": product.sku, "name": product.name,
+            "price": float(product.price), "description": product.description, "stock": product.stock,
+            "active": product.active, "image_url": product.image_url}
+
+
+def product_from_record(record: dict) -> Product:
+    product = Product(record["product_id"], record["sku"], record["name"], record["price"],
+                      record["description"], record["stock"], record["image_url"])
+    product.active = record["active"]
+    return product
+
+
+def user_record(user: User) -> dict:
+    return {"user_id": user.user_id, "email": user.email, "password": user.password, "role": user.role,
+            "name": getattr(user, "name", ""), "address": getattr(user, "address", "")}
+
+
+def user_from_record(record: dict) -> User:
+    if record["role"] == "admin":
+        return Admin(record["user_id"], record["email"], record["password"])
+    return Customer(record["user_id"], record["email"], record["password"], record["name"], record["address"])
+
+
+def order_record(order: Order) -> dict:
+    return {"order_id": order.order_id, "customer_id": order.customer_id,
+            "order_date": order.order_date.isoformat(), "status": order.status,
+            "items": [item.get_details() for item in order.items]}
+
+
+def order_from_record(record: dict) -> Order:
+    order = Order(record["customer_id"], [LineItem.from_details(item) for item in record["items"]],
+                  order_id=record["order_id"])
+    order.order_date = datetime.fromisoformat(record["order_date"])
+    order.status = record["status"]
+    return order
+
+
+def line_details(items, shared: bool) -> Optional[list]:
+    """Details of each line, or None for lines shared with the stored order (rebuilt from it)"""
+    return None if shared else [item.get_details() for item in items]
+
+
+def payment_record(payment: Payment, shared: bool = False) -> dict:
+    receipt = None
+    if payment.receipt:
+        receipt = {"receipt_number": payment.receipt.receipt_number,
+                   "customer_name": payment.receipt.customer_name,
+                   "items": line_details(payment.receipt.items, shared),
+                   "issue_date": payment.receipt.issue_date.isoformat(),
+                   "printed": payment.receipt.printed}
+    return {"payment_id": payment.payment_id, "order_id": payment.order_id, "amount": float(payment.amount),
+            "method_type": payment.payment_method.method_type,
+            "method_reference": payment.payment_method.get_reference(), "status": payment.status,
+            "payment_date": payment.payment_date.isoformat(), "receipt": receipt}
+
+
+def payment_from_record(record: dict, items=None) -> Payment:
+    """Rebuild a payment; items are the order's LineItems, for a receipt whose lines were shared"""
+    method = create_payment_method(record["method_type"], record["method_reference"])
+    payment = Payment(record["order_id"], record["amount"], method, payment_id=record["payment_id"])
+    payment.status = record["status"]
+    payment.payment_date = datetime.fromisoformat(record["payment_date"])
+    data = record["receipt"]
+    if data:
+        if data["items"] is not None:
+            items = [LineItem.from_details(item) for item in data["items"]]
+        payment.receipt = Receipt(payment.payment_id, payment.order_id, data["customer_name"],
+                                  payment.amount, method.get_method_name(), items,
+                                  receipt_number=data["receipt_number"])
+        payment.receipt.issue_date = datetime.fromisoformat(data["issue_date"])
+        payment.receipt.printed = data["printed"]
+    return payment
+
+
+def invoice_record(invoice: Invoice, shared: bool = False) -> dict:
+    return {"order_id": invoice.order_id, "invoice_number": invoice.invoice_number,
+            "customer_name": invoice.customer_name, "items": line_details(invoice.items, shared),
+            "total_amount": float(invoice.total_amount), "issue_date": invoice.issue_date.isoformat(),
+            "due_date": invoice.due_date.isoformat(), "status": invoice.status}
+
+
+def invoice_from_record(record: dict, items=None) -> Invoice:
+    """Rebuild an invoice; items are the order's LineItems, for an invoice whose lines were shared"""
+    if record["items"] is not None:
+        items = [LineItem.from_details(item) for item in record["items"]]
+    invoice = Invoice(record["order_id"], record["customer_name"], items, record["total_amount"],
+                      invoice_number=record["invoice_number"])
+    invoice.issue_date = datetime.fromisoformat(record["issue_date"])
+    invoice.due_date = datetime.fromisoformat(record["due_date"])
+    invoice.status = record["status"]
+    return invoice
+
+
+class JournaledStorage(InMemoryStorage):
+    """InMemoryStorage that journals every change to a directory and recovers from it on start"""
+    
+    def __init__(self, directory: str = "journal", snapshot_every: int = SNAPSHOT_EVERY,
+                 fsync_seconds: float = FSYNC_SECONDS):
+        super().__init__()
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync_seconds = fsync_seconds
+        self.sequence = 0  # Number of the last record journaled
+        self.synced_sequence = 0  # Records up to this number are on disk
+        self.snapshot_sequence = 0  # Records up to this number are in the latest snapshot
+        
+        # Held across each change and its record, so the journal has changes in the order they were made
+        self._write_lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._retired: List = []  # Segments replaced by a newer one but not yet fsynced and closed
+        self._snapshotting = False
+        
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = self._lock_directory()
+        self._recover()
+        self._file = open(self._path(SEGMENT, self.sequence + 1), "a", encoding="utf-8")
+        self._closed = False
+        self._flusher = threading.Thread(target=self._run_flusher, name="journal-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)  # Also flush on a plain interpreter exit, not only on app shutdown
+    
+    def _lock_directory(self):
+        """Take the directory's exclusive lock, so a second process cannot recover (and truncate) a live journal"""
+        lock_file = open(os.path.join(self.directory, LOCK), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                raise JournalLocked(f"Journal {self.directory} is in use by another process")
+        return lock_file
+    
+    def _path(self, pattern: str, number: int) -> str:
+        return os.path.join(self.directory, pattern.format(number))
+    
+    def _numbered_files(self, pattern: str) -> List[Tuple[int, str]]:
+        """(number, path) of every file in the directory named after pattern, lowest number first"""
+        prefix, suffix = pattern.split("{")[0], pattern.split("}")[1]
+        files = []
+        for name in os.listdir(self.directory):
+            number = name[len(prefix):-len(suffix)]
+            if name.startswith(prefix) and name.endswith(suffix) and number.isdigit():
+                files.append((int(number), os.path.join(self.directory, name)))
+        return sorted(files)
+    
+    # Recovery
+    def _recover(self):
+        """Load the latest snapshot, then replay the journal records written after it"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))  # A snapshot interrupted before it was complete
+        snapshots = self._numbered_files(SNAPSHOT)
+        if snapshots:
+            with open(snapshots[-1][1], encoding="utf-8") as file:
+                self._load_snapshot(json.load(file))
+        segments = self._numbered_files(SEGMENT)
+        for position, (first, path) in enumerate(segments):
+            if os.path.getsize(path) == 0:
+                os.remove(path)  # Opened by a run that journaled nothing
+            elif not self._replay(path):
+                # Records after a torn one were never applied, so new records must not follow them
+                for later_first, later_path in segments[position + 1:]:
+                    os.replace(later_path, later_path + QUARANTINED)
+                    print(f"Journal segment {later_path} follows a torn record; kept as {later_path + QUARANTINED}")
+                break
+        self.synced_sequence = self.sequence
+    
+    def _load_snapshot(self, state: dict):
+        self.sequence = self.snapshot_sequence = state["sequence"]
+        self.counters.update(state["counters"])
+        for record in state["products"]:
+            InMemoryStorage.add_product(self, product_from_record(record))
+        self.catalog_changes = state["catalog_changes"]
+        for record in state["users"]:
+            InMemoryStorage.add_user(self, user_from_record(record))
+        for record in state["orders"]:
+            InMemoryStorage.add_order(self, order_from_record(record))
+        for record in state["payments"]:
+            InMemoryStorage.add_payment(self, payment_from_record(record, self._order_items(record)))
+        for record in state["invoices"]:
+            InMemoryStorage.add_invoice(self, invoice_from_record(record, self._order_items(record)))
+    
+    def _order_items(self, record: dict) -> Optional[tuple]:
+        """The stored order's LineItems, for an invoice or receipt record that shared them"""
+        order = self.orders.get(record["order_id"])
+        return order.items if order is not None else None
+    
+    def _shares_lines(self, order_id: int, items) -> bool:
+        """True if an invoice or receipt holds its order's own LineItems, so they need not be written twice"""
+        order = self.orders.get(order_id)
+        return order is not None and order.items is items
+    
+    def _payment_record(self, payment: Payment) -> dict:
+        return payment_record(payment, payment.receipt is not None and
+                              self._shares_lines(payment.order_id, payment.receipt.items))
+    
+    def _invoice_record(self, invoice: Invoice) -> dict:
+        return invoice_record(invoice, self._shares_lines(invoice.order_id, invoice.items))
+    
+    def _replay(self, path: str) -> bool:
+        """Apply a segment's records that are newer than the store; False if it ended in a torn record"""
+        with open(path, "rb+") as file:
+            position = 0
+            for line in file:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    # The write of this record was cut short by a crash, so it was never acknowledged
+                    file.truncate(position)
+                    return False
+                position += len(line)
+                if record["seq"] > self.sequence:
+                    self._apply(record["op"], record["data"])
+                    self.sequence = record["seq"]
+        return True
+    
+    def _apply(self, op: str, data):
+        """Redo one journaled change, bypassing the journal"""
+        if op == "id":
+            self.counters[data["kind"]] = max(self.counters[data["kind"]], data["value"] + 1)
+        elif op == "product":
+            InMemoryStorage.add_product(self, product_from_record(data))
+        elif op == "stock":
+            for product_id, stock in data.items():
+                self.products[int(product_id)].stock = stock
+            self.catalog_changes += 1
+        elif op == "user":
+            InMemoryStorage.add_user(self, user_from_record(data))
+        elif op == "order":
+            order = self.orders.get(data["order_id"])
+            if order is None:
+                InMemoryStorage.add_order(self, order_from_record(data))
+            else:
+                # Lines never change once placed, so the invoice and receipt keep sharing them
+                order.status = data["status"]
+                InMemoryStorage.update_order(self, order)
+        elif op == "payment":
+            InMemoryStorage.add_payment(self, payment_from_record(data, self._order_items(data)))
+        elif op == "invoice":
+            InMemoryStorage.add_invoice(self, invoice_from_record(data, self._order_items(data)))
+    
+    # Writing
+    def _append(self, op: str, data):
+        """Journal one change; called with the write lock held, right after making the change"""
+        self.sequence += 1
+        self._file.write(json.dumps({"seq": self.sequence, "op": op, "data": data}, separators=(",", ":")) + "\n")
+        if self.sequence - self.snapshot_sequence >= self.snapshot_every and not self._snapshotting:
+            self._snapshotting = True  # One snapshot at a time; a slow one just makes the next come later
+            threading.Thread(target=self.snapshot, name="journal-snapshot", daemon=True).start()
+    
+    def sync(self):
+        """Flush buffered records and fsync them; fsync runs outside the write lock so changes continue"""
+        with self._sync_lock:
+            with self._write_lock:
+                if self.synced_sequence == self.sequence and not self._retired:
+                    return
+                sequence = self.sequence
+                self._file.flush()
+                files, self._retired = self._retired + [self._file], []
+            for file in files:
+                os.fsync(file.fileno())
+            for file in files[:-1]:
+                file.close()
+            self.synced_sequence = sequence
+    
+    def _run_flusher(self):
+        while not self._closed:
+            time.sleep(self.fsync_seconds)
+            try:
+                self.sync()
+            except Exception as error:
+                print(f"Journal fsync failed: {error}")
+    
+    def snapshot(self):
+        """Write the whole store to a snapshot file and drop the journal segments it covers"""
+        try:
+            self._write_snapshot()
+        finally:
+            self._snapshotting = False
+    
+    def _write_snapshot(self):
+        with self._snapshot_lock:
+            with self._write_lock:
+                # Only the lists are copied under the lock; records are built afterwards. An object
+                # changed meanwhile may be newer than the snapshot, which replaying its record fixes
+                sequence = self.sequence
+                state = {"sequence": sequence, "counters": dict(self.counters),
+                         "catalog_changes": self.catalog_changes}
+                objects = {"products": list(self.products.values()), "users": list(self.users.values()),
+                           "orders": [self.orders[order_id] for order_id in self.order_ids],
+                           "payments": [self.payments[payment_id] for payment_id in self.payment_ids],
+                           "invoices": [self.invoices[order_id] for order_id in self.invoice_order_ids]}
+                self._file.flush()
+                self._retired.append(self._file)
+                self._file = open(self._path(SEGMENT, sequence + 1), "a", encoding="utf-8")
+                self.snapshot_sequence = max(self.snapshot_sequence, sequence)
+            
+            state["products"] = [product_record(product) for product in objects["products"]]
+            state["users"] = [user_record(user) for user in objects["users"]]
+            state["orders"] = [order_record(order) for order in objects["orders"]]
+            state["payments"] = [self._payment_record(payment) for payment in objects["payments"]]
+            state["invoices"] = [self._invoice_record(invoice) for invoice in objects["invoices"]]
+            
+            path = self._path(SNAPSHOT, sequence)
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(state, file, separators=(",", ":"))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path + ".tmp", path)
+            # Older files are only removed once the snapshot replacing them is safely on disk
+            for number, old_path in self._numbered_files(SEGMENT):
+                if number <= sequence:
+                    os.remove(old_path)
+            for number, old_path in self._numbered_files(SNAPSHOT):
+                if number < sequence:
+                    os.remove(old_path)
+    
+    def save_batch(self, changes):
+        with self._write_lock:
+            super().save_batch(changes)  # Journaled as one run of records
+    
+    def next_id(self, kind: str) -> int:
+        with self._write_lock:
+            value = super().next_id(kind)
+            self._append("id", {"kind": kind, "value": value})
+        return value
+    
+    # Product operations
+    def add_product(self, product: Product):
+        with self._write_lock:
+            super().add_product(product)
+            self._append("product", product_record(product))
+    
+    def update_product(self, product: Product):
+        with self._write_lock:
+            if product.product_id in self.products:
+                super().update_product(product)
+                self._append("product", product_record(product))
+    
+    def adjust_stock(self, product: Product, quantity: int):
+        with self._write_lock:
+            super().adjust_stock(product, quantity)
+            self._append("stock", {product.product_id: product.stock})
+    
+    def reserve_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        with self._write_lock:
+            levels = super().reserve_stock(quantities)
+            self._append("stock", levels)
+        return levels
+    
+    def release_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        with self._write_lock:
+            levels = super().release_stock(quantities)
+            self._append("stock", levels)
+        return levels
+    
+    # User operations
+    def add_user(self, user: User):
+        with self._write_lock:
+            super().add_user(user)
+            self._append("user", user_record(user))
+    
+    # Order operations
+    def add_order(self, order):
+        with self._write_lock:
+            super().add_order(order)
+            self._append("order", order_record(order))
+    
+    def update_order(self, order):
+        with self._write_lock:
+            if order.order_id in self.orders:
+                super().update_order(order)
+                self._append("order", order_record(order))
+    
+    # Payment operations
+    def add_payment(self, payment):
+        with self._write_lock:
+            super().add_payment(payment)
+            self._append("payment", self._payment_record(payment))
+    
+    def update_payment(self, payment):
+        with self._write_lock:
+            if payment.payment_id in self.payments:
+                super().update_payment(payment)
+                self._append("payment", self._payment_record(payment))
+    
+    # Invoice operations
+    def add_invoice(self, invoice):
+        with self._write_lock:
+            super().add_invoice(invoice)
+            self._append("invoice", self._invoice_record(invoice))
+    
+    def update_invoice(self, invoice):
+        with self._write_lock:
+            if invoice.order_id in self.invoices:
+                super().update_invoice(invoice)
+                self._append("invoice", self._invoice_record(invoice))
+    
+    def close(self):
+        """Stop the flusher, let a running snapshot finish and fsync whatever is still buffered"""
+        self._closed = True
+        self._flusher.join()
+        with self._snapshot_lock:
+            pass
+        self.sync()
+        with self._write_lock:
+            self._file.close()
+        self._lock_file.close()  # Releases the directory lock
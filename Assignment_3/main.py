@@ -3,22 +3,41 @@ Main Application Entry Point
 Simple convenience store system for Assignment 3
 """
 
-from fastapi import FastAPI, HTTPException, Form
-from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
-from typing import Optional
+from fastapi import FastAPI, HTTPException, Body, Form, Header, Request
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, Response, StreamingResponse
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, time
+import asyncio
 import os
+from urllib.parse import parse_qs
 
 # Import our classes
+from money import Money
 from product import Product
 from user import User, Customer, Admin
 from shopping_cart import ShoppingCart
 from order import Order
-from order_item import OrderItem
-from payment import Payment, DigitalWallet, BankDebit, PayPal
+from order_item import LineItem
+from payment import Payment, create_payment_method
 from invoice import Invoice
 from receipt import Receipt
 from database import Database
+from storage import InsufficientStockError
+from session_store import create_session_store
+from catalog import CatalogCache, etag_matches
+from export import EXPORTS, FORMATS, stream_export
+from events import create_event_broker
+from payment_gateway import GatewayUnavailable, create_payment_gateways
+from idempotency import IdempotencyConflict, create_idempotency_store, fingerprint
+from metrics import CONTENT_TYPE, MetricsMiddleware, MetricsRegistry
+from profiling import ProfilingMiddleware, create_profiler
+from analytics import INTERVALS, create_sales_ledger
+from dashboard import create_dashboard
+from inventory import create_stock_index
+from search import create_search_index
+from assets import AssetStore
+from images import CACHE_CONTROL as IMAGE_CACHE_CONTROL, create_image_variants
+from group_commit import NotDurable, create_group_committer
 
 # Create FastAPI app
 app = FastAPI(title="Convenience Store", version="1.0.0")
@@ -26,27 +45,172 @@ app = FastAPI(title="Convenience Store", version="1.0.0")
 # Initialize database
 db = Database()
 
-# Session storage (simplified - in-memory)
-sessions = {}  # session_id -> user_id
-carts = {}     # user_id -> ShoppingCart
-
-# Create static directory if it doesn't exist
-os.makedirs("static", exist_ok=True)
-
-# Mount static files
-try:
-    app.mount("/static", StaticFiles(directory="static"), name="static")
-except:
-    pass  # Directory might not exist yet
+# Checkout writes saved in batches shared by concurrent checkouts
+commits = create_group_committer(db)
+
+# Session and cart storage (shared between workers when STORE_BACKEND=sqlite)
+session_store = create_session_store(db.get_product)
+
+# Resized product images, made on first request and cached on disk
+images = create_image_variants("static")
+
+
+def product_details(product: Product) -> dict:
+    """A product's details with the smaller WebP/JPEG versions of its image, for srcset"""
+    details = product.get_details()
+    details["image_variants"] = images.urls(product.image_url)
+    return details
+
+
+# Product listing serialized once per catalog change
+catalog = CatalogCache(db, product_details)
+
+# Inverted index behind /api/products/search, updated on admin edits and stock changes
+product_search = create_search_index(db)
+
+# Live product and order updates pushed to connected clients
+broker = create_event_broker()
+
+# Asynchronous clients for the payment providers
+gateways = create_payment_gateways()
+
+# Checkout results replayed for retries that reuse an Idempotency-Key
+idempotency = create_idempotency_store()
+
+# Columnar ledger of order lines behind the admin sales reports
+sales = create_sales_ledger()
+
+# Headline counters for the admin dashboard, adjusted as orders, invoices and stock change
+dashboard = create_dashboard(db)
+
+# Products at or below the reorder threshold, most urgent first
+stock_index = create_stock_index(db)
+
+# Request latency and store activity, scraped from /metrics
+metrics = MetricsRegistry()
+app.add_middleware(MetricsMiddleware, registry=metrics)
+orders_placed = metrics.counter("store_orders_placed_total", "Orders placed and paid")
+payment_failures = metrics.counter("store_payment_failures_total",
+                                   "Checkouts whose payment did not go through", ("reason",))
+stock_outs = metrics.counter("store_stock_outs_total", "Checkouts rejected for insufficient stock")
+cart_sizes = metrics.histogram("store_checkout_cart_items", "Units in each cart taken to checkout",
+                               buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+stock_alerts = metrics.counter("store_stock_alerts_total", "Products reported to admins as low on stock")
+unsaved_payments = metrics.counter("store_unsaved_payments_total",
+                                   "Payments taken for checkouts that could not be saved, to be refunded")
+idempotent_replays = metrics.counter("store_idempotent_replays_total",
+                                     "Checkout retries answered from an earlier result")
+metrics.callback("store_commit_batches_total", "Batches of checkout writes saved together",
+                 lambda: commits.batches, metric_type="counter")
+metrics.callback("store_committed_checkouts_total", "Checkouts saved by the group committer",
+                 lambda: commits.committed, metric_type="counter")
+metrics.callback("store_sessions", "Live login sessions", lambda: session_store.live_counts()[0])
+metrics.callback("store_carts", "Live shopping carts", lambda: session_store.live_counts()[1])
+metrics.callback("store_session_removals_total", "Sessions and carts removed by expiry or LRU eviction",
+                 lambda: {tuple(key.split("_")): value for key, value in session_store.counters.items()},
+                 ("kind", "reason"), metric_type="counter")
+metrics.callback("store_event_subscribers", "Clients connected to the live update stream",
+                 lambda: len(broker.subscriptions))
+metrics.callback("payment_gateway_events_total", "Payment gateway charges, attempts, retries and failures",
+                 lambda: {(method, event): value for method, gateway in gateways.items()
+                          for event, value in gateway.stats.items()},
+                 ("method", "event"), metric_type="counter")
+
+def is_admin_request(scope) -> bool:
+    """Whether a request carries the session_id of an admin"""
+    session_ids = parse_qs(scope["query_string"].decode("latin-1")).get("session_id")
+    user_id = session_store.get_user_id(session_ids[0]) if session_ids else None
+    user = db.get_user(user_id) if user_id else None
+    return user is not None and user.role == "admin"
+
+
+# Sampled stack profiles of admin requests sent with X-Profile: 1 (PROFILING=header), or every request (all)
+profiler = create_profiler()
+app.add_middleware(ProfilingMiddleware, profiler=profiler, mode=os.environ.get("PROFILING", "off"),
+                   secret=os.environ.get("PROFILE_SECRET"), authorize=is_admin_request)
+
+# Static files, fingerprinted and compressed once at startup
+assets = AssetStore("static")
+
+
+def publish_product(product: Product):
+    """Push a product's current price and stock to connected clients"""
+    broker.publish("product", {
+        "product_id": product.product_id,
+        "name": product.name,
+        "price": float(product.price),
+        "stock": product.stock,
+        "active": product.active,
+        "available": product.is_available()
+    })
+
+
+def publish_order(order: Order):
+    """Push an order's status to its customer and to admins"""
+    broker.publish("order", {
+        "order_id": order.order_id,
+        "customer_id": order.customer_id,
+        "status": order.status,
+        "total": float(order.total)
+    })
+
+
+def record_stock_changes(changes: Dict[int, Tuple[int, int]]):
+    """Pass (previous, current) stock levels to the dashboard, the low-stock index and search"""
+    dashboard.stock_changed(changes.values())
+    stock_index.stock_changed(changes)
+    product_search.stock_changed({product_id: current for product_id, (previous, current) in changes.items()})
+
+
+def release_reserved_stock(cart: ShoppingCart, quantities: Dict[int, int]):
+    """Put back the stock reserved for a checkout that did not go through"""
+    levels = db.release_stock(quantities)
+    record_stock_changes({product_id: (levels[product_id] - quantity, levels[product_id])
+                          for product_id, quantity in quantities.items()})
+    for item in cart.lines.values():
+        publish_product(item.product)
+
+
+def notify_low_stock(alerts: Dict[int, int]):
+    """Tell connected admins which products just fell to the reorder threshold, lowest stock first"""
+    rows = [{"product_id": product_id, "stock": stock}
+            for product_id, stock in sorted(alerts.items(), key=lambda item: (item[1], item[0]))]
+    broker.publish("stock_alert", {"threshold": stock_index.threshold, "products": name_products(rows)})
+    stock_alerts.inc(len(rows))
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    """Expire idle sessions and abandoned carts in the background"""
+    app.state.session_sweeper = asyncio.create_task(session_store.run_sweeper())
+
+
+@app.on_event("startup")
+async def start_low_stock_notifier():
+    """Report products that fall to the reorder threshold in the background"""
+    app.state.low_stock_notifier = asyncio.create_task(stock_index.run_notifier(notify_low_stock))
+
+
+@app.on_event("shutdown")
+async def close_database():
+    """Save queued checkouts and make sure buffered journal records reach the disk before exiting"""
+    commits.close()
+    db.close()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
 
 
 # Root endpoint - serve HTML
 @app.get("/", response_class=HTMLResponse)
-async def root():
+async def root(request: Request):
     """Serve the main HTML page"""
-    html_path = "static/index.html"
-    if os.path.exists(html_path):
-        return FileResponse(html_path)
+    response = assets.index_response(request.headers.get("accept-encoding"), request.headers.get("if-none-match"))
+    if response is not None:
+        return response
     return """
     <html>
         <head><title>Convenience Store</title></head>
@@ -59,6 +223,28 @@ async def root():
     """
 
 
+@app.get("/static/{path:path}")
+async def get_static(path: str, request: Request):
+    """Serve a static file; fingerprinted URLs are cached for good, plain ones revalidated"""
+    response = assets.response(path, request.headers.get("accept-encoding"), request.headers.get("if-none-match"))
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
+
+
+@app.get("/thumbnails/{width}/{path:path}")
+async def get_thumbnail(width: int, path: str, request: Request):
+    """Serve a resized product image variant, making and caching it on first request"""
+    variant = await asyncio.to_thread(images.variant, path, width)
+    if variant is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    cached, media_type, etag = variant
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(cached, media_type=media_type, headers=headers)
+
+
 #  AUTHENTICATION ENDPOINTS 
 
 @app.post("/api/login")
@@ -69,13 +255,11 @@ async def login(email: str = Form(...), password: str = Form(...)):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create session
-    session_id = f"session_{user.user_id}"
-    sessions[session_id] = user.user_id
+    session_id = session_store.create_session(user.user_id)
     
     # Initialize cart for customer
     if user.role == "customer":
-        if user.user_id not in carts:
-            carts[user.user_id] = ShoppingCart(user.user_id)
+        session_store.get_cart(user.user_id)
     
     return {
         "message": "Login successful",
@@ -87,18 +271,51 @@ async def login(email: str = Form(...), password: str = Form(...)):
 @app.post("/api/logout")
 async def logout(session_id: str):
     """User logout"""
-    if session_id in sessions:
-        del sessions[session_id]
+    session_store.delete_session(session_id)
     return {"message": "Logout successful"}
 
 
 # PRODUCT ENDPOINTS 
 
 @app.get("/api/products")
-async def get_products():
+async def get_products(request: Request):
     """Get all active products"""
-    products = db.get_all_products()
-    return [p.get_details() for p in products if p.active]
+    etag, body = catalog.get_snapshot()
+    # no-cache makes browsers revalidate, so unchanged catalogs cost a 304 with no body
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/api/products/search")
+async def search_products(
+    q: str = "",
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    available: Optional[bool] = None,
+    category: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0
+):
+    """Search active products by name, description or SKU, filtered by price, stock and SKU category"""
+    product_search.sync(db)
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    try:
+        price_range = [Money.of(price) if price is not None else None for price in (min_price, max_price)]
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    product_ids, total, categories = product_search.search(q, *price_range, available, category, limit, offset)
+    products = [db.get_product(product_id) for product_id in product_ids]
+    return {
+        "query": q,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "products": [product_details(product) for product in products if product],
+        "facets": {"category": categories}
+    }
 
 
 @app.get("/api/products/{product_id}")
@@ -107,7 +324,25 @@ async def get_product(product_id: int):
     product = db.get_product(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product.get_details()
+    return product_details(product)
+
+
+# LIVE UPDATES
+
+@app.get("/api/events")
+async def stream_events(request: Request, session_id: str):
+    """Server-Sent Events stream of product and order changes"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    subscription = broker.subscribe(user_id, user.role == "admin")
+    return StreamingResponse(
+        broker.stream(subscription, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # CART ENDPOINTS 
@@ -115,28 +350,26 @@ async def get_product(product_id: int):
 @app.get("/api/cart")
 async def get_cart(session_id: str):
     """Get shopping cart"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    cart = carts.get(user_id)
-    if not cart:
-        cart = ShoppingCart(user_id)
-        carts[user_id] = cart
+    cart = session_store.get_cart(user_id)
+    items = cart.get_items()
     
     return {
-        "items": cart.get_items(),
-        "total": cart.get_total(),
+        "items": items,
+        "total": float(cart.get_total()),
         "item_count": cart.get_item_count(),
         # can_checkout is true only if every item has stock_ok
-        "can_checkout": all((item.get("stock_ok", True) for item in cart.get_items()))
+        "can_checkout": all((item.get("stock_ok", True) for item in items))
     }
 
 
 @app.post("/api/cart/add")
 async def add_to_cart(session_id: str, product_id: int = Form(...), quantity: int = Form(1)):
     """Add item to cart"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -144,12 +377,10 @@ async def add_to_cart(session_id: str, product_id: int = Form(...), quantity: in
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    cart = carts.get(user_id)
-    if not cart:
-        cart = ShoppingCart(user_id)
-        carts[user_id] = cart
+    cart = session_store.get_cart(user_id)
     
     if cart.add_item(product, quantity):
+        session_store.save_cart(cart)
         return {"message": "Item added to cart", "cart": cart.get_items()}
     else:
         raise HTTPException(status_code=400, detail="Cannot add item (out of stock or invalid quantity)")
@@ -158,32 +389,57 @@ async def add_to_cart(session_id: str, product_id: int = Form(...), quantity: in
 @app.put("/api/cart/update")
 async def update_cart(session_id: str, product_id: int = Form(...), quantity: int = Form(...)):
     """Update cart item quantity"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    cart = carts.get(user_id)
+    cart = session_store.get_cart(user_id, create=False)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     
     if cart.update_item_quantity(product_id, quantity):
+        session_store.save_cart(cart)
         return {"message": "Cart updated", "cart": cart.get_items()}
     else:
         raise HTTPException(status_code=400, detail="Cannot update item")
 
 
+@app.put("/api/cart/items")
+async def set_cart_quantities(session_id: str, quantities: Dict[int, int] = Body(..., embed=True)):
+    """Set the quantity of many products at once (0 removes a line), e.g. for bulk orders"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    cart = session_store.get_cart(user_id)
+    products = {product_id: db.get_product(product_id)
+                for product_id, quantity in quantities.items()
+                if quantity > 0 and product_id not in cart.lines}
+    rejected = cart.set_quantities(quantities, products)
+    session_store.save_cart(cart)
+    
+    return {
+        "message": "Cart updated",
+        "cart": cart.get_items(),
+        "total": float(cart.get_total()),
+        "item_count": cart.get_item_count(),
+        "rejected": [{"product_id": product_id, "reason": reason} for product_id, reason in rejected.items()]
+    }
+
+
 @app.delete("/api/cart/remove/{product_id}")
 async def remove_from_cart(session_id: str, product_id: int):
     """Remove item from cart"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    cart = carts.get(user_id)
+    cart = session_store.get_cart(user_id, create=False)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     
     if cart.remove_item(product_id):
+        session_store.save_cart(cart)
         return {"message": "Item removed", "cart": cart.get_items()}
     else:
         raise HTTPException(status_code=404, detail="Item not found in cart")
@@ -194,36 +450,72 @@ async def remove_from_cart(session_id: str, product_id: int):
 @app.post("/api/checkout")
 async def checkout(
     session_id: str, 
+    response: Response,
     payment_method: str = Form(...), 
-    payment_details: str = Form(...)
+    payment_details: str = Form(...),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    """Process checkout"""
-    user_id = sessions.get(session_id)
+    """Process checkout; retries sending the same Idempotency-Key get the first result"""
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    cart = carts.get(user_id)
-    if not cart or not cart.items:
+    if not idempotency_key:
+        return await place_order(user_id, payment_method, payment_details)
+    
+    async def attempt():
+        try:
+            return 200, await place_order(user_id, payment_method, payment_details)
+        except HTTPException as error:
+            if error.status_code >= 500:
+                raise  # Provider outages are not replayed, so a retry tries again
+            return error.status_code, {"detail": error.detail}
+    
+    # Keys are scoped to the user so clients cannot collide with each other
+    try:
+        (status_code, body), replayed = await idempotency.run(
+            f"{user_id}:{idempotency_key}", fingerprint(payment_method, payment_details), attempt)
+    except IdempotencyConflict as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    
+    if replayed:
+        idempotent_replays.inc()
+        response.headers["Idempotent-Replayed"] = "true"
+    if status_code != 200:
+        raise HTTPException(status_code=status_code, detail=body["detail"],
+                            headers={"Idempotent-Replayed": "true"} if replayed else None)
+    return body
+
+
+async def place_order(user_id: int, payment_method: str, payment_details: str) -> dict:
+    """Reserve stock, create the order and invoice, and take payment for the user's cart"""
+    cart = session_store.get_cart(user_id, create=False)
+    if not cart or not cart.lines:
         raise HTTPException(status_code=400, detail="Cart is empty")
     
-    # Create order from cart
-    # Validate stock before creating order
-    for item in cart.items:
-        if item.product.stock <= 0:
-            raise HTTPException(status_code=400, detail=f"{item.product.name} is out of stock")
-        if item.quantity > item.product.stock:
-            raise HTTPException(status_code=400, detail=f"{item.product.name} has exceeded limited stock (Instock: {item.product.stock})")
-
-    order_items = [OrderItem(item.product, item.quantity) for item in cart.items]
-    order = Order(user_id, order_items)
+    pay_method = create_payment_method(payment_method, payment_details)
+    if pay_method is None:
+        raise HTTPException(status_code=400, detail="Invalid payment method")
     
-    # Reduce stock
-    for item in order.items:
-        item.product.update_stock(-item.quantity)
-        db.update_product(item.product)
+    # Check and reduce stock for the whole cart in one step so concurrent checkouts can't oversell
+    quantities = cart.get_quantities()
+    cart_sizes.observe(sum(quantities.values()))
+    try:
+        levels = db.reserve_stock(quantities)
+    except InsufficientStockError as error:
+        stock_outs.inc()
+        raise HTTPException(status_code=400, detail=str(error))
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    record_stock_changes({product_id: (levels[product_id] + quantity, levels[product_id])
+                          for product_id, quantity in quantities.items()})
+    for item in cart.lines.values():
+        publish_product(item.product)
     
-    # Save order
-    db.add_order(order)
+    # Create order from cart
+    order_items = [LineItem.of(item.product, item.quantity) for item in cart.lines.values()]
+    order = Order(user_id, order_items, order_id=db.next_id("order"))
+    dashboard.order_added(order)
     
     # Get customer info for invoice and receipt
     user = db.get_user(user_id)
@@ -233,64 +525,140 @@ async def checkout(
     invoice = Invoice(
         order_id=order.order_id,
         customer_name=customer_name,
-        items=[item.get_details() for item in order.items],
-        total_amount=order.total
+        items=order.items,
+        total_amount=order.total,
+        invoice_number=db.next_id("invoice")
     )
-    db.add_invoice(invoice)
+    dashboard.invoice_added(invoice)
     
     # Create payment
-    if payment_method == "wallet":
-        pay_method = DigitalWallet(payment_details)
-    elif payment_method == "bank":
-        pay_method = BankDebit(payment_details)
-    elif payment_method == "paypal":
-        pay_method = PayPal(payment_details)
-    else:
-        raise HTTPException(status_code=400, detail="Invalid payment method")
-    
-    payment = Payment(order.order_id, order.total, pay_method)
+    payment = Payment(order.order_id, order.total, pay_method, payment_id=db.next_id("payment"))
+    try:
+        paid = await payment.process_async(gateways[pay_method.method_type])
+    except GatewayUnavailable:
+        paid = None
     
-    if payment.process():
+    if paid:
         # Mark invoice as paid
         invoice.mark_as_paid()
+        dashboard.invoice_paid(invoice)
         
         # Generate receipt after successful payment with items list
-        receipt = payment.generate_receipt(customer_name, items=[item.get_details() for item in order.items])
+        receipt = payment.generate_receipt(customer_name, items=order.items,
+                                           receipt_number=db.next_id("receipt"))
         
-        db.add_payment(payment)
+        # Order, invoice and payment are saved together, and the customer only hears back once they are durable
+        try:
+            await commits.save([("add_order", order), ("add_invoice", invoice), ("add_payment", payment)])
+        except NotDurable as error:
+            # The order is stored and journaled, so it stands; undoing it here would oversell after a replay
+            print(f"Order #{order.order_id} was saved but may not be on disk: {error}")
+        except Exception as error:
+            # The card was charged for an order that was not saved: undo the checkout and leave the
+            # charge for reconciliation; a 503 is not replayed, so the client can retry
+            release_reserved_stock(cart, quantities)
+            dashboard.order_removed(order)
+            dashboard.invoice_removed(invoice)
+            unsaved_payments.inc()
+            print(f"Payment #{payment.payment_id} of {payment.amount} for order #{order.order_id} "
+                  f"was taken but not saved and needs a refund: {error}")
+            raise HTTPException(status_code=503, detail="Could not save the order, please try again")
         cart.clear()  # Clear cart after successful checkout
+        session_store.save_cart(cart)
+        sales.record_order(order)
+        publish_order(order)
+        orders_placed.inc()
         return {
             "message": "Order placed successfully",
             "order": order.get_details(),
             "payment": payment.get_details()
         }
     else:
+        # Put the reserved stock back and cancel the unpaid order
+        release_reserved_stock(cart, quantities)
+        order.update_status("Cancelled")
+        dashboard.order_status_changed(order, "Placed")
+        try:
+            await commits.save([("add_order", order), ("add_invoice", invoice)])
+        except NotDurable as error:
+            print(f"Cancelled order #{order.order_id} was saved but may not be on disk: {error}")
+        except Exception as error:
+            dashboard.order_removed(order)
+            dashboard.invoice_removed(invoice)
+            print(f"Cancelled order #{order.order_id} was not saved: {error}")
+            raise HTTPException(status_code=503, detail="Could not save the order, please try again")
+        sales.record_order(order)
+        publish_order(order)
+        payment_failures.inc("unavailable" if paid is None else "declined")
+        if paid is None:
+            raise HTTPException(status_code=503, detail="Payment provider unavailable, please try again")
         raise HTTPException(status_code=400, detail="Payment failed")
 
 
+def parse_date_filter(value: Optional[str], end_of_day: bool = False) -> Optional[datetime]:
+    """Parse a YYYY-MM-DD or ISO datetime query parameter"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    # A bare date as the upper bound includes the whole day
+    if end_of_day and len(value) == 10:
+        parsed = datetime.combine(parsed.date(), time.max)
+    return parsed
+
+
 @app.get("/api/orders")
-async def get_orders(session_id: str):
-    """Get user's orders"""
-    user_id = sessions.get(session_id)
+async def get_orders(
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    status: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+):
+    """Get one page of the user's orders (all orders for admin), newest first"""
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     user = db.get_user(user_id)
     
     if user.role == "customer":
-        orders = db.get_orders_by_customer(user_id)
-    elif user.role == "admin":
-        orders = db.get_all_orders()
-    else:
+        customer_id = user_id  # Customers only ever see their own orders
+    elif user.role != "admin":
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    return [order.get_details() for order in orders]
+    before_id = None
+    if cursor:
+        if not cursor.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        before_id = int(cursor)
+    limit = max(1, min(limit, 100))
+    
+    # Fetch one extra order to know whether another page exists
+    orders = db.query_orders(
+        customer_id=customer_id,
+        status=status,
+        date_from=parse_date_filter(date_from),
+        date_to=parse_date_filter(date_to, end_of_day=True),
+        before_id=before_id,
+        limit=limit + 1
+    )
+    next_cursor = str(orders[limit - 1].order_id) if len(orders) > limit else None
+    
+    return {
+        "orders": [order.get_details() for order in orders[:limit]],
+        "next_cursor": next_cursor
+    }
 
 
 @app.get("/api/orders/{order_id}")
 async def get_order(session_id: str, order_id: int):
     """Get order details"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -309,7 +677,7 @@ async def get_order(session_id: str, order_id: int):
 @app.get("/api/orders/{order_id}/receipt")
 async def get_order_receipt(session_id: str, order_id: int):
     """Get receipt for an order"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -336,7 +704,7 @@ async def get_order_receipt(session_id: str, order_id: int):
 @app.get("/api/orders/{order_id}/invoice")
 async def get_order_invoice(session_id: str, order_id: int):
     """Get invoice for an order"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -362,7 +730,7 @@ async def update_product(
     stock: Optional[int] = Form(None)
 ):
     """Admin: Update product"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -377,20 +745,229 @@ async def update_product(
     if name:
         product.name = name
     if price is not None:
-        product.price = price
+        try:
+            product.price = Money.of(price)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
     if description:
         product.description = description
-    if stock is not None:
-        product.stock = stock
-    
     db.update_product(product)
-    return {"message": "Product updated", "product": product.get_details()}
+    previous_stock = product.stock
+    if stock is not None and stock != previous_stock:
+        # Apply the difference, so a checkout that took stock since it was read is not overwritten
+        db.adjust_stock(product, stock - previous_stock)
+    product_search.update(product)
+    record_stock_changes({product.product_id: (previous_stock, product.stock)})
+    publish_product(product)
+    return {"message": "Product updated", "product": product_details(product)}
+
+
+@app.get("/api/admin/dashboard")
+async def get_dashboard(session_id: str):
+    """Admin: Today's revenue, orders by status, low-stock products and unpaid invoices"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return dashboard.snapshot()
+
+
+@app.get("/api/admin/products/low-stock")
+async def get_low_stock(session_id: str, limit: int = 50, offset: int = 0):
+    """Admin: Products at or below the reorder threshold, lowest stock first"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    rows = stock_index.low_stock(max(1, min(limit, 200)), max(0, offset))
+    return {
+        "threshold": stock_index.threshold,
+        "total": stock_index.count(),
+        "products": name_products([{"product_id": product_id, "stock": stock} for product_id, stock in rows])
+    }
+
+
+@app.get("/api/admin/sessions")
+async def get_session_stats(session_id: str):
+    """Admin: Live session and cart counts with expiry and eviction totals"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return session_store.stats()
+
+
+@app.get("/api/admin/profiles")
+async def list_profiles(session_id: str, route: Optional[str] = None):
+    """Admin: Recently saved request profiles, newest first"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"profiles": profiler.list_profiles(route)}
+
+
+@app.get("/api/admin/profiles/combined")
+async def download_combined_profile(session_id: str, route: str):
+    """Admin: Collapsed stacks of every saved profile for one route, e.g. /api/checkout"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return PlainTextResponse(profiler.combine_profiles(route), headers={
+        "Content-Disposition": 'attachment; filename="combined.folded"'
+    })
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def download_profile(session_id: str, profile_id: str):
+    """Admin: Download one profile as collapsed stacks"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    stacks = profiler.read_profile(profile_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(stacks, headers={
+        "Content-Disposition": f'attachment; filename="{profile_id}.folded"'
+    })
+
+
+@app.get("/api/admin/export/{kind}")
+async def export_records(session_id: str, kind: str, format: str = "csv"):
+    """Admin: Stream every order, invoice or receipt as CSV or NDJSON"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if kind not in EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+    
+    return StreamingResponse(
+        stream_export(db, kind, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'}
+    )
+
+
+def name_products(rows: List[dict]) -> List[dict]:
+    """Add each product's SKU and name to report rows"""
+    for row in rows:
+        product = db.get_product(row["product_id"])
+        row["sku"] = product.sku if product else None
+        row["name"] = product.name if product else None
+    return rows
+
+
+@app.get("/api/admin/reports/summary")
+async def sales_summary(session_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """Admin: Revenue, units and orders for a period (cancelled orders excluded)"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    sales.sync(db)
+    return sales.summary(parse_date_filter(date_from), parse_date_filter(date_to, end_of_day=True))
+
+
+@app.get("/api/admin/reports/products")
+async def sales_by_product(session_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """Admin: Revenue and units for every product sold, highest revenue first"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    sales.sync(db)
+    rows = sales.product_totals(parse_date_filter(date_from), parse_date_filter(date_to, end_of_day=True))
+    return {"products": name_products(rows)}
+
+
+@app.get("/api/admin/reports/top-sellers")
+async def top_sellers(session_id: str, limit: int = 10, by: str = "revenue",
+                      date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """Admin: The best selling products by revenue or units"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if by not in ("revenue", "units"):
+        raise HTTPException(status_code=400, detail="by must be revenue or units")
+    sales.sync(db)
+    rows = sales.top_sellers(max(1, min(limit, 100)), by, parse_date_filter(date_from),
+                             parse_date_filter(date_to, end_of_day=True))
+    return {"products": name_products(rows)}
+
+
+@app.get("/api/admin/reports/sales")
+async def sales_over_time(session_id: str, interval: str = "day", product_id: Optional[int] = None,
+                          by_product: bool = False, date_from: Optional[str] = None,
+                          date_to: Optional[str] = None):
+    """Admin: Revenue, units and orders per hour, day, week or month, optionally per product"""
+    user_id = session_store.get_user_id(session_id)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user = db.get_user(user_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(INTERVALS)}")
+    sales.sync(db)
+    return {
+        "interval": interval,
+        "periods": sales.sales_over_time(interval, parse_date_filter(date_from),
+                                         parse_date_filter(date_to, end_of_day=True), product_id, by_product)
+    }
 
 
 @app.put("/api/admin/orders/{order_id}/status")
 async def update_order_status(session_id: str, order_id: int, status: str):
     """Admin: Update order status"""
-    user_id = sessions.get(session_id)
+    user_id = session_store.get_user_id(session_id)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -402,7 +979,12 @@ async def update_order_status(session_id: str, order_id: int, status: str):
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    previous = order.status
     order.update_status(status)
+    db.update_order(order)
+    dashboard.order_status_changed(order, previous)
+    sales.record_order(order)
+    publish_order(order)
     return {"message": "Order status updated", "order": order.get_details()}
 
 
@@ -415,4 +997,14 @@ if __name__ == "__main__":
     print("Starting server...")
     print("Once started, open your browser to: http://localhost:8000")
     print("=" * 60)
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    
+    # Several workers only stay consistent when they share the SQLite backend
+    workers = int(os.environ.get("STORE_WORKERS", "1"))
+    if workers > 1 and os.environ.get("STORE_BACKEND", "memory") != "sqlite":
+        print("STORE_WORKERS > 1 needs STORE_BACKEND=sqlite, starting a single worker")
+        workers = 1
+    
+    if workers > 1:
+        uvicorn.run("main:app", host="127.0.0.1", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=8000)
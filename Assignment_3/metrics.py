@@ -0,0 +1,214 @@
+"""
+Metrics module - counters, gauges and histograms served in Prometheus text format
+MetricsMiddleware times every request by route template; values are kept per
+worker process and updated from the event loop, so recording is a few dict operations
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette appends the charset
+
+# Seconds; covers cached reads (sub-millisecond) up to checkouts waiting on a slow provider
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence) -> str:
+    """Render a label set such as {method="GET",route="/api/products"}"""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class for a named metric with optional labels"""
+    
+    metric_type = "untyped"
+    
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+    
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Return (sample name, rendered labels, value) rows"""
+        return []
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+    
+    metric_type = "counter"
+    
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[tuple, float] = {} if self.labels else {(): 0}
+    
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [(self.name, format_labels(self.labels, key), value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """A value that goes up and down"""
+    
+    metric_type = "gauge"
+    
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+    
+    def set(self, *label_values, value: float):
+        self.values[label_values] = value
+
+
+class CallbackMetric(Metric):
+    """A gauge or counter whose values are read from elsewhere at scrape time"""
+    
+    def __init__(self, name: str, help_text: str, read: Callable, labels: Sequence[str] = (),
+                 metric_type: str = "gauge"):
+        super().__init__(name, help_text, labels)
+        self.read = read  # Returns a number, or a dict of label tuple -> number
+        self.metric_type = metric_type
+    
+    def samples(self) -> List[Tuple[str, str, float]]:
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, format_labels(self.labels, key), value) for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """Counts observations into fixed buckets, plus their sum and count"""
+    
+    metric_type = "histogram"
+    
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[tuple, list] = {}  # label values -> [bucket counts..., +Inf count, sum]
+    
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+    
+    def samples(self) -> List[Tuple[str, str, float]]:
+        rows = []
+        bucket_labels = self.labels + ("le",)
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                rows.append((f"{self.name}_bucket", format_labels(bucket_labels, key + (format_value(bound),)),
+                             cumulative))
+            labels = format_labels(self.labels, key)
+            rows.append((f"{self.name}_sum", labels, series[-1]))
+            rows.append((f"{self.name}_count", labels, cumulative))
+        return rows
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them for /metrics"""
+    
+    def __init__(self):
+        self.metrics: List[Metric] = []
+    
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+    
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+    
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+    
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+    
+    def callback(self, name: str, help_text: str, read: Callable, labels: Sequence[str] = (),
+                 metric_type: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, read, labels, metric_type))
+    
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_route_names: Dict[object, str] = {}  # endpoint -> route template, filled on first use
+
+
+def route_template(scope) -> str:
+    """Name a finished request by the route it matched, keeping label values bounded"""
+    # Starlette's router writes the matched endpoint into the shared scope
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    route = _route_names.get(endpoint)
+    if route is None:
+        for candidate in scope["app"].routes:
+            _route_names[getattr(candidate, "endpoint", None) or getattr(candidate, "app", None)] = candidate.path
+        route = _route_names.setdefault(endpoint, "unmatched")
+    return route
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and responses per route"""
+    
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.latency = registry.histogram("http_request_duration_seconds",
+                                          "Time to complete a request, by route", ("method", "route"))
+        self.in_flight = registry.gauge("http_requests_in_flight", "Requests currently being handled")
+        self.responses = registry.counter("http_responses_total", "Responses sent, by route and status",
+                                          ("method", "route", "status"))
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = [500]  # Reported if the app fails before starting a response
+        
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+        
+        start = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            route = route_template(scope)
+            self.latency.observe(time.perf_counter() - start, scope["method"], route)
+            self.responses.inc(scope["method"], route, status[0])
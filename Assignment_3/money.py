@@ -0,0 +1,96 @@
+"""
+Money module - exact amounts of money kept as whole cents
+Prices, line totals and order totals add up without float drift, and adding two
+amounts is one integer addition; float() gives the dollar value for JSON and storage
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import total_ordering
+
+CENT = Decimal("0.01")
+
+
+@total_ordering
+class Money:
+    """An immutable amount of money in integer cents"""
+    
+    __slots__ = ("cents",)
+    
+    def __init__(self, cents: int = 0):
+        self.cents = cents
+    
+    @classmethod
+    def of(cls, value) -> "Money":
+        """Convert a dollar amount (float, int, str or Money) to Money, rounding half up to the cent
+        
+        Raises ValueError for anything that is not a finite number, such as nan or inf.
+        """
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, int):
+            return cls(value * 100)
+        # str() gives the shortest repr, so 2.675 rounds to 2.68 rather than to its binary value
+        try:
+            amount = Decimal(str(value))
+            if not amount.is_finite():
+                raise ValueError(f"Not a finite amount of money: {value!r}")
+            return cls(int((amount / CENT).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+        except InvalidOperation:
+            raise ValueError(f"Not a valid amount of money: {value!r}")
+    
+    def __add__(self, other: "Money") -> "Money":
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        return NotImplemented
+    
+    def __radd__(self, other) -> "Money":
+        # Lets sum() start from its default 0
+        if other == 0:
+            return self
+        return NotImplemented
+    
+    def __sub__(self, other: "Money") -> "Money":
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+    
+    def __mul__(self, quantity: int) -> "Money":
+        if isinstance(quantity, int):
+            return Money(self.cents * quantity)
+        return NotImplemented
+    
+    __rmul__ = __mul__
+    
+    def __neg__(self) -> "Money":
+        return Money(-self.cents)
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+    
+    def __lt__(self, other: "Money") -> bool:
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+    
+    def __hash__(self):
+        return hash(self.cents)
+    
+    def __bool__(self):
+        return self.cents != 0
+    
+    def __float__(self):
+        return self.cents / 100
+    
+    def __format__(self, spec: str) -> str:
+        # Keeps f"{amount:.2f}" working wherever a float used to be
+        return format(float(self), spec) if spec else str(self)
+    
+    def __str__(self):
+        sign = "-" if self.cents < 0 else ""
+        dollars, cents = divmod(abs(self.cents), 100)
+        return f"{sign}{dollars}.{cents:02d}"
+    
+    def __repr__(self):
+        return f"Money('{self}')"
@@ -2,32 +2,39 @@
 Order module - represents a confirmed customer order
 """
 
-from typing import List
+from typing import Iterable
 from datetime import datetime
+from money import Money
+
+ORDER_STATUSES = ("Placed", "Processing", "Shipped", "Delivered", "Cancelled")
+
 
 class Order:
     """Represents a confirmed order"""
     
+    __slots__ = ("order_id", "customer_id", "items", "order_date", "status", "total")
+    
     _order_counter = 1  # Simple ID generation
     
-    def __init__(self, customer_id: int, items: List):
-        self.order_id = Order._order_counter
-        Order._order_counter += 1
+    def __init__(self, customer_id: int, items: Iterable, order_id: int = None):
+        if order_id is None:
+            order_id = Order._order_counter
+            Order._order_counter += 1
+        self.order_id = order_id
         
         self.customer_id = customer_id
-        self.items = items  # Composition: order owns its items
+        self.items = tuple(items)  # Composition: order owns its LineItems; invoice and receipt share them
         self.order_date = datetime.now()
         self.status = "Placed"  # Placed -> Processing -> Shipped -> Delivered
         self.total = self._calculate_total()
     
-    def _calculate_total(self) -> float:
+    def _calculate_total(self) -> Money:
         """Calculate order total from items"""
-        return sum(item.get_line_total() for item in self.items)
+        return sum((item.get_line_total() for item in self.items), Money())
     
     def update_status(self, new_status: str):
         """Update order status"""
-        valid_statuses = ["Placed", "Processing", "Shipped", "Delivered", "Cancelled"]
-        if new_status in valid_statuses:
+        if new_status in ORDER_STATUSES:
             self.status = new_status
     
     def get_details(self) -> dict:
@@ -37,7 +44,7 @@ class Order:
             "customer_id": self.customer_id,
             "order_date": self.order_date.strftime("%Y-%m-%d %H:%M:%S"),
             "status": self.status,
-            "total": self.total,
+            "total": float(self.total),
             "items": [item.get_details() for item in self.items]
         }
     
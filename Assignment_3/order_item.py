@@ -1,19 +1,25 @@
 """
 OrderItem module - represents individual items in an order or cart
+Cart lines are mutable OrderItems; a placed order keeps immutable LineItems,
+which its invoice and receipt share instead of holding their own copies
 """
 
+from typing import NamedTuple
+from money import Money
 from product import Product
 
 
 class OrderItem:
     """Represents a product with quantity in cart or order"""
     
+    __slots__ = ("product", "quantity", "unit_price")
+    
     def __init__(self, product: Product, quantity: int):
         self.product = product
         self.quantity = quantity
         self.unit_price = product.price  # Capture price at time of adding
     
-    def get_line_total(self) -> float:
+    def get_line_total(self) -> Money:
         """Calculate total for this line item"""
         return self.unit_price * self.quantity
     
@@ -29,10 +35,52 @@ class OrderItem:
             "product_name": self.product.name,
             "sku": self.product.sku,
             "quantity": self.quantity,
-            "unit_price": self.unit_price,
-            "line_total": self.get_line_total(),
+            "unit_price": float(self.unit_price),
+            "line_total": float(self.get_line_total()),
             "image_url": self.product.image_url
         }
     
     def __str__(self):
         return f"{self.product.name} x{self.quantity} = ${self.get_line_total():.2f}"
+
+
+class LineItem(NamedTuple):
+    """Immutable record of a purchased line, shared by an order, its invoice and its receipt"""
+    
+    product_id: int
+    sku: str
+    product_name: str
+    quantity: int
+    unit_price: Money
+    image_url: str = ""
+    
+    @classmethod
+    def of(cls, product: Product, quantity: int, unit_price: Money = None) -> "LineItem":
+        """Record a purchase of a product, at its current price unless one is given"""
+        return cls(product.product_id, product.sku, product.name, quantity,
+                   product.price if unit_price is None else unit_price, product.image_url)
+    
+    @classmethod
+    def from_details(cls, details: dict) -> "LineItem":
+        """Rebuild a line from the dictionary written by get_details"""
+        return cls(details["product_id"], details["sku"], details["product_name"], details["quantity"],
+                   Money.of(details["unit_price"]), details.get("image_url", ""))
+    
+    def get_line_total(self) -> Money:
+        """Calculate total for this line item"""
+        return self.unit_price * self.quantity
+    
+    def get_details(self) -> dict:
+        """Return item details in the same shape as OrderItem.get_details"""
+        return {
+            "product_id": self.product_id,
+            "product_name": self.product_name,
+            "sku": self.sku,
+            "quantity": self.quantity,
+            "unit_price": float(self.unit_price),
+            "line_total": float(self.get_line_total()),
+            "image_url": self.image_url
+        }
+    
+    def __str__(self):
+        return f"{self.product_name} x{self.quantity} = ${self.get_line_total():.2f}"
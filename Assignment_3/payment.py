@@ -4,75 +4,131 @@ Payment module - handles payment processing with Strategy pattern
 
 from abc import ABC, abstractmethod
 from datetime import datetime
+from typing import Sequence
+from money import Money
 from receipt import Receipt
 
 class PaymentMethod(ABC):
     """Abstract base class for payment methods (Strategy Pattern)"""
     
+    __slots__ = ()
+    
+    method_type = ""  # Key used by checkout forms and storage
+    
     @abstractmethod
-    def process_payment(self, amount: float) -> bool:
+    def process_payment(self, amount: Money) -> bool:
         """Process payment and return success status"""
         pass
     
+    async def process_payment_async(self, amount: Money, gateway, charge_key: str) -> bool:
+        """Charge the amount through the provider's asynchronous gateway"""
+        return await gateway.charge(self.get_reference(), amount, charge_key)
+    
     @abstractmethod
     def get_method_name(self) -> str:
         """Return payment method name"""
         pass
+    
+    @abstractmethod
+    def get_reference(self) -> str:
+        """Return the account reference this method was created with"""
+        pass
 
 
 class DigitalWallet(PaymentMethod):
     """Digital wallet payment method"""
     
+    __slots__ = ("wallet_provider",)
+    
+    method_type = "wallet"
+    
     def __init__(self, wallet_provider: str):
         self.wallet_provider = wallet_provider
     
-    def process_payment(self, amount: float) -> bool:
+    def process_payment(self, amount: Money) -> bool:
         """Simulate digital wallet payment"""
         return True
     
     def get_method_name(self) -> str:
         return f"Digital Wallet ({self.wallet_provider})"
+    
+    def get_reference(self) -> str:
+        return self.wallet_provider
 
 
 class BankDebit(PaymentMethod):
     """Bank debit payment method"""
     
+    __slots__ = ("account_number",)
+    
+    method_type = "bank"
+    
     def __init__(self, account_number: str):
         self.account_number = account_number[-4:]  # Only store last 4 digits
     
-    def process_payment(self, amount: float) -> bool:
+    def process_payment(self, amount: Money) -> bool:
         """Simulate bank debit payment"""
         return True
     
     def get_method_name(self) -> str:
         return f"Bank Debit (****{self.account_number})"
+    
+    def get_reference(self) -> str:
+        return self.account_number
 
 
 class PayPal(PaymentMethod):
     """PayPal payment method"""
     
+    __slots__ = ("email",)
+    
+    method_type = "paypal"
+    
     def __init__(self, email: str):
         self.email = email
     
-    def process_payment(self, amount: float) -> bool:
+    def process_payment(self, amount: Money) -> bool:
         """Simulate PayPal payment"""
         return True
     
     def get_method_name(self) -> str:
         return f"PayPal ({self.email})"
+    
+    def get_reference(self) -> str:
+        return self.email
+
+
+PAYMENT_METHODS = {
+    DigitalWallet.method_type: DigitalWallet,
+    BankDebit.method_type: BankDebit,
+    PayPal.method_type: PayPal,
+}
+
+
+def create_payment_method(method_type: str, details: str):
+    """Build a payment method from its type key, or None if the key is unknown"""
+    method_class = PAYMENT_METHODS.get(method_type)
+    if method_class is None:
+        return None
+    return method_class(details)
 
 
 class Payment:
     """Represents a payment transaction"""
     
+    __slots__ = ("payment_id", "order_id", "amount", "payment_method", "payment_date", "status", "receipt")
+    
     _payment_counter = 1
     
-    def __init__(self, order_id: int, amount: float, payment_method: PaymentMethod):
-        self.payment_id = Payment._payment_counter
-        Payment._payment_counter += 1
+    def __init__(self, order_id: int, amount: float, payment_method: PaymentMethod,
+                payment_id: int = None):
+        if payment_id is None:
+            payment_id = Payment._payment_counter
+            Payment._payment_counter += 1
+        self.payment_id = payment_id
         
         self.order_id = order_id
-        self.amount = amount
+        self.amount = Money.of(amount)
         self.payment_method = payment_method
         self.payment_date = datetime.now()
         self.status = "Pending"
@@ -84,7 +140,15 @@ class Payment:
         self.status = "Success" if success else "Failed"
         return success
     
-    def generate_receipt(self, customer_name: str, items: list = None) -> Receipt:
+    async def process_async(self, gateway) -> bool:
+        """Process the payment through the provider's asynchronous gateway"""
+        success = await self.payment_method.process_payment_async(
+            self.amount, gateway, f"payment-{self.payment_id}")
+        self.status = "Success" if success else "Failed"
+        return success
+    
+    def generate_receipt(self, customer_name: str, items: Sequence = (),
+                        receipt_number: int = None) -> Receipt:
         """Generate receipt after successful payment"""
         if self.status == "Success":
             self.receipt = Receipt(
@@ -93,7 +157,8 @@ class Payment:
                 customer_name=customer_name,
                 amount=self.amount,
                 payment_method=self.payment_method.get_method_name(),
-                items=items if items else []
+                items=items,
+                receipt_number=receipt_number
             )
             return self.receipt
         return None
@@ -103,7 +168,7 @@ class Payment:
         details = {
             "payment_id": self.payment_id,
             "order_id": self.order_id,
-            "amount": self.amount,
+            "amount": float(self.amount),
             "method": self.payment_method.get_method_name(),
             "status": self.status,
             "payment_date": self.payment_date.strftime("%Y-%m-%d %H:%M:%S")
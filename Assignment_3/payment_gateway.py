@@ -0,0 +1,189 @@
+"""
+PaymentGateway module - asynchronous clients for the payment providers
+Each provider gets a pool of reusable connections, a cap on charges in flight,
+a timeout per attempt and retries with exponential backoff
+SimulatedGateway stands in for a real provider with configurable latency and failure rate
+"""
+
+import asyncio
+import os
+import random
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from money import Money
+from payment import PAYMENT_METHODS
+
+
+class GatewayError(Exception):
+    """Transient provider failure that is worth retrying"""
+    pass
+
+
+class GatewayUnavailable(Exception):
+    """Raised when a charge could not be completed after every retry"""
+    pass
+
+
+class GatewayConnection(ABC):
+    """An open connection to a payment provider"""
+    
+    @abstractmethod
+    async def charge(self, reference: str, amount: Money, charge_key: str) -> bool:
+        """Charge an account and return whether the provider approved it"""
+        pass
+    
+    async def close(self):
+        """Close the connection"""
+        pass
+
+
+class Gateway(ABC):
+    """A payment provider endpoint that hands out connections"""
+    
+    @abstractmethod
+    async def connect(self) -> GatewayConnection:
+        """Open a new connection to the provider"""
+        pass
+
+
+class SimulatedGateway(Gateway):
+    """Local provider with configurable latency, transient failures and declines"""
+    
+    MAX_REMEMBERED = 10000  # Charge keys remembered so a retried charge is not taken twice
+    
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 decline_rate: float = 0.0, connect_latency: Optional[float] = None,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        # Opening a connection (TCP + TLS) costs about as much as a request
+        self.connect_latency = latency if connect_latency is None else connect_latency
+        self.rng = random.Random(seed)
+        self.charges: Dict[str, bool] = OrderedDict()  # charge_key -> approved
+        self.connections_opened = 0
+    
+    async def connect(self) -> GatewayConnection:
+        await asyncio.sleep(self.connect_latency)
+        self.connections_opened += 1
+        return SimulatedConnection(self)
+
+
+class SimulatedConnection(GatewayConnection):
+    """Connection to a SimulatedGateway"""
+    
+    def __init__(self, gateway: SimulatedGateway):
+        self.gateway = gateway
+    
+    async def charge(self, reference: str, amount: Money, charge_key: str) -> bool:
+        gateway = self.gateway
+        await asyncio.sleep(max(0.0, gateway.latency + gateway.rng.uniform(-gateway.jitter, gateway.jitter)))
+        if gateway.rng.random() < gateway.failure_rate:
+            raise GatewayError("Simulated provider error")
+        if charge_key not in gateway.charges:
+            gateway.charges[charge_key] = gateway.rng.random() >= gateway.decline_rate
+            if len(gateway.charges) > gateway.MAX_REMEMBERED:
+                gateway.charges.popitem(last=False)
+        return gateway.charges[charge_key]
+
+
+class PaymentGateway:
+    """Client for one provider: pooled connections, bounded concurrency, timeouts and retries"""
+    
+    def __init__(self, name: str, gateway: Gateway, max_concurrency: int = 10, timeout: float = 5.0,
+                 retries: int = 2, backoff: float = 0.1, queue_timeout: Optional[float] = None):
+        self.name = name
+        self.gateway = gateway
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout  # Seconds allowed for one attempt
+        self.retries = retries
+        self.backoff = backoff  # Delay before the first retry, doubled for each one after
+        self.queue_timeout = timeout if queue_timeout is None else queue_timeout
+        self.stats = {"charges": 0, "attempts": 0, "retries": 0, "timeouts": 0,
+                      "errors": 0, "declined": 0, "unavailable": 0}
+        self._loop = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._idle: List[GatewayConnection] = []
+    
+    def _bind_loop(self):
+        """Create the pool on the running loop; connections cannot move between loops"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._idle = []
+    
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a pooled connection, waiting for a free slot if the provider is at capacity"""
+        self._bind_loop()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise GatewayUnavailable(f"{self.name} is at capacity")
+        connection = None
+        try:
+            connection = self._idle.pop() if self._idle else await self.gateway.connect()
+            yield connection
+        except BaseException:
+            # The connection may be mid-response, so it is not handed to anyone else
+            if connection is not None:
+                await connection.close()
+            connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._idle.append(connection)
+            self._slots.release()
+    
+    async def _attempt(self, reference: str, amount: Money, charge_key: str) -> bool:
+        async with self.connection() as connection:
+            return await asyncio.wait_for(connection.charge(reference, amount, charge_key), self.timeout)
+    
+    async def charge(self, reference: str, amount: Money, charge_key: str) -> bool:
+        """Charge an account, retrying transient failures; charge_key makes retries safe"""
+        self.stats["charges"] += 1
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            self.stats["attempts"] += 1
+            try:
+                approved = await self._attempt(reference, amount, charge_key)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                continue
+            except GatewayError:
+                self.stats["errors"] += 1
+                continue
+            except GatewayUnavailable:
+                self.stats["unavailable"] += 1
+                raise
+            if not approved:
+                self.stats["declined"] += 1
+            return approved
+        self.stats["unavailable"] += 1
+        raise GatewayUnavailable(f"{self.name} did not respond after {self.retries + 1} attempts")
+
+
+def create_payment_gateways() -> Dict[str, PaymentGateway]:
+    """One client per payment method, configured from PAYMENT_GATEWAY_* environment variables"""
+    settings = {
+        "latency": float(os.environ.get("PAYMENT_GATEWAY_LATENCY_MS", "0")) / 1000,
+        "failure_rate": float(os.environ.get("PAYMENT_GATEWAY_FAILURE_RATE", "0")),
+        "decline_rate": float(os.environ.get("PAYMENT_GATEWAY_DECLINE_RATE", "0")),
+    }
+    return {
+        method_type: PaymentGateway(
+            method_type,
+            SimulatedGateway(jitter=settings["latency"] / 4, **settings),
+            max_concurrency=int(os.environ.get("PAYMENT_GATEWAY_CONCURRENCY", "10")),
+            timeout=float(os.environ.get("PAYMENT_GATEWAY_TIMEOUT", "5")),
+            retries=int(os.environ.get("PAYMENT_GATEWAY_RETRIES", "2")),
+        )
+        for method_type in PAYMENT_METHODS
+    }
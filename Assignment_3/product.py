@@ -3,6 +3,9 @@ Product module - represents sellable items in the store
 Simplified from Assignment 2: removed complex variant handling, merged with InventoryItem
 """
 
+from money import Money
+
+
 class Product:
     """Represents a product available for sale"""
     
@@ -11,7 +14,7 @@ class Product:
         self.product_id = product_id
         self.sku = sku
         self.name = name
-        self.price = price
+        self.price = Money.of(price)
         self.description = description
         self.stock = stock  # Simplified: stock directly in Product
         self.active = True
@@ -21,11 +24,12 @@ class Product:
         """Check if product is available for purchase"""
         return self.active and self.stock > 0
     
-    def update_stock(self, quantity: int):
-        """Update stock level (positive to add, negative to reduce)"""
+    def update_stock(self, quantity: int) -> bool:
+        """Update stock level (positive to add, negative to reduce), refusing to go below zero"""
+        if self.stock + quantity < 0:
+            return False
         self.stock += quantity
-        if self.stock < 0:
-            self.stock = 0
+        return True
     
     def get_details(self) -> dict:
         """Return product details as dictionary"""
@@ -33,7 +37,7 @@ class Product:
             "product_id": self.product_id,
             "sku": self.sku,
             "name": self.name,
-            "price": self.price,
+            "price": float(self.price),
             "description": self.description,
             "stock": self.stock,
             "active": self.active,
@@ -0,0 +1,244 @@
+"""
+Profiling module - opt-in sampling profiler for individual API requests
+A background thread samples the event loop thread's stack while a profiled request
+is running and keeps the samples whose stack passes through that request
+Profiles are saved in collapsed-stack format (one "frame;frame;frame count" line
+per stack), ready for flamegraph.pl or speedscope
+"""
+
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from metrics import route_template
+
+PROFILE_ID = re.compile(r"^[0-9]+-[0-9]+-[0-9]+$")
+PROFILE_HEADER = b"x-profile"
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+
+
+class Profile:
+    """Stack samples collected for one request"""
+    
+    def __init__(self, profile_id: str, method: str, path: str):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.route = path
+        self.started = time.time()
+        self.duration = 0.0
+        self.stacks: Dict[str, int] = {}  # collapsed stack -> samples
+    
+    def add(self, frames: List[str]):
+        """Count one sample; frames run from the innermost call outwards"""
+        stack = ";".join(reversed(frames))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+    
+    def get_info(self) -> dict:
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": sum(self.stacks.values()),
+        }
+
+
+class Profiler:
+    """Samples the stacks of profiled requests and saves them to a shared directory"""
+    
+    def __init__(self, directory: str = "profiles", interval: float = 0.001, keep: int = 100,
+                 max_active: int = 8):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep  # Saved profiles kept on disk, oldest deleted first
+        self.max_active = max_active  # Requests profiled at once; later ones run unprofiled
+        self.active: Dict[object, Profile] = {}  # middleware frame of the request -> its profile
+        self.thread_id: Optional[int] = None
+        self._labels: Dict[object, str] = {}  # code object -> frame label
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._switch_interval = sys.getswitchinterval()
+        self._sequence = 0
+    
+    def begin(self, frame, method: str, path: str) -> Optional[Profile]:
+        """Start sampling a request whose middleware coroutine runs in the given frame"""
+        with self._lock:
+            if len(self.active) >= self.max_active:
+                return None
+            self._sequence += 1
+            profile = Profile(f"{int(time.time() * 1000)}-{os.getpid()}-{self._sequence}", method, path)
+            self.active[frame] = profile
+            self.thread_id = threading.get_ident()
+            if self._sampler is None:
+                # Hand the GIL over more often so the sampler can keep its interval
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._switch_interval, self.interval))
+                self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._sampler.start()
+        return profile
+    
+    def end(self, frame, profile: Profile, scope):
+        """Stop sampling a request and save what was collected"""
+        with self._lock:
+            self.active.pop(frame, None)
+        profile.duration = time.time() - profile.started
+        profile.route = route_template(scope)
+        self.save(profile)
+    
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self.active:
+                    sys.setswitchinterval(self._switch_interval)
+                    self._sampler = None
+                    return
+                # Sampling under the lock means a finished profile gets no more samples
+                self._sample()
+            time.sleep(self.interval)
+    
+    def _label(self, frame) -> str:
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{name}"
+        return label
+    
+    def _sample(self):
+        """Record the loop thread's current stack against the request it belongs to, if any"""
+        frame = sys._current_frames().get(self.thread_id)
+        frames = []
+        while frame is not None:
+            profile = self.active.get(frame)
+            if profile is not None:
+                if frames:
+                    profile.add(frames)
+                return
+            frames.append(self._label(frame))
+            frame = frame.f_back
+    
+    def save(self, profile: Profile):
+        """Write the collapsed stacks and their metadata, then drop the oldest profiles"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile.profile_id)
+        with open(path + ".folded", "w") as file:
+            for stack, count in sorted(profile.stacks.items()):
+                file.write(f"{stack} {count}\n")
+        with open(path + ".json", "w") as file:
+            json.dump(profile.get_info(), file)
+        
+        saved = sorted(self._saved_ids(), key=lambda profile_id: [int(part) for part in profile_id.split("-")])
+        for old_id in saved[:-self.keep]:
+            for extension in (".folded", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, old_id + extension))
+                except FileNotFoundError:
+                    pass  # Another worker removed it first
+    
+    def _saved_ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-5] for name in os.listdir(self.directory)
+                if name.endswith(".json") and PROFILE_ID.match(name[:-5])]
+    
+    def list_profiles(self, route: Optional[str] = None) -> List[dict]:
+        """Saved profiles from every worker, newest first, optionally for one route"""
+        profiles = []
+        for profile_id in self._saved_ids():
+            try:
+                with open(os.path.join(self.directory, profile_id + ".json")) as file:
+                    info = json.load(file)
+            except (OSError, ValueError):
+                continue  # Deleted or still being written
+            if route is None or info["route"] == route:
+                profiles.append(info)
+        profiles.sort(key=lambda info: [int(part) for part in info["profile_id"].split("-")], reverse=True)
+        return profiles
+    
+    def read_profile(self, profile_id: str) -> Optional[str]:
+        """Return a saved profile's collapsed stacks, or None if there is no such profile"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, profile_id + ".folded")) as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+    
+    def combine_profiles(self, route: str) -> str:
+        """Merge every saved profile of a route into one set of collapsed stacks"""
+        totals: Dict[str, int] = {}
+        for info in self.list_profiles(route):
+            for line in (self.read_profile(info["profile_id"]) or "").splitlines():
+                stack, _, count = line.rpartition(" ")
+                totals[stack] = totals.get(stack, 0) + int(count)
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(totals.items()))
+
+
+class ProfilingMiddleware:
+    """Profiles authorized requests sent with an X-Profile: 1 header, or every request when configured"""
+    
+    def __init__(self, app, profiler: Profiler, mode: str = "off", secret: Optional[str] = None,
+                 authorize: Optional[Callable[[dict], bool]] = None):
+        self.app = app
+        self.profiler = profiler
+        self.mode = mode  # off, header or all
+        self.secret = secret.encode("utf-8") if secret else None  # Sent as X-Profile-Token
+        self.authorize = authorize  # Whether a request may ask to be profiled without the token
+    
+    def wants_profile(self, scope) -> bool:
+        if self.mode == "all":
+            return True
+        if self.mode != "header":
+            return False
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER) not in (b"1", b"true"):
+            return False
+        # Profiling writes to disk and slows the whole process, so strangers may not ask for it
+        token = headers.get(PROFILE_TOKEN_HEADER)
+        if self.secret is not None and token is not None and hmac.compare_digest(token, self.secret):
+            return True
+        return self.authorize is not None and self.authorize(scope)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        
+        # While this coroutine is running, its frame sits on the loop thread's stack
+        # below every call made on behalf of this request
+        frame = sys._getframe()
+        profile = self.profiler.begin(frame, scope["method"], scope["path"])
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.profile_id.encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.end(frame, profile, scope)
+
+
+def create_profiler() -> Profiler:
+    """Build the profiler from the PROFILE_* environment variables"""
+    return Profiler(
+        directory=os.environ.get("PROFILE_DIR", "profiles"),
+        interval=float(os.environ.get("PROFILE_INTERVAL_MS", "1")) / 1000,
+        keep=int(os.environ.get("PROFILE_KEEP", "100")),
+        max_active=int(os.environ.get("PROFILE_MAX_ACTIVE", "8")),
+    )
@@ -3,22 +3,30 @@ Receipt module - handles receipt generation and printing
 """
 
 from datetime import datetime
+from typing import Sequence
+from money import Money
 
 class Receipt:
     """Represents a payment receipt"""
     
+    __slots__ = ("receipt_number", "payment_id", "order_id", "customer_name", "amount", "items",
+                 "payment_method", "issue_date", "printed")
+    
     _receipt_counter = 2000  # Start from 2000 for receipt numbers
     
     def __init__(self, payment_id: int, order_id: int, customer_name: str, 
-                amount: float, payment_method: str, items: list = None):
-        self.receipt_number = Receipt._receipt_counter
-        Receipt._receipt_counter += 1
+                amount: float, payment_method: str, items: Sequence = (),
+                receipt_number: int = None):
+        if receipt_number is None:
+            receipt_number = Receipt._receipt_counter
+            Receipt._receipt_counter += 1
+        self.receipt_number = receipt_number
         
         self.payment_id = payment_id
         self.order_id = order_id
         self.customer_name = customer_name
-        self.amount = amount
-        self.items = items if items else []  # List of items purchased
+        self.amount = Money.of(amount)
+        self.items = items  # The order's LineItems, shared rather than copied
         self.payment_method = payment_method
         self.issue_date = datetime.now()
         self.printed = False  # Track if receipt was already printed
@@ -30,8 +38,8 @@ class Receipt:
             "payment_id": self.payment_id,
             "order_id": self.order_id,
             "customer_name": self.customer_name,
-            "items": self.items,  # Include items list
-            "amount_paid": self.amount,
+            "items": [item.get_details() for item in self.items],
+            "amount_paid": float(self.amount),
             "payment_method": self.payment_method,
             "payment_date": self.issue_date.strftime("%Y-%m-%d %H:%M:%S"),
             "status": "Paid"
@@ -0,0 +1,317 @@
+"""
+Search module - inverted index over product names, descriptions and SKUs
+Query words match whole terms, term prefixes (from a sorted vocabulary) and, for
+longer words, terms one typo away; price, stock, active flag and SKU category are
+kept as NumPy columns, so scoring, filtering and facet counts are vectorized
+"""
+
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from money import Money
+
+TOKEN = re.compile(r"[a-z0-9]+")
+CATEGORY = re.compile(r"[A-Za-z]+")
+LETTERS = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+NAME_WEIGHT = 3  # A term in the name or SKU counts this many times one in the description
+EXACT, PREFIX, TYPO = 5, 3, 2  # Score factor for each kind of match
+MIN_PREFIX = 2  # Shorter words only match whole terms
+MIN_TYPO = 4  # Shorter words are too ambiguous to correct
+
+# Column name -> dtype; every column has one entry per indexed product
+COLUMNS = {
+    "product_id": np.int64,
+    "price_cents": np.int64,
+    "stock": np.int64,
+    "active": np.bool_,
+    "category": np.int32,  # Index into SearchIndex.category_names
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def category_of(sku: str) -> str:
+    """SKU category prefix, e.g. SNACK for SNACK001"""
+    match = CATEGORY.match(sku)
+    return match.group(0).upper() if match else ""
+
+
+def typo_variants(word: str) -> Set[str]:
+    """Every string one deletion, transposition, substitution or insertion away from word"""
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    variants = {left + right[1:] for left, right in splits if right}
+    variants |= {left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1}
+    variants |= {left + letter + right[1:] for left, right in splits if right for letter in LETTERS}
+    variants |= {left + letter + right for left, right in splits for letter in LETTERS}
+    variants.discard(word)
+    return variants
+
+
+def term_weights(product) -> Dict[str, int]:
+    weights = {term: 1 for term in tokenize(product.description)}
+    for term in tokenize(product.name) + tokenize(product.sku):
+        weights[term] = NAME_WEIGHT
+    return weights
+
+
+class SearchIndex:
+    """Term postings, a sorted vocabulary for prefixes and filter columns, updated one product at a time"""
+    
+    def __init__(self, refresh_seconds: Optional[float] = None, capacity: int = 1024):
+        self.refresh_seconds = refresh_seconds  # Rebuild from storage this often (None: never)
+        self.category_names: List[str] = []
+        self.category_codes: Dict[str, int] = {}
+        self.version = None
+        self.last_rebuild = time.monotonic()
+        self._lock = threading.RLock()
+        self._pending: Optional[List[Tuple[str, object]]] = None  # Changes made while a rebuild runs
+        self._reset(capacity)
+    
+    def _reset(self, capacity: int):
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(capacity, dtype) for name, dtype in COLUMNS.items()}
+        self.size = 0
+        self.rows: Dict[int, int] = {}  # product_id -> row in the columns
+        self.row_terms: List[Dict[str, int]] = []  # Terms indexed for each row, to remove on update
+        self.postings: Dict[str, Dict[int, int]] = {}  # term -> row -> weight
+        self.vocabulary: Optional[List[str]] = []  # Sorted terms, for prefix lookups
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # term -> (rows, weights), made when searched
+        self._scratch = np.zeros(capacity, np.int64)  # Score per row while matching; all zeros between queries
+    
+    def _grow(self):
+        capacity = len(self.columns["product_id"])
+        if self.size < capacity:
+            return
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity * 2, column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        self._scratch = np.zeros(capacity * 2, np.int64)
+    
+    def build(self, products, version: Optional[int] = None):
+        """Index every product from scratch"""
+        with self._lock:
+            self._reset(1024)
+            self.vocabulary = None  # Sorted once at the end rather than per new term
+            for product in products:
+                self._add(product)
+            self.vocabulary = sorted(self.postings)
+            self.version = version
+            self.last_rebuild = time.monotonic()
+    
+    def sync(self, storage):
+        """Now and then, rebuild in the background if other workers may have changed the catalog"""
+        if self.refresh_seconds is None or time.monotonic() - self.last_rebuild <= self.refresh_seconds:
+            return
+        with self._lock:
+            if self._pending is not None:
+                return  # Already rebuilding
+            self._pending = []
+            self.last_rebuild = time.monotonic()
+        threading.Thread(target=self._refresh, args=(storage,), name="search-refresh", daemon=True).start()
+    
+    def _refresh(self, storage):
+        """Build a fresh index off the request path, then swap it in with this worker's changes since"""
+        fresh = None
+        try:
+            version = storage.catalog_version()
+            if version != self.version:
+                fresh = SearchIndex(capacity=max(len(self.columns["product_id"]), 1024))
+                fresh.build(storage.get_all_products(), version)
+        except Exception as error:
+            print(f"Search index refresh failed: {error}")
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if fresh is None:
+                return
+            for change, argument in pending:
+                getattr(fresh, change)(argument)
+            for name in ("columns", "size", "rows", "row_terms", "postings", "vocabulary", "_arrays", "_scratch",
+                         "category_names", "category_codes", "version"):
+                setattr(self, name, getattr(fresh, name))
+            self.last_rebuild = time.monotonic()
+    
+    def _category_code(self, sku: str) -> int:
+        name = category_of(sku)
+        code = self.category_codes.get(name)
+        if code is None:
+            code = self.category_codes[name] = len(self.category_names)
+            self.category_names.append(name)
+        return code
+    
+    def _add(self, product):
+        row = self.rows.get(product.product_id)
+        if row is None:
+            self._grow()
+            row = self.rows[product.product_id] = self.size
+            self.row_terms.append({})
+            self.size += 1
+        columns = self.columns
+        columns["product_id"][row] = product.product_id
+        columns["price_cents"][row] = product.price.cents
+        columns["stock"][row] = product.stock
+        columns["active"][row] = product.active
+        columns["category"][row] = self._category_code(product.sku)
+        
+        weights = self.row_terms[row] = term_weights(product)
+        for term, weight in weights.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                if self.vocabulary is not None:
+                    self.vocabulary.insert(bisect_left(self.vocabulary, term), term)
+            postings[row] = weight
+            self._arrays.pop(term, None)
+    
+    def _remove_terms(self, row: int):
+        for term in self.row_terms[row]:
+            postings = self.postings[term]
+            del postings[row]
+            self._arrays.pop(term, None)
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+        self.row_terms[row] = {}
+    
+    def update(self, product):
+        """Re-index one added or edited product"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("update", product))
+            row = self.rows.get(product.product_id)
+            if row is not None:
+                self._remove_terms(row)
+            self._add(product)
+    
+    def stock_changed(self, levels: Dict[int, int]):
+        """Record new stock levels (product_id -> stock) for the availability filter"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("stock_changed", levels))
+            for product_id, stock in levels.items():
+                row = self.rows.get(product_id)
+                if row is not None:
+                    self.columns["stock"][row] = stock
+    
+    def _expand(self, word: str) -> Dict[str, int]:
+        """Terms a query word matches, with the score factor of the best way each matched"""
+        matches: Dict[str, int] = {}
+        if len(word) >= MIN_PREFIX:
+            position = bisect_left(self.vocabulary, word)
+            while position < len(self.vocabulary) and self.vocabulary[position].startswith(word):
+                matches[self.vocabulary[position]] = PREFIX
+                position += 1
+        if word in self.postings:
+            matches[word] = EXACT
+        elif len(word) >= MIN_TYPO:
+            # Words that are terms as typed are taken as meant; only the others are corrected
+            for variant in typo_variants(word):
+                if variant in self.postings and variant not in matches:
+                    matches[variant] = TYPO
+        return matches
+    
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self.postings[term]
+            arrays = self._arrays[term] = (np.fromiter(postings.keys(), np.int64, len(postings)),
+                                           np.fromiter(postings.values(), np.int64, len(postings)))
+        return arrays
+    
+    def _word_matches(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) of the products a query word matches, with each row's best match"""
+        arrays = [(self._term_arrays(term), factor) for term, factor in self._expand(word).items()]
+        if not arrays:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        if len(arrays) == 1:
+            (rows, weights), factor = arrays[0]
+            return rows, weights * factor
+        best = self._scratch
+        np.maximum.at(best, np.concatenate([rows for (rows, weights), factor in arrays]),
+                      np.concatenate([weights * factor for (rows, weights), factor in arrays]))
+        rows = np.flatnonzero(best[:self.size])
+        scores = best[rows]
+        best[rows] = 0
+        return rows, scores
+    
+    def _match(self, words: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) of the products matching every query word; a score sums each word's best match"""
+        rows, scores = self._word_matches(words[0])
+        for word in words[1:]:
+            if not len(rows):
+                break
+            word_rows, word_scores = self._word_matches(word)
+            lookup = self._scratch
+            lookup[word_rows] = word_scores
+            matched = lookup[rows]
+            lookup[word_rows] = 0
+            found = matched > 0
+            rows = rows[found]
+            scores = scores[found] + matched[found]
+        return rows, scores
+    
+    def search(self, query: str = "", min_price: Optional[Money] = None, max_price: Optional[Money] = None,
+               available: Optional[bool] = None, category: Optional[str] = None, limit: int = 20,
+               offset: int = 0) -> Tuple[List[int], int, Dict[str, int]]:
+        """Return (product IDs of one page, total matches, matches per category) for a query and filters
+        
+        Without query words every active product matches, in product ID order; with them,
+        the best matches come first. Category counts ignore the category filter, so they
+        show what choosing another category would give.
+        """
+        words = tokenize(query)
+        with self._lock:
+            # Filters only look at the rows the words matched, so selective queries stay cheap
+            if words:
+                rows, scores = self._match(words)
+            else:
+                rows, scores = np.arange(self.size), None
+            columns = self.columns
+            keep = columns["active"][rows]
+            if min_price is not None:
+                keep &= columns["price_cents"][rows] >= min_price.cents
+            if max_price is not None:
+                keep &= columns["price_cents"][rows] <= max_price.cents
+            if available is not None:
+                keep &= (columns["stock"][rows] > 0) == available
+            rows = rows[keep]
+            if scores is not None:
+                scores = scores[keep]
+            
+            row_categories = columns["category"][rows]
+            counts = np.bincount(row_categories, minlength=len(self.category_names))
+            facets = {name: int(counts[code]) for code, name in enumerate(self.category_names) if counts[code]}
+            if category:
+                keep = row_categories == self.category_codes.get(category.upper(), -1)
+                rows = rows[keep]
+                if scores is not None:
+                    scores = scores[keep]
+            
+            product_ids = columns["product_id"][rows]
+            # Best score first, then product ID; scores are small integers, so one int64 key orders both
+            keys = product_ids if scores is None else product_ids - (scores << 40)
+            wanted = offset + limit
+            if len(keys) > wanted:
+                # Only the requested page needs sorting, not every match
+                keep = np.argpartition(keys, wanted - 1)[:wanted]
+                product_ids, keys = product_ids[keep], keys[keep]
+            page = product_ids[np.argsort(keys)][offset:wanted]
+        return page.tolist(), len(rows), dict(sorted(facets.items()))
+
+
+def create_search_index(storage) -> SearchIndex:
+    """Shared SQLite workers rebuild their index every SEARCH_REFRESH_SECONDS if the catalog changed"""
+    if os.environ.get("STORE_BACKEND", "memory") == "sqlite":
+        index = SearchIndex(refresh_seconds=float(os.environ.get("SEARCH_REFRESH_SECONDS", "60")))
+    else:
+        index = SearchIndex()
+    index.build(storage.get_all_products(), storage.catalog_version())
+    return index
@@ -0,0 +1,360 @@
+"""
+SessionStore module - login sessions and shopping carts shared by the API workers
+InMemorySessionStore suits a single process, SQLiteSessionStore lets several
+uvicorn workers on one machine see the same sessions and carts
+Idle sessions and abandoned carts expire after a TTL, and each kind is capped at
+a maximum count with least recently used entries evicted first
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from money import Money
+from order_item import OrderItem
+from shopping_cart import ShoppingCart
+
+SESSION_TTL = 30 * 60  # Seconds a session may sit idle before it expires
+CART_TTL = 24 * 60 * 60  # Seconds before an untouched cart is treated as abandoned
+MAX_SESSIONS = 10000
+MAX_CARTS = 10000
+SWEEP_SECONDS = 60
+
+
+class SessionStore(ABC):
+    """Abstract base class for session and cart storage (Strategy Pattern)"""
+    
+    def __init__(self, session_ttl: float = SESSION_TTL, cart_ttl: float = CART_TTL,
+                 max_sessions: int = MAX_SESSIONS, max_carts: int = MAX_CARTS):
+        self.session_ttl = session_ttl
+        self.cart_ttl = cart_ttl
+        self.max_sessions = max_sessions
+        self.max_carts = max_carts
+        self.counters = {"sessions_expired": 0, "sessions_evicted": 0,
+                         "carts_expired": 0, "carts_evicted": 0}
+    
+    @abstractmethod
+    def create_session(self, user_id: int) -> str:
+        """Start a session for a user and return its ID"""
+        pass
+    
+    @abstractmethod
+    def get_user_id(self, session_id: str) -> Optional[int]:
+        """Return the user ID for a live session and refresh its idle timer, or None"""
+        pass
+    
+    @abstractmethod
+    def delete_session(self, session_id: str):
+        """End a session"""
+        pass
+    
+    @abstractmethod
+    def get_cart(self, user_id: int, create: bool = True) -> Optional[ShoppingCart]:
+        """Return the user's cart, creating an empty one if requested"""
+        pass
+    
+    @abstractmethod
+    def save_cart(self, cart: ShoppingCart):
+        """Persist changes made to a cart"""
+        pass
+    
+    @abstractmethod
+    def sweep(self):
+        """Drop expired entries and evict the least recently used beyond the size limits"""
+        pass
+    
+    @abstractmethod
+    def live_counts(self) -> Tuple[int, int]:
+        """Return the number of stored sessions and carts"""
+        pass
+    
+    def stats(self) -> dict:
+        """Live entry counts plus the expiries and evictions seen by this process"""
+        sessions, carts = self.live_counts()
+        return {"live_sessions": sessions, "live_carts": carts, **self.counters}
+    
+    async def run_sweeper(self, interval: float = SWEEP_SECONDS):
+        """Sweep periodically on the event loop; the sweep itself runs in a worker thread"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as error:
+                print(f"Session sweep failed: {error}")
+    
+    def close(self):
+        """Release any resources held by the store"""
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """Keeps sessions and carts in process dicts ordered from least to most recently used"""
+    
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self.sessions: Dict[str, Tuple[int, float]] = OrderedDict()  # session_id -> (user_id, last_seen)
+        self.carts: Dict[int, Tuple[ShoppingCart, float]] = OrderedDict()  # user_id -> (cart, last_seen)
+        self._lock = threading.Lock()
+    
+    def _touch(self, entries: OrderedDict, key, value, limit: int, evicted: str):
+        """Store an entry as most recently used, evicting the oldest past the limit"""
+        entries[key] = (value, time.monotonic())
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+            self.counters[evicted] += 1
+    
+    def _lookup(self, entries: OrderedDict, key, ttl: float, expired: str):
+        """Return a live entry's value, dropping it if it has been idle too long"""
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > ttl:
+            del entries[key]
+            self.counters[expired] += 1
+            return None
+        return entry[0]
+    
+    def create_session(self, user_id: int) -> str:
+        session_id = f"session_{user_id}"
+        with self._lock:
+            self._touch(self.sessions, session_id, user_id, self.max_sessions, "sessions_evicted")
+        return session_id
+    
+    def get_user_id(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            user_id = self._lookup(self.sessions, session_id, self.session_ttl, "sessions_expired")
+            if user_id is not None:
+                self._touch(self.sessions, session_id, user_id, self.max_sessions, "sessions_evicted")
+            return user_id
+    
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+    
+    def get_cart(self, user_id: int, create: bool = True) -> Optional[ShoppingCart]:
+        with self._lock:
+            cart = self._lookup(self.carts, user_id, self.cart_ttl, "carts_expired")
+            if cart is None:
+                if not create:
+                    return None
+                cart = ShoppingCart(user_id)
+            self._touch(self.carts, user_id, cart, self.max_carts, "carts_evicted")
+            return cart
+    
+    def save_cart(self, cart: ShoppingCart):
+        with self._lock:
+            self._touch(self.carts, cart.customer_id, cart, self.max_carts, "carts_evicted")
+    
+    def sweep(self):
+        with self._lock:
+            for entries, ttl, expired in ((self.sessions, self.session_ttl, "sessions_expired"),
+                                          (self.carts, self.cart_ttl, "carts_expired")):
+                # Entries are kept in last-used order, so the expired ones are all at the front
+                cutoff = time.monotonic() - ttl
+                while entries and next(iter(entries.values()))[1] < cutoff:
+                    entries.popitem(last=False)
+                    self.counters[expired] += 1
+    
+    def live_counts(self) -> Tuple[int, int]:
+        return len(self.sessions), len(self.carts)
+
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    last_seen REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS carts (
+    user_id INTEGER PRIMARY KEY,
+    last_seen REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cart_items (
+    user_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    unit_price REAL NOT NULL,
+    PRIMARY KEY (user_id, position)
+);
+"""
+
+SESSION_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_sessions_last_seen ON sessions (last_seen);
+CREATE INDEX IF NOT EXISTS idx_carts_last_seen ON carts (last_seen);
+"""
+
+INSERT_SESSION = "INSERT OR REPLACE INTO sessions (session_id, user_id, last_seen) VALUES (?, ?, ?)"
+SELECT_SESSION = "SELECT user_id, last_seen FROM sessions WHERE session_id = ?"
+TOUCH_SESSION = "UPDATE sessions SET last_seen = ? WHERE session_id = ?"
+DELETE_SESSION = "DELETE FROM sessions WHERE session_id = ?"
+INSERT_CART = "INSERT OR REPLACE INTO carts (user_id, last_seen) VALUES (?, ?)"
+SELECT_CART = "SELECT last_seen FROM carts WHERE user_id = ?"
+TOUCH_CART = "UPDATE carts SET last_seen = ? WHERE user_id = ?"
+DELETE_CART = "DELETE FROM carts WHERE user_id = ?"
+SELECT_CART_ITEMS = """SELECT product_id, quantity, unit_price FROM cart_items
+    WHERE user_id = ? ORDER BY position"""
+DELETE_CART_ITEMS = "DELETE FROM cart_items WHERE user_id = ?"
+INSERT_CART_ITEM = """INSERT INTO cart_items (user_id, position, product_id, quantity, unit_price)
+    VALUES (?, ?, ?, ?, ?)"""
+COUNT_SESSIONS = "SELECT COUNT(*) FROM sessions"
+COUNT_CARTS = "SELECT COUNT(*) FROM carts"
+
+# Sweeps: expire idle rows, then trim everything past the newest max rows
+EXPIRE_SESSIONS = "DELETE FROM sessions WHERE last_seen < ?"
+EVICT_SESSIONS = """DELETE FROM sessions WHERE session_id IN
+    (SELECT session_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)"""
+EXPIRED_CARTS = "SELECT user_id FROM carts WHERE last_seen < ?"
+EVICTED_CARTS = "SELECT user_id FROM carts ORDER BY last_seen DESC LIMIT -1 OFFSET ?"
+
+
+class SQLiteSessionStore(SessionStore):
+    """Keeps sessions and carts in a SQLite file shared by every worker process"""
+    
+    TOUCH_SECONDS = 30  # Skip last_seen writes for entries refreshed more recently than this
+    
+    def __init__(self, path: str, get_product: Callable, **limits):
+        super().__init__(**limits)
+        self.path = path
+        self.get_product = get_product  # Resolves product IDs when a cart is loaded
+        self.touch_seconds = min(self.TOUCH_SECONDS, self.session_ttl / 10, self.cart_ttl / 10)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                                    timeout=30, cached_statements=64)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SESSION_SCHEMA)
+        self._add_last_seen_columns()
+        self._conn.executescript(SESSION_INDEXES)
+    
+    def _add_last_seen_columns(self):
+        """Upgrade session files created before entries expired"""
+        for table in ("sessions", "carts"):
+            columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+            if "last_seen" not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN last_seen REAL NOT NULL DEFAULT 0")
+    
+    def _delete_carts(self, user_ids: list):
+        """Remove carts and their items; the caller holds the lock"""
+        rows = [(user_id,) for user_id in user_ids]
+        self._conn.executemany(DELETE_CART_ITEMS, rows)
+        self._conn.executemany(DELETE_CART, rows)
+    
+    def create_session(self, user_id: int) -> str:
+        session_id = f"session_{user_id}"
+        with self._lock:
+            self._conn.execute(INSERT_SESSION, (session_id, user_id, time.time()))
+        return session_id
+    
+    def get_user_id(self, session_id: str) -> Optional[int]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(SELECT_SESSION, (session_id,)).fetchone()
+            if not row:
+                return None
+            user_id, last_seen = row
+            if now - last_seen > self.session_ttl:
+                self._conn.execute(DELETE_SESSION, (session_id,))
+                self.counters["sessions_expired"] += 1
+                return None
+            if now - last_seen > self.touch_seconds:
+                self._conn.execute(TOUCH_SESSION, (now, session_id))
+        return user_id
+    
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._conn.execute(DELETE_SESSION, (session_id,))
+    
+    def get_cart(self, user_id: int, create: bool = True) -> Optional[ShoppingCart]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(SELECT_CART, (user_id,)).fetchone()
+            if row and now - row[0] > self.cart_ttl:
+                self._delete_carts([user_id])
+                self.counters["carts_expired"] += 1
+                row = None
+            if not row:
+                if not create:
+                    return None
+                self._conn.execute(INSERT_CART, (user_id, now))
+            elif now - row[0] > self.touch_seconds:
+                self._conn.execute(TOUCH_CART, (now, user_id))
+            rows = self._conn.execute(SELECT_CART_ITEMS, (user_id,)).fetchall()
+        
+        cart = ShoppingCart(user_id)
+        for product_id, quantity, unit_price in rows:
+            product = self.get_product(product_id)
+            if product is None:
+                continue  # Product was removed from the catalog
+            item = OrderItem(product, quantity)
+            item.unit_price = Money.of(unit_price)
+            cart.put_item(item)
+        return cart
+    
+    def save_cart(self, cart: ShoppingCart):
+        rows = [(cart.customer_id, position, item.product.product_id, item.quantity, float(item.unit_price))
+                for position, item in enumerate(cart.items)]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(INSERT_CART, (cart.customer_id, time.time()))
+                self._conn.execute(DELETE_CART_ITEMS, (cart.customer_id,))
+                self._conn.executemany(INSERT_CART_ITEM, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._conn.execute(EXPIRE_SESSIONS, (now - self.session_ttl,)).rowcount
+                evicted = self._conn.execute(EVICT_SESSIONS, (self.max_sessions,)).rowcount
+                expired_carts = [row[0] for row in self._conn.execute(EXPIRED_CARTS, (now - self.cart_ttl,))]
+                self._delete_carts(expired_carts)
+                evicted_carts = [row[0] for row in self._conn.execute(EVICTED_CARTS, (self.max_carts,))]
+                self._delete_carts(evicted_carts)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.counters["sessions_expired"] += expired
+        self.counters["sessions_evicted"] += evicted
+        self.counters["carts_expired"] += len(expired_carts)
+        self.counters["carts_evicted"] += len(evicted_carts)
+    
+    def live_counts(self) -> Tuple[int, int]:
+        with self._lock:
+            sessions = self._conn.execute(COUNT_SESSIONS).fetchone()[0]
+            carts = self._conn.execute(COUNT_CARTS).fetchone()[0]
+        return sessions, carts
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def session_limits() -> dict:
+    """Read TTLs and size limits from the environment, falling back to the defaults"""
+    return {
+        "session_ttl": float(os.environ.get("SESSION_TTL_SECONDS", SESSION_TTL)),
+        "cart_ttl": float(os.environ.get("CART_TTL_SECONDS", CART_TTL)),
+        "max_sessions": int(os.environ.get("SESSION_MAX", MAX_SESSIONS)),
+        "max_carts": int(os.environ.get("CART_MAX", MAX_CARTS)),
+    }
+
+
+def create_session_store(get_product: Callable) -> SessionStore:
+    """Pick the session store matching the STORE_BACKEND environment variable"""
+    if os.environ.get("STORE_BACKEND", "memory") == "sqlite":
+        return SQLiteSessionStore(os.environ.get("STORE_DB_PATH", "store.db"), get_product,
+                                  **session_limits())
+    return InMemorySessionStore(**session_limits())
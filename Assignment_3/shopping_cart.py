@@ -2,7 +2,8 @@
 ShoppingCart module - manages customer's shopping cart
 """
 
-from typing import List
+from typing import Dict, List
+from money import Money
 from order_item import OrderItem
 
 class ShoppingCart:
@@ -10,62 +11,109 @@ class ShoppingCart:
     
     def __init__(self, customer_id: int):
         self.customer_id = customer_id
-        self.items: List[OrderItem] = []
+        self.lines: Dict[int, OrderItem] = {}  # product_id -> item, in the order they were added
+        self.total = Money()
+        self.item_count = 0
+    
+    @property
+    def items(self) -> List[OrderItem]:
+        """Items in the order they were added"""
+        return list(self.lines.values())
+    
+    def _set_line(self, item: OrderItem, quantity: int):
+        """Change a line's quantity (0 removes it) and keep the running totals in step"""
+        self.total += item.unit_price * (quantity - item.quantity)
+        self.item_count += quantity - item.quantity
+        if quantity > 0:
+            item.quantity = quantity
+        else:
+            del self.lines[item.product.product_id]
+    
+    def put_item(self, item: OrderItem):
+        """Insert an already built line, e.g. when loading a saved cart"""
+        existing = self.lines.get(item.product.product_id)
+        if existing is not None:
+            self._set_line(existing, 0)
+        self.lines[item.product.product_id] = item
+        self.total += item.get_line_total()
+        self.item_count += item.quantity
     
     def add_item(self, product, quantity: int = 1) -> bool:
         """Add product to cart, return True if successful"""
-        if not product.is_available():
+        if not product.is_available() or quantity <= 0:
             return False
         
         if quantity > product.stock:
             return False
         
         # Check if product already in cart
-        for item in self.items:
-            if item.product.product_id == product.product_id:
-                item.update_quantity(item.quantity + quantity)
-                return True
+        item = self.lines.get(product.product_id)
+        if item is not None:
+            if item.quantity + quantity > 0:
+                self._set_line(item, item.quantity + quantity)
+            return True
         
         # Add new item
-        self.items.append(OrderItem(product, quantity))
+        self.put_item(OrderItem(product, quantity))
         return True
     
     def remove_item(self, product_id: int) -> bool:
         """Remove item from cart"""
-        for i, item in enumerate(self.items):
-            if item.product.product_id == product_id:
-                self.items.pop(i)
-                return True
-        return False
+        item = self.lines.get(product_id)
+        if item is None:
+            return False
+        self._set_line(item, 0)
+        return True
     
     def update_item_quantity(self, product_id: int, quantity: int) -> bool:
         """Update quantity of item in cart"""
         if quantity <= 0:
             return self.remove_item(product_id)
         
-        for item in self.items:
-            if item.product.product_id == product_id:
-                # Allow setting quantity beyond stock so the UI can warn users and block checkout
-                    item.update_quantity(quantity)
-                    return True
-        return False
+        item = self.lines.get(product_id)
+        if item is None:
+            return False
+        # Allow setting quantity beyond stock so the UI can warn users and block checkout
+        self._set_line(item, quantity)
+        return True
     
-    def get_total(self) -> float:
-        """Calculate cart total"""
-        return sum(item.get_line_total() for item in self.items)
+    def set_quantities(self, quantities: Dict[int, int], products: Dict[int, object]) -> Dict[int, str]:
+        """Set many lines at once (0 removes one); returns product_id -> reason for lines not set"""
+        # products only needs the lines that are not in the cart yet
+        rejected: Dict[int, str] = {}
+        for product_id, quantity in quantities.items():
+            if product_id in self.lines:
+                self.update_item_quantity(product_id, quantity)
+            elif quantity <= 0:
+                continue
+            elif products.get(product_id) is None:
+                rejected[product_id] = "Product not found"
+            elif not self.add_item(products[product_id], quantity):
+                rejected[product_id] = "Product not available in requested quantity"
+        return rejected
+    
+    def get_total(self) -> Money:
+        """Return the cart total, kept up to date as lines change"""
+        return self.total
     
     def get_item_count(self) -> int:
         """Get total number of items in cart"""
-        return sum(item.quantity for item in self.items)
+        return self.item_count
+    
+    def get_quantities(self) -> Dict[int, int]:
+        """Return product_id -> quantity for every item in the cart"""
+        return {product_id: item.quantity for product_id, item in self.lines.items()}
     
     def clear(self):
         """Empty the cart"""
-        self.items = []
+        self.lines = {}
+        self.total = Money()
+        self.item_count = 0
     
     def get_items(self) -> List[dict]:
         """Return all items as dictionaries"""
         detailed_items: List[dict] = []
-        for item in self.items:
+        for item in self.lines.values():
             entry = item.get_details()
             current_stock = item.product.stock
             entry["current_stock"] = current_stock
@@ -86,6 +134,6 @@ class ShoppingCart:
         return detailed_items
     
     def __str__(self):
-        if not self.items:
+        if not self.lines:
             return "Empty cart"
         return f"Cart: {self.get_item_count()} items, Total: ${self.get_total():.2f}"
@@ -5,6 +5,22 @@ const API_BASE = '';
 let sessionId = localStorage.getItem('session_id');
 let currentUser = JSON.parse(localStorage.getItem('user') || 'null');
 
+// Cursors for the next page of orders (null when there are no more)
+let ordersCursor = null;
+let adminOrdersCursor = null;
+
+// Live updates: the product list is fetched once and then kept current by server events
+let eventSource = null;
+let products = null;
+
+// Products shown for the current search (null while browsing the whole catalog)
+let searchResults = null;
+let searchTimer = null;
+const SEARCH_PAGE = 24;
+
+// Idempotency key for the checkout in progress; resubmitting reuses it so the order is placed once
+let checkoutKey = null;
+
 // Initialize app
 document.addEventListener('DOMContentLoaded', () => {
     if (sessionId && currentUser) {
@@ -28,6 +44,7 @@ function showMainApp() {
     document.getElementById('login-section').classList.add('hidden');
     document.getElementById('user-info').classList.remove('hidden');
     document.getElementById('user-email').textContent = currentUser.email;
+    connectEvents();
     
     if (currentUser.role === 'customer') {
         document.getElementById('nav-menu').classList.remove('hidden');
@@ -86,6 +103,7 @@ async function logout() {
         console.error('Logout error:', error);
     }
     
+    if (eventSource) eventSource.close();
     sessionId = null;
     currentUser = null;
     localStorage.removeItem('session_id');
@@ -100,19 +118,120 @@ async function showProducts() {
     await loadProducts();
 }
 
-async function loadProducts() {
-    try {
+// Use the cached product list while live updates keep it current, otherwise fetch it
+async function getProducts() {
+    const live = eventSource && eventSource.readyState === EventSource.OPEN;
+    if (!products || !live) {
         const response = await fetch(`${API_BASE}/api/products`);
-        const products = await response.json();
-        
-        const grid = document.getElementById('products-grid');
-        grid.innerHTML = products.map(product => `
-            <div class="product-card">
-                <div class="product-image-container">
-                    <img src="${product.image_url || '/static/images/placeholder.jpg'}" 
+        products = await response.json();
+    }
+    return products;
+}
+
+async function loadProducts(append = false) {
+    try {
+        const params = searchParams();
+        if (params) {
+            await loadSearchResults(params, append);
+            return;
+        }
+        searchResults = null;
+        document.getElementById('products-more').classList.add('hidden');
+        await getProducts();
+        renderProducts();
+    } catch (error) {
+        showMessage('Failed to load products', 'error');
+    }
+}
+
+function renderProducts() {
+    const grid = document.getElementById('products-grid');
+    grid.innerHTML = products.map(renderProductCard).join('');
+}
+
+// Search query and filters from the form, or null when none are set
+function searchParams() {
+    const params = new URLSearchParams();
+    for (const [key, value] of new FormData(document.getElementById('product-search')).entries()) {
+        if (value.trim()) params.set(key, value.trim());
+    }
+    return [...params.keys()].length ? params : null;
+}
+
+function scheduleSearch() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => loadProducts(), 200);
+}
+
+async function loadSearchResults(params, append) {
+    params.set('limit', SEARCH_PAGE);
+    params.set('offset', append && searchResults ? searchResults.length : 0);
+    const response = await fetch(`${API_BASE}/api/products/search?${params}`);
+    const data = await response.json();
+    
+    searchResults = append && searchResults ? searchResults.concat(data.products) : data.products;
+    const grid = document.getElementById('products-grid');
+    if (append) {
+        grid.insertAdjacentHTML('beforeend', data.products.map(renderProductCard).join(''));
+    } else {
+        grid.innerHTML = data.total ? data.products.map(renderProductCard).join('') : '<p>No products found</p>';
+    }
+    document.getElementById('products-more').classList.toggle('hidden', searchResults.length >= data.total);
+    
+    // Offer the categories that have matches, keeping the current choice
+    const select = document.querySelector('#product-search [name="category"]');
+    const chosen = select.value;
+    const categories = Object.keys(data.facets.category);
+    if (chosen && !categories.includes(chosen)) categories.push(chosen);
+    select.innerHTML = '<option value="">All categories</option>' + categories.map(category =>
+        `<option value="${category}">${category} (${data.facets.category[category] || 0})</option>`).join('');
+    select.value = chosen;
+}
+
+function rerenderProductCard(product) {
+    const card = document.getElementById(`product-card-${product.product_id}`);
+    if (card) {
+        const qtyInput = document.getElementById(`qty-${product.product_id}`);
+        const quantity = qtyInput ? qtyInput.value : null;
+        card.outerHTML = renderProductCard(product);
+        const newInput = document.getElementById(`qty-${product.product_id}`);
+        if (newInput && quantity) newInput.value = quantity;
+    }
+}
+
+// Card images are at most ~400px wide, so the browser picks a resized variant instead of the full photo
+const PRODUCT_IMAGE_SIZES = '(max-width: 768px) 100vw, 400px';
+
+function variantSrcset(variants) {
+    return Object.entries(variants).map(([width, url]) => `${url} ${width}w`).join(', ');
+}
+
+function renderProductImage(product) {
+    const variants = product.image_variants || {};
+    const onerror = "this.style.display='none'; this.closest('.product-image-container').classList.add('no-image')";
+    if (!variants.webp || !variants.jpg) {
+        return `<img src="${product.image_url || '/static/images/placeholder.jpg'}" 
                         alt="${product.name}" 
                         class="product-image"
-                        onerror="this.style.display='none'; this.parentElement.classList.add('no-image')">
+                        onerror="${onerror}">`;
+    }
+    return `<picture>
+                        <source type="image/webp" srcset="${variantSrcset(variants.webp)}" sizes="${PRODUCT_IMAGE_SIZES}">
+                        <img src="${variants.jpg[320]}" 
+                            srcset="${variantSrcset(variants.jpg)}" 
+                            sizes="${PRODUCT_IMAGE_SIZES}" 
+                            alt="${product.name}" 
+                            class="product-image" 
+                            loading="lazy" 
+                            onerror="${onerror}">
+                    </picture>`;
+}
+
+function renderProductCard(product) {
+    return `
+            <div class="product-card" id="product-card-${product.product_id}">
+                <div class="product-image-container">
+                    ${renderProductImage(product)}
                 </div>
                 <div class="product-info">
                     <h3>${product.name}</h3>
@@ -131,10 +250,70 @@ async function loadProducts() {
                     </div>
                 </div>
             </div>
-        `).join('');
-    } catch (error) {
-        showMessage('Failed to load products', 'error');
+        `;
+}
+
+// Live updates
+function connectEvents() {
+    if (eventSource) eventSource.close();
+    eventSource = new EventSource(`${API_BASE}/api/events?session_id=${sessionId}`);
+    eventSource.addEventListener('product', e => applyProductUpdate(JSON.parse(e.data)));
+    eventSource.addEventListener('order', e => applyOrderUpdate(JSON.parse(e.data)));
+    eventSource.addEventListener('stock_alert', e => showStockAlert(JSON.parse(e.data)));
+    // Too many updates were missed (or the connection dropped): reload what is on screen
+    eventSource.addEventListener('resync', refreshVisibleSection);
+    let opened = false;
+    eventSource.onopen = () => {
+        if (opened) refreshVisibleSection();
+        opened = true;
+    };
+}
+
+function isVisible(id) {
+    return !document.getElementById(id).classList.contains('hidden');
+}
+
+function refreshVisibleSection() {
+    products = null;
+    if (isVisible('products-section')) loadProducts();
+    if (isVisible('cart-section')) loadCart();
+}
+
+function applyProductUpdate(update) {
+    const result = searchResults && searchResults.find(p => p.product_id === update.product_id);
+    if (result) rerenderProductCard(Object.assign(result, update));
+    if (!products) return;
+    const index = products.findIndex(p => p.product_id === update.product_id);
+    if (index === -1 || !update.active) {
+        // New or hidden product: the delta does not carry every field, so refetch the list
+        products = null;
+        if (isVisible('products-section')) loadProducts();
+        return;
+    }
+    const product = Object.assign(products[index], update);
+    if (!searchResults) rerenderProductCard(product);
+    
+    const adminForm = document.getElementById(`admin-product-${product.product_id}`);
+    if (adminForm && !adminForm.contains(document.activeElement)) {
+        adminForm.querySelector('[name="stock"]').value = product.stock;
+        adminForm.querySelector('[name="price"]').value = product.price;
     }
+    
+    // Stock changes can make cart lines valid or invalid
+    if (isVisible('cart-section')) loadCart();
+}
+
+function applyOrderUpdate(update) {
+    const status = document.querySelector(`#order-${update.order_id} .order-status`);
+    if (status) status.textContent = update.status;
+    
+    const select = document.querySelector(`#admin-order-${update.order_id} select`);
+    if (select && select !== document.activeElement) select.value = update.status;
+}
+
+function showStockAlert(alert) {
+    const products = alert.products.map(product => `${product.name} (${product.stock} left)`);
+    showMessage(`Low stock: ${products.join(', ')}`, 'info');
 }
 
 // Cart
@@ -268,7 +447,15 @@ function updateCartCount(count) {
 }
 
 // Checkout
+function newCheckoutKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
 async function showCheckout() {
+    checkoutKey = newCheckoutKey();
     hideAll();
     document.getElementById('checkout-section').classList.remove('hidden');
     // Populate summary from current cart
@@ -334,11 +521,17 @@ async function handleCheckout(e) {
         const formData = new FormData();
         formData.append('payment_method', paymentMethod);
         formData.append('payment_details', paymentDetails);
+        if (!checkoutKey) {
+            checkoutKey = newCheckoutKey();
+        }
         
         const response = await fetch(`${API_BASE}/api/checkout?session_id=${sessionId}`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': checkoutKey },
             body: formData
         });
+        // The server answered, so a new attempt should be a new checkout
+        checkoutKey = newCheckoutKey();
         
         if (response.ok) {
             const data = await response.json();
@@ -542,17 +735,22 @@ async function showOrders() {
     await loadOrders();
 }
 
-async function loadOrders() {
+async function loadOrders(append = false) {
     try {
-        const response = await fetch(`${API_BASE}/api/orders?session_id=${sessionId}`);
-        const orders = await response.json();
+        const params = new URLSearchParams({session_id: sessionId});
+        if (append && ordersCursor) params.set('cursor', ordersCursor);
+        const response = await fetch(`${API_BASE}/api/orders?${params}`);
+        const data = await response.json();
+        const orders = data.orders;
+        ordersCursor = data.next_cursor;
+        document.getElementById('orders-more').classList.toggle('hidden', !ordersCursor);
         
         const ordersList = document.getElementById('orders-list');
-        if (orders.length === 0) {
+        if (!append && orders.length === 0) {
             ordersList.innerHTML = '<p>No orders yet</p>';
         } else {
-            ordersList.innerHTML = orders.map(order => `
-                <div class="order-card">
+            const ordersHtml = orders.map(order => `
+                <div class="order-card" id="order-${order.order_id}">
                     <h3>Order #${order.order_id}</h3>
                     <div class="order-info">
                         <div class="order-info-item">
@@ -561,7 +759,7 @@ async function loadOrders() {
                         </div>
                         <div class="order-info-item">
                             <label>Status:</label>
-                            <span>${order.status}</span>
+                            <span class="order-status">${order.status}</span>
                         </div>
                         <div class="order-info-item">
                             <label>Total:</label>
@@ -582,6 +780,11 @@ async function loadOrders() {
                     </div>
                 </div>
             `).join('');
+            if (append) {
+                ordersList.insertAdjacentHTML('beforeend', ordersHtml);
+            } else {
+                ordersList.innerHTML = ordersHtml;
+            }
         }
     } catch (error) {
         showMessage('Failed to load orders', 'error');
@@ -681,14 +884,13 @@ function setupPaymentValidation() {
 
 async function showAdminProducts() {
     try {
-        const response = await fetch(`${API_BASE}/api/products`);
-        const products = await response.json();
+        await getProducts();
         
         const content = document.getElementById('admin-content');
         content.innerHTML = `
             <h3>Manage Products</h3>
             ${products.map(product => `
-                <div class="admin-product-form">
+                <div class="admin-product-form" id="admin-product-${product.product_id}">
                     <h4>${product.name} (ID: ${product.product_id})</h4>
                     <form onsubmit="updateProduct(event, ${product.product_id})">
                         <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px;">
@@ -734,16 +936,49 @@ async function updateProduct(e, productId) {
     }
 }
 
-async function showAdminOrders() {
+function showAdminOrders() {
+    const content = document.getElementById('admin-content');
+    content.innerHTML = `
+        <h3>All Orders</h3>
+        <form id="admin-order-filters" onsubmit="event.preventDefault(); loadAdminOrders();"
+              style="display: flex; gap: 10px; flex-wrap: wrap; margin-bottom: 15px;">
+            <select name="status">
+                <option value="">All statuses</option>
+                <option value="Placed">Placed</option>
+                <option value="Processing">Processing</option>
+                <option value="Shipped">Shipped</option>
+                <option value="Delivered">Delivered</option>
+                <option value="Cancelled">Cancelled</option>
+            </select>
+            <input type="number" name="customer_id" placeholder="Customer ID" min="1">
+            <input type="date" name="date_from" title="From">
+            <input type="date" name="date_to" title="To">
+            <button type="submit" class="btn btn-primary">Filter</button>
+        </form>
+        <div id="admin-orders-list"></div>
+        <button id="admin-orders-more" onclick="loadAdminOrders(true)" class="btn btn-secondary hidden">Load More</button>
+    `;
+    loadAdminOrders();
+}
+
+async function loadAdminOrders(append = false) {
     try {
-        const response = await fetch(`${API_BASE}/api/orders?session_id=${sessionId}`);
-        const orders = await response.json();
+        const params = new URLSearchParams({session_id: sessionId});
+        const filters = new FormData(document.getElementById('admin-order-filters'));
+        for (const [key, value] of filters.entries()) {
+            if (value) params.set(key, value);
+        }
+        if (append && adminOrdersCursor) params.set('cursor', adminOrdersCursor);
         
-        const content = document.getElementById('admin-content');
-        content.innerHTML = `
-            <h3>All Orders</h3>
-            ${orders.length === 0 ? '<p>No orders yet</p>' : orders.map(order => `
-                <div class="order-card">
+        const response = await fetch(`${API_BASE}/api/orders?${params}`);
+        const data = await response.json();
+        const orders = data.orders;
+        adminOrdersCursor = data.next_cursor;
+        document.getElementById('admin-orders-more').classList.toggle('hidden', !adminOrdersCursor);
+        
+        const list = document.getElementById('admin-orders-list');
+        const ordersHtml = (!append && orders.length === 0) ? '<p>No orders found</p>' : orders.map(order => `
+                <div class="order-card" id="admin-order-${order.order_id}">
                     <h4>Order #${order.order_id} - Customer ID: ${order.customer_id}</h4>
                     <div class="order-info">
                         <div class="order-info-item">
@@ -775,8 +1010,12 @@ async function showAdminOrders() {
                     </div>
                     <button onclick="viewInvoice(${order.order_id})" class="btn btn-primary">View Invoice</button>
                 </div>
-            `).join('')}
-        `;
+            `).join('');
+        if (append) {
+            list.insertAdjacentHTML('beforeend', ordersHtml);
+        } else {
+            list.innerHTML = ordersHtml;
+        }
     } catch (error) {
         showMessage('Failed to load orders', 'error');
     }
@@ -0,0 +1,912 @@
+"""
+Storage module - pluggable persistence backends behind the Database singleton
+InMemoryStorage keeps everything in process dicts, SQLiteStorage persists to a file
+"""
+
+import json
+import sqlite3
+from bisect import bisect_left, bisect_right, insort
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from money import Money
+from product import Product
+from user import User, Customer, Admin
+from order import Order
+from order_item import LineItem
+from payment import Payment, create_payment_method
+from invoice import Invoice
+from receipt import Receipt
+
+# First value handed out for each kind of generated ID
+ID_START = {
+    "order": 1,
+    "payment": 1,
+    "invoice": 1000,
+    "receipt": 2000,
+}
+
+
+class InsufficientStockError(Exception):
+    """Raised when a reservation asks for more stock than a product has"""
+    
+    def __init__(self, product: Product, requested: int):
+        self.product = product
+        self.requested = requested
+        self.available = product.stock
+        if product.stock <= 0:
+            message = f"{product.name} is out of stock"
+        else:
+            message = f"{product.name} has exceeded limited stock (Instock: {product.stock})"
+        super().__init__(message)
+
+
+def check_quantities(quantities: Dict[int, int]):
+    """Reject zero or negative quantities, which would turn a reservation into a restock"""
+    for product_id, quantity in quantities.items():
+        if quantity <= 0:
+            raise ValueError(f"Quantity of product {product_id} must be positive, not {quantity}")
+
+
+class Storage(ABC):
+    """Abstract base class for storage backends (Strategy Pattern)"""
+    
+    @abstractmethod
+    def is_empty(self) -> bool:
+        """Return True if nothing has been stored yet"""
+        pass
+    
+    @abstractmethod
+    def next_id(self, kind: str) -> int:
+        """Allocate the next ID for orders, payments, invoices or receipts"""
+        pass
+    
+    @abstractmethod
+    def catalog_version(self) -> int:
+        """Return a number that changes whenever any product is added or modified"""
+        pass
+    
+    # Product operations
+    @abstractmethod
+    def get_product(self, product_id: int) -> Optional[Product]:
+        """Get product by ID"""
+        pass
+    
+    @abstractmethod
+    def get_all_products(self) -> List[Product]:
+        """Get all products"""
+        pass
+    
+    @abstractmethod
+    def add_product(self, product: Product):
+        """Add new product"""
+        pass
+    
+    @abstractmethod
+    def update_product(self, product: Product):
+        """Update existing product details; stock only changes through adjust, reserve and release"""
+        pass
+    
+    @abstractmethod
+    def adjust_stock(self, product: Product, quantity: int):
+        """Add quantity to the stored stock level in one step (negative to reduce)"""
+        pass
+    
+    @abstractmethod
+    def reserve_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        """Take stock for every product_id -> quantity, all or nothing
+        
+        Returns product_id -> stock left, read in the same step.
+        Raises InsufficientStockError (and takes nothing) if any product is short,
+        and ValueError if any quantity is not positive.
+        """
+        pass
+    
+    @abstractmethod
+    def release_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        """Give back stock taken by reserve_stock; returns product_id -> new stock level
+        
+        Raises ValueError if any quantity is not positive.
+        """
+        pass
+    
+    # User operations
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[User]:
+        """Get user by ID"""
+        pass
+    
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        """Get user by email"""
+        pass
+    
+    @abstractmethod
+    def add_user(self, user: User):
+        """Add new user"""
+        pass
+    
+    # Order operations
+    @abstractmethod
+    def get_order(self, order_id: int):
+        """Get order by ID"""
+        pass
+    
+    @abstractmethod
+    def get_orders_by_customer(self, customer_id: int) -> List:
+        """Get all orders for a customer"""
+        pass
+    
+    @abstractmethod
+    def get_all_orders(self) -> List:
+        """Get all orders"""
+        pass
+    
+    @abstractmethod
+    def query_orders(self, customer_id: int = None, status: str = None,
+                     date_from: datetime = None, date_to: datetime = None,
+                     before_id: int = None, limit: int = 50) -> List:
+        """Get up to limit matching orders, newest first, with order_id below before_id"""
+        pass
+    
+    @abstractmethod
+    def get_orders_after(self, after_id: int, limit: int) -> List:
+        """Get up to limit orders with order_id above after_id, oldest first (for exports)"""
+        pass
+    
+    @abstractmethod
+    def add_order(self, order):
+        """Add new order"""
+        pass
+    
+    @abstractmethod
+    def update_order(self, order):
+        """Save changes to an existing order"""
+        pass
+    
+    # Payment operations
+    @abstractmethod
+    def add_payment(self, payment):
+        """Add new payment"""
+        pass
+    
+    @abstractmethod
+    def get_payment(self, payment_id: int):
+        """Get payment by ID"""
+        pass
+    
+    @abstractmethod
+    def get_payment_by_order(self, order_id: int):
+        """Get payment for a specific order"""
+        pass
+    
+    @abstractmethod
+    def update_payment(self, payment):
+        """Save changes to an existing payment"""
+        pass
+    
+    @abstractmethod
+    def get_payments_after(self, after_id: int, limit: int) -> List:
+        """Get up to limit payments with payment_id above after_id, oldest first (for exports)"""
+        pass
+    
+    # Invoice operations
+    @abstractmethod
+    def add_invoice(self, invoice):
+        """Add new invoice"""
+        pass
+    
+    @abstractmethod
+    def get_invoice_by_order(self, order_id: int):
+        """Get invoice for a specific order"""
+        pass
+    
+    @abstractmethod
+    def get_all_invoices(self) -> List:
+        """Get all invoices"""
+        pass
+    
+    @abstractmethod
+    def update_invoice(self, invoice):
+        """Save changes to an existing invoice"""
+        pass
+    
+    @abstractmethod
+    def get_invoices_after(self, after_order_id: int, limit: int) -> List:
+        """Get up to limit invoices with order_id above after_order_id (for exports)"""
+        pass
+    
+    def save_batch(self, changes: Sequence[Tuple[str, object]]):
+        """Save several writes at once, each an (add_*/update_* method name, object) pair"""
+        for method, item in changes:
+            getattr(self, method)(item)
+    
+    def sync(self):
+        """Wait until every saved change is on disk (nothing to do if writes are durable when they return)"""
+        pass
+    
+    def close(self):
+        """Release any resources held by the backend"""
+        pass
+
+
+class InMemoryStorage(Storage):
+    """Keeps every object in process dicts (lost on restart)"""
+    
+    def __init__(self):
+        self.products: Dict[int, Product] = {}
+        self.users: Dict[int, User] = {}
+        self.orders: Dict = {}
+        self.payments: Dict = {}
+        self.invoices: Dict = {}
+        self.counters: Dict[str, int] = dict(ID_START)
+        self.catalog_changes = 0
+        
+        # One lock per product so checkouts of unrelated products never wait on each other
+        self.stock_locks: Dict[int, threading.Lock] = {}
+        self.stock_locks_guard = threading.Lock()
+        
+        # Secondary indexes kept in sync by the add_* methods
+        self.users_by_email: Dict[str, User] = {}
+        self.order_ids_by_customer: Dict[int, List[int]] = {}
+        self.payments_by_order: Dict = {}
+        
+        # Sorted indexes for paginated order listings
+        self.order_ids: List[int] = []
+        self.order_dates: List[datetime] = []  # order_dates[i] belongs to order_ids[i]
+        self.order_ids_by_status: Dict[str, List[int]] = {}
+        self.indexed_status: Dict[int, str] = {}
+        self.payment_ids: List[int] = []
+        self.invoice_order_ids: List[int] = []
+    
+    def is_empty(self) -> bool:
+        return not self.products and not self.users
+    
+    def next_id(self, kind: str) -> int:
+        value = self.counters[kind]
+        self.counters[kind] = value + 1
+        return value
+    
+    def catalog_version(self) -> int:
+        return self.catalog_changes
+    
+    # Product operations
+    def get_product(self, product_id: int) -> Optional[Product]:
+        return self.products.get(product_id)
+    
+    def get_all_products(self) -> List[Product]:
+        return list(self.products.values())
+    
+    def add_product(self, product: Product):
+        self.products[product.product_id] = product
+        self.catalog_changes += 1
+    
+    def update_product(self, product: Product):
+        if product.product_id not in self.products:
+            return
+        locks = self._lock_products([product.product_id])
+        try:
+            product.stock = self.products[product.product_id].stock  # Keep stock taken since it was read
+            self.products[product.product_id] = product
+            self.catalog_changes += 1
+        finally:
+            for lock in locks:
+                lock.release()
+    
+    def _lock_products(self, product_ids) -> List[threading.Lock]:
+        """Acquire the stock locks of several products in ID order (avoids deadlocks)"""
+        with self.stock_locks_guard:
+            locks = [self.stock_locks.setdefault(product_id, threading.Lock())
+                     for product_id in sorted(product_ids)]
+        for lock in locks:
+            lock.acquire()
+        return locks
+    
+    def adjust_stock(self, product: Product, quantity: int):
+        locks = self._lock_products([product.product_id])
+        try:
+            product.update_stock(quantity)
+            self.catalog_changes += 1
+        finally:
+            for lock in locks:
+                lock.release()
+    
+    def reserve_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        check_quantities(quantities)
+        locks = self._lock_products(quantities)
+        try:
+            for product_id, quantity in quantities.items():
+                product = self.products[product_id]
+                if quantity > product.stock:
+                    raise InsufficientStockError(product, quantity)
+            for product_id, quantity in quantities.items():
+                self.products[product_id].update_stock(-quantity)
+            self.catalog_changes += 1
+            return {product_id: self.products[product_id].stock for product_id in quantities}
+        finally:
+            for lock in locks:
+                lock.release()
+    
+    def release_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        check_quantities(quantities)
+        locks = self._lock_products(quantities)
+        try:
+            for product_id, quantity in quantities.items():
+                self.products[product_id].update_stock(quantity)
+            self.catalog_changes += 1
+            return {product_id: self.products[product_id].stock for product_id in quantities}
+        finally:
+            for lock in locks:
+                lock.release()
+    
+    # User operations
+    def get_user(self, user_id: int) -> Optional[User]:
+        return self.users.get(user_id)
+    
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        return self.users_by_email.get(email)
+    
+    def add_user(self, user: User):
+        previous = self.users.get(user.user_id)
+        if previous is not None:
+            self.users_by_email.pop(previous.email, None)
+        self.users[user.user_id] = user
+        self.users_by_email[user.email] = user
+    
+    # Order operations
+    def get_order(self, order_id: int):
+        return self.orders.get(order_id)
+    
+    def get_orders_by_customer(self, customer_id: int) -> List:
+        order_ids = self.order_ids_by_customer.get(customer_id, [])
+        return [self.orders[order_id] for order_id in order_ids]
+    
+    def get_all_orders(self) -> List:
+        return list(self.orders.values())
+    
+    def query_orders(self, customer_id: int = None, status: str = None,
+                     date_from: datetime = None, date_to: datetime = None,
+                     before_id: int = None, limit: int = 50) -> List:
+        # Walk the most selective sorted index backwards from the cursor
+        if customer_id is not None:
+            candidates = self.order_ids_by_customer.get(customer_id, [])
+        elif status is not None:
+            candidates = self.order_ids_by_status.get(status, [])
+        else:
+            candidates = self.order_ids
+        
+        start = 0
+        end = len(candidates)
+        if before_id is not None:
+            end = bisect_left(candidates, before_id)
+        # An order is dated when its ID is taken, not when it is saved, so a date range is also an ID range
+        if date_from is not None:
+            position = bisect_left(self.order_dates, date_from)
+            if position == len(self.order_ids):
+                return []
+            start = bisect_left(candidates, self.order_ids[position])
+        if date_to is not None:
+            position = bisect_right(self.order_dates, date_to)
+            if position == 0:
+                return []
+            end = min(end, bisect_right(candidates, self.order_ids[position - 1]))
+        
+        orders = []
+        for index in range(end - 1, start - 1, -1):
+            order = self.orders[candidates[index]]
+            if status is not None and order.status != status:
+                continue
+            orders.append(order)
+            if len(orders) == limit:
+                break
+        return orders
+    
+    def get_orders_after(self, after_id: int, limit: int) -> List:
+        start = bisect_right(self.order_ids, after_id)
+        return [self.orders[order_id] for order_id in self.order_ids[start:start + limit]]
+    
+    def _index_status(self, order):
+        """Move an order to the status index matching its current status"""
+        previous = self.indexed_status.get(order.order_id)
+        if previous == order.status:
+            return
+        if previous is not None:
+            ids = self.order_ids_by_status[previous]
+            del ids[bisect_left(ids, order.order_id)]
+        insort(self.order_ids_by_status.setdefault(order.status, []), order.order_id)
+        self.indexed_status[order.order_id] = order.status
+    
+    def add_order(self, order):
+        if order.order_id not in self.orders:
+            insort(self.order_ids_by_customer.setdefault(order.customer_id, []), order.order_id)
+            position = bisect_left(self.order_ids, order.order_id)
+            self.order_ids.insert(position, order.order_id)
+            self.order_dates.insert(position, order.order_date)
+        self.orders[order.order_id] = order
+        self._index_status(order)
+    
+    def update_order(self, order):
+        if order.order_id in self.orders:
+            self.orders[order.order_id] = order
+            self._index_status(order)
+    
+    # Payment operations
+    def add_payment(self, payment):
+        if payment.payment_id not in self.payments:
+            insort(self.payment_ids, payment.payment_id)
+        self.payments[payment.payment_id] = payment
+        self.payments_by_order[payment.order_id] = payment
+    
+    def get_payment(self, payment_id: int):
+        return self.payments.get(payment_id)
+    
+    def get_payment_by_order(self, order_id: int):
+        return self.payments_by_order.get(order_id)
+    
+    def update_payment(self, payment):
+        if payment.payment_id in self.payments:
+            self.add_payment(payment)
+    
+    def get_payments_after(self, after_id: int, limit: int) -> List:
+        start = bisect_right(self.payment_ids, after_id)
+        return [self.payments[payment_id] for payment_id in self.payment_ids[start:start + limit]]
+    
+    # Invoice operations
+    def add_invoice(self, invoice):
+        if invoice.order_id not in self.invoices:
+            insort(self.invoice_order_ids, invoice.order_id)
+        self.invoices[invoice.order_id] = invoice
+    
+    def get_invoice_by_order(self, order_id: int):
+        return self.invoices.get(order_id)
+    
+    def get_all_invoices(self) -> List:
+        return list(self.invoices.values())
+    
+    def update_invoice(self, invoice):
+        if invoice.order_id in self.invoices:
+            self.invoices[invoice.order_id] = invoice
+    
+    def get_invoices_after(self, after_order_id: int, limit: int) -> List:
+        start = bisect_right(self.invoice_order_ids, after_order_id)
+        return [self.invoices[order_id] for order_id in self.invoice_order_ids[start:start + limit]]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    product_id INTEGER PRIMARY KEY,
+    sku TEXT NOT NULL,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    description TEXT NOT NULL,
+    stock INTEGER NOT NULL,
+    active INTEGER NOT NULL,
+    image_url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_stock ON products (stock, product_id);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    name TEXT NOT NULL,
+    address TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id INTEGER PRIMARY KEY,
+    customer_id INTEGER NOT NULL,
+    order_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    items TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_id, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (order_date);
+CREATE TABLE IF NOT EXISTS payments (
+    payment_id INTEGER PRIMARY KEY,
+    order_id INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    method_type TEXT NOT NULL,
+    method_reference TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payment_date TEXT NOT NULL,
+    receipt TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_payments_order ON payments (order_id);
+CREATE TABLE IF NOT EXISTS invoices (
+    order_id INTEGER PRIMARY KEY,
+    invoice_number INTEGER NOT NULL,
+    customer_name TEXT NOT NULL,
+    items TEXT NOT NULL,
+    total_amount REAL NOT NULL,
+    issue_date TEXT NOT NULL,
+    due_date TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+"""
+
+# Statements are kept as constants so sqlite3's statement cache reuses the prepared versions
+SELECT_COUNTER = "SELECT value FROM counters WHERE name = ?"
+INSERT_COUNTER = "INSERT OR IGNORE INTO counters (name, value) VALUES (?, ?)"
+UPDATE_COUNTER = "UPDATE counters SET value = ? WHERE name = ?"
+BUMP_CATALOG = "UPDATE counters SET value = value + 1 WHERE name = 'catalog'"
+
+SELECT_PRODUCT = "SELECT * FROM products WHERE product_id = ?"
+SELECT_PRODUCTS = "SELECT * FROM products ORDER BY product_id"
+INSERT_PRODUCT = """INSERT OR REPLACE INTO products
+    (product_id, sku, name, price, description, stock, active, image_url)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+# Stock is left out: it only changes through the relative updates below, so no write can undo another's
+UPDATE_PRODUCT = """UPDATE products SET sku = ?, name = ?, price = ?, description = ?,
+    active = ?, image_url = ? WHERE product_id = ?"""
+ADJUST_STOCK = "UPDATE products SET stock = stock + ? WHERE product_id = ? AND stock + ? >= 0"
+RESERVE_STOCK = "UPDATE products SET stock = stock - ? WHERE product_id = ? AND stock >= ?"
+RELEASE_STOCK = "UPDATE products SET stock = stock + ? WHERE product_id = ?"
+SELECT_STOCK = "SELECT stock FROM products WHERE product_id = ?"
+
+SELECT_USER = "SELECT * FROM users WHERE user_id = ?"
+SELECT_USER_BY_EMAIL = "SELECT * FROM users WHERE email = ?"
+INSERT_USER = """INSERT OR REPLACE INTO users (user_id, email, password, role, name, address)
+    VALUES (?, ?, ?, ?, ?, ?)"""
+
+SELECT_ORDER = "SELECT * FROM orders WHERE order_id = ?"
+SELECT_ORDERS_BY_CUSTOMER = "SELECT * FROM orders WHERE customer_id = ? ORDER BY order_id"
+SELECT_ORDERS = "SELECT * FROM orders ORDER BY order_id"
+SELECT_ORDERS_AFTER = "SELECT * FROM orders WHERE order_id > ? ORDER BY order_id LIMIT ?"
+INSERT_ORDER = """INSERT OR REPLACE INTO orders (order_id, customer_id, order_date, status, items)
+    VALUES (?, ?, ?, ?, ?)"""
+UPDATE_ORDER = "UPDATE orders SET status = ?, items = ? WHERE order_id = ?"
+
+SELECT_PAYMENT = "SELECT * FROM payments WHERE payment_id = ?"
+SELECT_PAYMENT_BY_ORDER = "SELECT * FROM payments WHERE order_id = ? ORDER BY payment_id DESC LIMIT 1"
+SELECT_PAYMENTS_AFTER = "SELECT * FROM payments WHERE payment_id > ? ORDER BY payment_id LIMIT ?"
+INSERT_PAYMENT = """INSERT OR REPLACE INTO payments
+    (payment_id, order_id, amount, method_type, method_reference, status, payment_date, receipt)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+SELECT_INVOICE = "SELECT * FROM invoices WHERE order_id = ?"
+SELECT_INVOICES = "SELECT * FROM invoices ORDER BY order_id"
+SELECT_INVOICES_AFTER = "SELECT * FROM invoices WHERE order_id > ? ORDER BY order_id LIMIT ?"
+INSERT_INVOICE = """INSERT OR REPLACE INTO invoices
+    (order_id, invoice_number, customer_name, items, total_amount, issue_date, due_date, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+class SQLiteStorage(Storage):
+    """Persists every object to a SQLite database file (WAL mode)"""
+    
+    def __init__(self, path: str = "store.db"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                                    timeout=30, cached_statements=256)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        for kind, start in ID_START.items():
+            self._conn.execute(INSERT_COUNTER, (kind, start))
+        self._conn.execute(INSERT_COUNTER, ("catalog", 0))
+        
+        # Identity map so carts and order items share one Product object per ID
+        self._products: Dict[int, Product] = {}
+    
+    def _write(self, statement: str, params: tuple):
+        """Run a single write statement in its own transaction"""
+        with self._lock:
+            self._conn.execute(statement, params)
+    
+    @contextmanager
+    def _transaction(self):
+        """Run a group of statements as one transaction holding the database write lock"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+    
+    def _write_product(self, statement: str, params: tuple):
+        """Run a product write and bump the catalog version in the same transaction"""
+        with self._transaction() as conn:
+            conn.execute(statement, params)
+            conn.execute(BUMP_CATALOG)
+    
+    def is_empty(self) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM products) + (SELECT COUNT(*) FROM users)").fetchone()
+        return row[0] == 0
+    
+    def next_id(self, kind: str) -> int:
+        with self._transaction() as conn:
+            value = conn.execute(SELECT_COUNTER, (kind,)).fetchone()[0]
+            conn.execute(UPDATE_COUNTER, (value + 1, kind))
+        return value
+    
+    def catalog_version(self) -> int:
+        with self._lock:
+            return self._conn.execute(SELECT_COUNTER, ("catalog",)).fetchone()[0]
+    
+    # Product operations
+    def _product_from_row(self, row) -> Product:
+        """Return the cached Product for a row, refreshed with the stored values"""
+        product = self._products.get(row["product_id"])
+        if product is None:
+            product = Product(row["product_id"], row["sku"], row["name"], row["price"])
+            self._products[product.product_id] = product
+        product.sku = row["sku"]
+        product.name = row["name"]
+        product.price = Money.of(row["price"])
+        product.description = row["description"]
+        product.stock = row["stock"]
+        product.active = bool(row["active"])
+        product.image_url = row["image_url"]
+        return product
+    
+    def get_product(self, product_id: int) -> Optional[Product]:
+        with self._lock:
+            row = self._conn.execute(SELECT_PRODUCT, (product_id,)).fetchone()
+        return self._product_from_row(row) if row else None
+    
+    def get_all_products(self) -> List[Product]:
+        with self._lock:
+            rows = self._conn.execute(SELECT_PRODUCTS).fetchall()
+        return [self._product_from_row(row) for row in rows]
+    
+    def add_product(self, product: Product):
+        self._write_product(INSERT_PRODUCT, (product.product_id, product.sku, product.name,
+                                    float(product.price), product.description, product.stock,
+                                    int(product.active), product.image_url))
+        self._products[product.product_id] = product
+    
+    def update_product(self, product: Product):
+        self._write_product(UPDATE_PRODUCT, (product.sku, product.name, float(product.price),
+                                    product.description, int(product.active),
+                                    product.image_url, product.product_id))
+    
+    def adjust_stock(self, product: Product, quantity: int):
+        # Relative update so concurrent workers never overwrite each other's changes
+        self._write_product(ADJUST_STOCK, (quantity, product.product_id, quantity))
+        self.get_product(product.product_id)
+    
+    def reserve_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        check_quantities(quantities)
+        # BEGIN IMMEDIATE takes the write lock, so no other worker can interleave
+        with self._transaction() as conn:
+            for product_id, quantity in quantities.items():
+                cursor = conn.execute(RESERVE_STOCK, (quantity, product_id, quantity))
+                if cursor.rowcount == 0:
+                    product = self.get_product(product_id)
+                    raise InsufficientStockError(product, quantity)
+            levels = {product_id: conn.execute(SELECT_STOCK, (product_id,)).fetchone()[0]
+                      for product_id in quantities}
+            conn.execute(BUMP_CATALOG)
+        for product_id in quantities:
+            self.get_product(product_id)
+        return levels
+    
+    def release_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        check_quantities(quantities)
+        with self._transaction() as conn:
+            for product_id, quantity in quantities.items():
+                conn.execute(RELEASE_STOCK, (quantity, product_id))
+            levels = {product_id: conn.execute(SELECT_STOCK, (product_id,)).fetchone()[0]
+                      for product_id in quantities}
+            conn.execute(BUMP_CATALOG)
+        for product_id in quantities:
+            self.get_product(product_id)
+        return levels
+    
+    # User operations
+    def _user_from_row(self, row) -> User:
+        if row["role"] == "admin":
+            return Admin(row["user_id"], row["email"], row["password"])
+        return Customer(row["user_id"], row["email"], row["password"], row["name"], row["address"])
+    
+    def get_user(self, user_id: int) -> Optional[User]:
+        with self._lock:
+            row = self._conn.execute(SELECT_USER, (user_id,)).fetchone()
+        return self._user_from_row(row) if row else None
+    
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        with self._lock:
+            row = self._conn.execute(SELECT_USER_BY_EMAIL, (email,)).fetchone()
+        return self._user_from_row(row) if row else None
+    
+    def add_user(self, user: User):
+        self._write(INSERT_USER, (user.user_id, user.email, user.password, user.role,
+                                 getattr(user, "name", ""), getattr(user, "address", "")))
+    
+    # Order operations
+    def _order_from_row(self, row) -> Order:
+        items = []
+        for line in json.loads(row["items"]):
+            product = self._products.get(line["product_id"]) or self.get_product(line["product_id"])
+            items.append(LineItem.of(product, line["quantity"], Money.of(line["unit_price"])))
+        order = Order(row["customer_id"], items, order_id=row["order_id"])
+        order.order_date = datetime.fromisoformat(row["order_date"])
+        order.status = row["status"]
+        return order
+    
+    def _order_items_json(self, order) -> str:
+        return json.dumps([{"product_id": item.product_id,
+                            "quantity": item.quantity,
+                            "unit_price": float(item.unit_price)} for item in order.items])
+    
+    def get_order(self, order_id: int):
+        with self._lock:
+            row = self._conn.execute(SELECT_ORDER, (order_id,)).fetchone()
+        return self._order_from_row(row) if row else None
+    
+    def get_orders_by_customer(self, customer_id: int) -> List:
+        with self._lock:
+            rows = self._conn.execute(SELECT_ORDERS_BY_CUSTOMER, (customer_id,)).fetchall()
+        return [self._order_from_row(row) for row in rows]
+    
+    def get_all_orders(self) -> List:
+        with self._lock:
+            rows = self._conn.execute(SELECT_ORDERS).fetchall()
+        return [self._order_from_row(row) for row in rows]
+    
+    def query_orders(self, customer_id: int = None, status: str = None,
+                     date_from: datetime = None, date_to: datetime = None,
+                     before_id: int = None, limit: int = 50) -> List:
+        conditions = []
+        params = []
+        if customer_id is not None:
+            conditions.append("customer_id = ?")
+            params.append(customer_id)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if date_from is not None:
+            conditions.append("order_date >= ?")
+            params.append(date_from.isoformat())
+        if date_to is not None:
+            conditions.append("order_date <= ?")
+            params.append(date_to.isoformat())
+        if before_id is not None:
+            conditions.append("order_id < ?")
+            params.append(before_id)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM orders{where} ORDER BY order_id DESC LIMIT ?", params).fetchall()
+        return [self._order_from_row(row) for row in rows]
+    
+    def get_orders_after(self, after_id: int, limit: int) -> List:
+        with self._lock:
+            rows = self._conn.execute(SELECT_ORDERS_AFTER, (after_id, limit)).fetchall()
+        return [self._order_from_row(row) for row in rows]
+    
+    def _insert_order(self, order) -> tuple:
+        return INSERT_ORDER, (order.order_id, order.customer_id, order.order_date.isoformat(),
+                              order.status, self._order_items_json(order))
+    
+    def _update_order(self, order) -> tuple:
+        return UPDATE_ORDER, (order.status, self._order_items_json(order), order.order_id)
+    
+    def add_order(self, order):
+        self._write(*self._insert_order(order))
+    
+    def update_order(self, order):
+        self._write(*self._update_order(order))
+    
+    # Payment operations
+    def _payment_from_row(self, row) -> Payment:
+        method = create_payment_method(row["method_type"], row["method_reference"])
+        payment = Payment(row["order_id"], row["amount"], method, payment_id=row["payment_id"])
+        payment.status = row["status"]
+        payment.payment_date = datetime.fromisoformat(row["payment_date"])
+        if row["receipt"]:
+            data = json.loads(row["receipt"])
+            payment.receipt = Receipt(payment.payment_id, payment.order_id, data["customer_name"],
+                                      payment.amount, method.get_method_name(),
+                                      [LineItem.from_details(item) for item in data["items"]],
+                                      receipt_number=data["receipt_number"])
+            payment.receipt.issue_date = datetime.fromisoformat(data["issue_date"])
+            payment.receipt.printed = data["printed"]
+        return payment
+    
+    def get_payment(self, payment_id: int):
+        with self._lock:
+            row = self._conn.execute(SELECT_PAYMENT, (payment_id,)).fetchone()
+        return self._payment_from_row(row) if row else None
+    
+    def get_payment_by_order(self, order_id: int):
+        with self._lock:
+            row = self._conn.execute(SELECT_PAYMENT_BY_ORDER, (order_id,)).fetchone()
+        return self._payment_from_row(row) if row else None
+    
+    def _insert_payment(self, payment) -> tuple:
+        receipt = None
+        if payment.receipt:
+            receipt = json.dumps({"receipt_number": payment.receipt.receipt_number,
+                                  "customer_name": payment.receipt.customer_name,
+                                  "items": [item.get_details() for item in payment.receipt.items],
+                                  "issue_date": payment.receipt.issue_date.isoformat(),
+                                  "printed": payment.receipt.printed})
+        return INSERT_PAYMENT, (payment.payment_id, payment.order_id, float(payment.amount),
+                                payment.payment_method.method_type,
+                                payment.payment_method.get_reference(), payment.status,
+                                payment.payment_date.isoformat(), receipt)
+    
+    def add_payment(self, payment):
+        self._write(*self._insert_payment(payment))
+    
+    def update_payment(self, payment):
+        self.add_payment(payment)
+    
+    def get_payments_after(self, after_id: int, limit: int) -> List:
+        with self._lock:
+            rows = self._conn.execute(SELECT_PAYMENTS_AFTER, (after_id, limit)).fetchall()
+        return [self._payment_from_row(row) for row in rows]
+    
+    # Invoice operations
+    def _invoice_from_row(self, row) -> Invoice:
+        items = [LineItem.from_details(item) for item in json.loads(row["items"])]
+        invoice = Invoice(row["order_id"], row["customer_name"], items,
+                          row["total_amount"], invoice_number=row["invoice_number"])
+        invoice.issue_date = datetime.fromisoformat(row["issue_date"])
+        invoice.due_date = datetime.fromisoformat(row["due_date"])
+        invoice.status = row["status"]
+        return invoice
+    
+    def _insert_invoice(self, invoice) -> tuple:
+        return INSERT_INVOICE, (invoice.order_id, invoice.invoice_number, invoice.customer_name,
+                                json.dumps([item.get_details() for item in invoice.items]),
+                                float(invoice.total_amount),
+                                invoice.issue_date.isoformat(), invoice.due_date.isoformat(),
+                                invoice.status)
+    
+    def add_invoice(self, invoice):
+        self._write(*self._insert_invoice(invoice))
+    
+    def get_invoice_by_order(self, order_id: int):
+        with self._lock:
+            row = self._conn.execute(SELECT_INVOICE, (order_id,)).fetchone()
+        return self._invoice_from_row(row) if row else None
+    
+    def get_all_invoices(self) -> List:
+        with self._lock:
+            rows = self._conn.execute(SELECT_INVOICES).fetchall()
+        return [self._invoice_from_row(row) for row in rows]
+    
+    def update_invoice(self, invoice):
+        self.add_invoice(invoice)
+    
+    def get_invoices_after(self, after_order_id: int, limit: int) -> List:
+        with self._lock:
+            rows = self._conn.execute(SELECT_INVOICES_AFTER, (after_order_id, limit)).fetchall()
+        return [self._invoice_from_row(row) for row in rows]
+    
+    def save_batch(self, changes: Sequence[Tuple[str, object]]):
+        writers = {"add_order": self._insert_order, "update_order": self._update_order,
+                   "add_payment": self._insert_payment, "update_payment": self._insert_payment,
+                   "add_invoice": self._insert_invoice, "update_invoice": self._insert_invoice}
+        statements = [writers[method](item) for method, item in changes]
+        with self._lock:
+            # Callers are told the batch is durable, so its commit waits for the fsync that
+            # synchronous=NORMAL skips; one fsync covers every write in the batch
+            self._conn.execute("PRAGMA synchronous=FULL")
+            try:
+                with self._transaction() as conn:
+                    for statement, params in statements:
+                        conn.execute(statement, params)
+            finally:
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()